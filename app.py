@@ -1,8 +1,11 @@
 from app import create_app
+from init_db import init_db
 
 app = create_app()
 
 if __name__ == '__main__':
+    # Em desenvolvimento migra aqui mesmo; em produção é o `flask db upgrade` do entrypoint.sh
+    init_db()
     # Iniciar o servidor Flask sem SSL
     app.run(
         host='0.0.0.0',
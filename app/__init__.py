@@ -1,8 +1,10 @@
 import os
-from flask import Flask
+from flask import Flask, request
 from dotenv import load_dotenv
-from init_db import init_db
-from app.database import get_db_connection
+from init_db import SCHEMA_VERSION
+from app.database import conferir_esquema, init_app as init_db_pool
+from app.fotos import urls_foto
+from app import assets, comandos
 from app.routes.dashboard import dashboard_bp
 from app.routes.receitas import receitas_bp
 from app.routes.despesas import despesas_bp
@@ -85,17 +87,29 @@ def create_app():
     
     app.jinja_env.filters['slugify'] = slugify
     
-    # Inicializar banco de dados
-    with app.app_context():
-        init_db()
-        # Testar conexão com o banco de dados
-        try:
-            conn = get_db_connection()
-            conn.execute('SELECT 1')
-            app.logger.info('Conexão com o banco de dados estabelecida com sucesso')
-        except Exception as e:
-            app.logger.error(f'Erro ao conectar ao banco de dados: {e}')
-            raise
+    # Foto de perfil no tamanho pedido (JPEG e, se houver, WebP)
+    app.jinja_env.globals['foto_perfil'] = urls_foto
+    
+    # Estáticos com hash no nome (app/static/dist), quando o build os gerou
+    assets.init_app(app)
+    
+    # Pool de conexões: devolve a conexão da requisição no teardown
+    init_db_pool(app)
+    
+    # Esquema: migrado por `flask db upgrade` (entrypoint.sh), não aqui. Nada
+    # abre conexão em create_app, então o gunicorn pode usar --preload; cada
+    # worker só confere a versão na primeira requisição.
+    comandos.init_app(app)
+
+    @app.before_request
+    def verificar_esquema():
+        if request.endpoint == 'static':
+            return None
+        versao = conferir_esquema()
+        if versao < SCHEMA_VERSION:
+            app.logger.error(f'Banco na versão {versao}, código na {SCHEMA_VERSION}: rode `flask db upgrade`')
+            return 'Banco de dados desatualizado, tente novamente em instantes.', 503
+        return None
     
     # Registrar blueprints
     app.register_blueprint(auth_bp, url_prefix='/auth')
@@ -0,0 +1,199 @@
+"""Arquivos estáticos com hash do conteúdo no nome.
+
+`python build_assets.py` (no build, depois do `npm run build`) copia os arquivos
+de app/static para app/static/dist com o hash do conteúdo no nome, reescreve
+as referências url(...) dos CSS para os nomes novos, minifica o JS que não vem
+minificado (rjsmin, se instalado) e grava versões .gz e .br (Brotli, se
+instalado) ao lado dos arquivos de texto. O manifest.json gerado é lido na
+inicialização: url_for('static', ...) passa a apontar para o nome com hash,
+servido com Cache-Control immutable e na versão pré-comprimida que o navegador
+aceitar.
+Sem manifest (desenvolvimento) tudo funciona como antes, sem hash.
+
+Bibliotecas de terceiros ficam em app/static/vendor (nada de CDN em tempo de
+execução); `python build_assets.py --vendor` baixa de novo as versões de VENDOR.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import urllib.request
+
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+PASTA_STATIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+PASTA_DIST = 'dist'
+MANIFEST = os.path.join(PASTA_DIST, 'manifest.json')
+
+# Conteúdo enviado pelos usuários muda sem novo build, e input.css é só a fonte do Tailwind
+IGNORADOS = (PASTA_DIST + '/', 'img/profile_users/', 'css/input.css')
+EXTENSOES_TEXTO = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+COMPRIMIR_A_PARTIR_DE = 1024
+CACHE_IMUTAVEL = 365 * 24 * 3600
+
+FONT_AWESOME = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0'
+CROPPERJS = 'https://cdnjs.cloudflare.com/ajax/libs/cropperjs/1.6.1'
+VENDOR = {
+    'vendor/fontawesome/css/all.min.css': f'{FONT_AWESOME}/css/all.min.css',
+    'vendor/fontawesome/webfonts/fa-brands-400.woff2': f'{FONT_AWESOME}/webfonts/fa-brands-400.woff2',
+    'vendor/fontawesome/webfonts/fa-regular-400.woff2': f'{FONT_AWESOME}/webfonts/fa-regular-400.woff2',
+    'vendor/fontawesome/webfonts/fa-solid-900.woff2': f'{FONT_AWESOME}/webfonts/fa-solid-900.woff2',
+    'vendor/fontawesome/webfonts/fa-v4compatibility.woff2': f'{FONT_AWESOME}/webfonts/fa-v4compatibility.woff2',
+    'vendor/cropperjs/cropper.css': f'{CROPPERJS}/cropper.css',
+    'vendor/cropperjs/cropper.js': f'{CROPPERJS}/cropper.js',
+}
+
+URL_CSS = re.compile(r'''url\((['"]?)([^'")]+)\1\)''')
+
+mimetypes.add_type('font/woff2', '.woff2')
+
+
+def _nome_com_hash(caminho, conteudo):
+    raiz, extensao = os.path.splitext(caminho)
+    return f'{raiz}.{hashlib.sha256(conteudo).hexdigest()[:12]}{extensao}'
+
+
+def _reescrever_css(caminho, conteudo, arquivos):
+    """Troca as url(...) relativas do CSS pelos nomes com hash já gerados"""
+    pasta = os.path.dirname(caminho)
+
+    def trocar(match):
+        aspas, url = match.groups()
+        alvo, sufixo = re.match(r'([^?#]*)(.*)', url).groups()
+        if not alvo or alvo.startswith(('data:', 'http:', 'https:', '//', '/')):
+            return match.group(0)
+        referido = os.path.normpath(os.path.join(pasta, alvo)).replace(os.sep, '/')
+        if referido not in arquivos:
+            return match.group(0)
+        novo = os.path.relpath(arquivos[referido], pasta or '.').replace(os.sep, '/')
+        return f'url({aspas}{novo}{sufixo}{aspas})'
+
+    return URL_CSS.sub(trocar, conteudo.decode('utf-8')).encode('utf-8')
+
+
+def _gravar(destino, conteudo):
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    with open(destino, 'wb') as arquivo:
+        arquivo.write(conteudo)
+    if not destino.endswith(EXTENSOES_TEXTO) or len(conteudo) < COMPRIMIR_A_PARTIR_DE:
+        return []
+    variantes = ['gz']
+    with open(destino + '.gz', 'wb') as arquivo:
+        arquivo.write(gzip.compress(conteudo, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(destino + '.br', 'wb') as arquivo:
+            arquivo.write(brotli.compress(conteudo, quality=11))
+        variantes.append('br')
+    return variantes
+
+
+def construir(pasta_static=PASTA_STATIC):
+    """Gera app/static/dist e o manifest; retorna o manifest.
+
+    O manifest mapeia cada caminho original para o nome com hash e lista as
+    versões comprimidas disponíveis de cada arquivo.
+    """
+    shutil.rmtree(os.path.join(pasta_static, PASTA_DIST), ignore_errors=True)
+
+    originais = []
+    for raiz, _, nomes in os.walk(pasta_static):
+        for nome in nomes:
+            caminho = os.path.relpath(os.path.join(raiz, nome), pasta_static).replace(os.sep, '/')
+            if not nome.startswith('.') and not caminho.startswith(IGNORADOS):
+                originais.append(caminho)
+
+    # CSS por último: suas url(...) precisam dos nomes com hash das fontes e imagens
+    arquivos, comprimidos = {}, {}
+    for caminho in sorted(originais, key=lambda c: (c.endswith('.css'), c)):
+        with open(os.path.join(pasta_static, caminho), 'rb') as arquivo:
+            conteudo = arquivo.read()
+        if caminho.endswith('.css'):
+            conteudo = _reescrever_css(caminho, conteudo, arquivos)
+        elif caminho.endswith('.js') and not caminho.endswith('.min.js') and rjsmin is not None:
+            conteudo = rjsmin.jsmin(conteudo.decode('utf-8')).encode('utf-8')
+        arquivos[caminho] = _nome_com_hash(caminho, conteudo)
+        variantes = _gravar(os.path.join(pasta_static, PASTA_DIST, arquivos[caminho]), conteudo)
+        if variantes:
+            comprimidos[arquivos[caminho]] = variantes
+
+    manifest = {'arquivos': arquivos, 'comprimidos': comprimidos}
+    with open(os.path.join(pasta_static, MANIFEST), 'w') as arquivo:
+        json.dump(manifest, arquivo, indent=1, sort_keys=True)
+    return manifest
+
+
+def baixar_vendor(pasta_static=PASTA_STATIC):
+    """Baixa as bibliotecas de VENDOR para app/static/vendor"""
+    for caminho, url in VENDOR.items():
+        with urllib.request.urlopen(url, timeout=30) as resposta:
+            conteudo = resposta.read()
+        destino = os.path.join(pasta_static, caminho)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with open(destino, 'wb') as arquivo:
+            arquivo.write(conteudo)
+        print(f'{caminho}: {len(conteudo)} bytes')
+
+
+def versao():
+    """Identifica o build dos estáticos ('' sem manifest), para ETags de páginas que os referenciam"""
+    return current_app.extensions.get('assets', {}).get('versao', '')
+
+
+def servir_estatico(filename):
+    """View 'static': arquivos de dist/ são imutáveis e vão pré-comprimidos quando possível"""
+    if not filename.startswith(PASTA_DIST + '/'):
+        return current_app.send_static_file(filename)
+
+    comprimidos = current_app.extensions['assets']['manifest']['comprimidos']
+    nome = filename[len(PASTA_DIST) + 1:]
+    response = None
+    for codificacao, extensao in (('br', 'br'), ('gzip', 'gz')):
+        if extensao in comprimidos.get(nome, ()) and request.accept_encodings[codificacao]:
+            response = send_from_directory(
+                current_app.static_folder, f'{filename}.{extensao}',
+                mimetype=mimetypes.guess_type(filename)[0], max_age=CACHE_IMUTAVEL
+            )
+            response.headers['Content-Encoding'] = codificacao
+            break
+    if response is None:
+        response = send_from_directory(current_app.static_folder, filename, max_age=CACHE_IMUTAVEL)
+    if nome in comprimidos:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    """Usa o manifest de app/static/dist, se existir, para os URLs e a view 'static'"""
+    try:
+        with open(os.path.join(app.static_folder, MANIFEST)) as arquivo:
+            manifest = json.load(arquivo)
+    except FileNotFoundError:
+        app.logger.info('[Estáticos] Sem manifest; rode `python build_assets.py` no build')
+        return
+    arquivos = manifest['arquivos']
+    app.extensions['assets'] = {
+        'manifest': manifest,
+        'versao': hashlib.sha256(json.dumps(arquivos, sort_keys=True).encode()).hexdigest()[:12],
+    }
+
+    @app.url_defaults
+    def _url_com_hash(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in arquivos:
+            values['filename'] = f"{PASTA_DIST}/{arquivos[values['filename']]}"
+
+    app.view_functions['static'] = servir_estatico
+
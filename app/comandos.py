@@ -0,0 +1,42 @@
+"""Comandos do Flask CLI: `flask db upgrade` e `flask db version`.
+
+O esquema é migrado uma vez por deploy, pelo entrypoint.sh, antes de subir
+o gunicorn; os workers só conferem a versão (app.database.conferir_esquema).
+"""
+import sqlite3
+import sys
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from init_db import SCHEMA_VERSION, get_schema_version, init_db
+
+db_cli = AppGroup('db', help='Esquema do banco de dados.')
+
+
+@db_cli.command('upgrade')
+def upgrade():
+    """Aplica as migrações pendentes e os dados iniciais"""
+    aplicadas = init_db()
+    if aplicadas:
+        click.echo(f"Migrações aplicadas: {', '.join(map(str, aplicadas))}")
+    click.echo(f'Esquema na versão {SCHEMA_VERSION}')
+
+
+@db_cli.command('version')
+def version():
+    """Mostra a versão do esquema; sai com 1 se houver migrações pendentes"""
+    conn = sqlite3.connect(current_app.config['DATABASE'])
+    try:
+        versao = get_schema_version(conn)
+    finally:
+        conn.close()
+    click.echo(f'Banco: {versao} / código: {SCHEMA_VERSION}')
+    if versao < SCHEMA_VERSION:
+        click.echo('Migrações pendentes: rode `flask db upgrade`', err=True)
+        sys.exit(1)
+
+
+def init_app(app):
+    app.cli.add_command(db_cli)
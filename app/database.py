@@ -1,6 +1,16 @@
 import sqlite3
 import os
-from datetime import datetime
+import functools
+import calendar
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, date, timedelta
+from flask import g, has_app_context
+
+from init_db import SCHEMA_VERSION, get_schema_version
 
 # Define o caminho do banco de dados
 # Usa DB_PATH se existir, senão usa 'financas.db' no diretório atual
@@ -11,40 +21,618 @@ db_dir = os.path.dirname(os.path.abspath(DATABASE))
 if db_dir and not os.path.exists(db_dir):
     os.makedirs(db_dir, exist_ok=True)
 
-def get_db_connection():
-    """Conecta ao banco de dados SQLite"""
-    conn = sqlite3.connect(DATABASE)
+# Parâmetros do pool e PRAGMAs aplicados a cada conexão nova
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 4))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 16384))
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 64 * 1024 * 1024))
+
+
+class PooledConnection(sqlite3.Connection):
+    """Conexão SQLite cujo close() é ignorado enquanto pertence ao pool.
+
+    As rotas continuam chamando conn.close() como sempre; a conexão só volta
+    ao pool no teardown da requisição.
+    """
+
+    pooled = False
+
+    def close(self):
+        if not self.pooled:
+            super().close()
+
+
+def _abrir_conexao():
+    """Abre uma conexão nova já configurada (WAL, busy_timeout, cache, mmap)"""
+    conn = sqlite3.connect(
+        DATABASE,
+        factory=PooledConnection,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store=MEMORY')
     return conn
 
+
+class PoolEsgotado(sqlite3.OperationalError):
+    """Nenhuma conexão do pool foi devolvida dentro de DB_POOL_TIMEOUT"""
+
+
+class ConnectionPool:
+    """Pool limitado de conexões SQLite compartilhado pelas threads do worker"""
+
+    def __init__(self, max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.timeouts = 0
+
+    def acquire(self):
+        """Retorna uma conexão ociosa, abre uma nova ou espera uma ser devolvida.
+
+        Levanta PoolEsgotado se nenhuma voltar ao pool em `timeout` segundos.
+        """
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self.hits += 1
+        except queue.Empty:
+            with self._lock:
+                pode_abrir = self._open < self.max_size
+                if pode_abrir:
+                    self._open += 1
+                    self.misses += 1
+                else:
+                    self.waits += 1
+            if pode_abrir:
+                try:
+                    conn = _abrir_conexao()
+                except Exception:
+                    with self._lock:
+                        self._open -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self.timeouts += 1
+                    raise PoolEsgotado('pool de conexões esgotado') from None
+        conn.pooled = True
+        return conn
+
+    def release(self, conn):
+        """Devolve a conexão ao pool, desfazendo transações não confirmadas"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self.discard(conn)
+            return
+        self._idle.put(conn)
+
+    def discard(self, conn):
+        """Fecha de vez uma conexão com problema e libera sua vaga"""
+        conn.pooled = False
+        try:
+            conn.close()
+        finally:
+            with self._lock:
+                self._open -= 1
+
+    def apos_fork(self):
+        """No processo filho: esquece as conexões herdadas do pai.
+
+        Conexões SQLite não podem atravessar um fork. As herdadas ficam
+        referenciadas de propósito, sem close(): fechá-las no filho poderia
+        soltar locks ou fazer checkpoint do WAL que o pai ainda usa.
+        """
+        herdadas = []
+        while True:
+            try:
+                herdadas.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        self._herdadas = herdadas
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+
+    def stats(self):
+        """Métricas do pool: acertos, esperas, esperas esgotadas e conexões abertas/ociosas"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'open': self._open,
+                'idle': self._idle.qsize(),
+                'max_size': self.max_size,
+            }
+
+
+pool = ConnectionPool()
+# gunicorn --preload: cada worker começa com o pool vazio
+os.register_at_fork(after_in_child=pool.apos_fork)
+
+
+def get_db_connection():
+    """Conecta ao banco de dados SQLite.
+
+    Dentro de uma requisição a mesma conexão do pool é reutilizada (guardada em
+    `g`); fora do contexto da aplicação (scripts) abre uma conexão avulsa.
+    """
+    if not has_app_context():
+        return _abrir_conexao()
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+
+def close_db(exception=None):
+    """Teardown: devolve ao pool a conexão usada na requisição"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.release(conn)
+
+
+def get_pool_stats():
+    """Retorna as métricas do pool de conexões"""
+    return pool.stats()
+
+
+_esquema_conferido = False
+
+
+def conferir_esquema():
+    """Confere se o banco já está na versão de esquema do código.
+
+    As migrações rodam só no `flask db upgrade` (entrypoint.sh); cada worker
+    apenas lê a versão, na primeira requisição, e guarda o resultado. Enquanto
+    o banco estiver atrasado a leitura se repete, então os workers voltam a
+    atender sozinhos depois do upgrade. Retorna a versão encontrada no banco.
+    """
+    global _esquema_conferido
+    if _esquema_conferido:
+        return SCHEMA_VERSION
+    versao = get_schema_version(get_db_connection())
+    _esquema_conferido = versao >= SCHEMA_VERSION
+    return versao
+
+
+# Caches por usuário: Redis quando a aplicação já usa Redis para sessões,
+# senão um LRU em memória por processo.
+CADASTROS_CACHE_TTL = int(os.environ.get('CADASTROS_CACHE_TTL', 3600))
+CADASTROS_CACHE_TAMANHO = int(os.environ.get('CADASTROS_CACHE_TAMANHO', 2048))
+DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', 3600))
+DASHBOARD_CACHE_TAMANHO = int(os.environ.get('DASHBOARD_CACHE_TAMANHO', 256))
+
+
+class CacheUsuario:
+    """Cache read-through de dados de um usuário.
+
+    As chaves incluem a geração do usuário (geracao_usuario), incrementada por
+    triggers a cada escrita nos dados de origem: uma escrita invalida o cache
+    do usuário em todos os workers sem apagar nada (as chaves antigas expiram
+    pelo TTL ou saem do LRU). Falhas do Redis não derrubam a página: quem
+    chama recalcula a partir do banco.
+    """
+
+    def __init__(self, prefixo, tamanho, ttl, serializar=json.dumps, desserializar=json.loads):
+        self.prefixo = prefixo
+        self.redis = None
+        self.tamanho = tamanho
+        self.ttl = ttl
+        self.serializar = serializar
+        self.desserializar = desserializar
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.erros = 0
+
+    def obter(self, chave):
+        """Valor guardado em `chave` ou None"""
+        if self.redis is not None:
+            try:
+                bruto = self.redis.get(self.prefixo + chave)
+                valor = self.desserializar(bruto) if bruto is not None else None
+            except Exception:
+                # Redis fora do ar ou entrada ilegível (formato de outra versão): vale como falta
+                valor = None
+                with self._lock:
+                    self.erros += 1
+        else:
+            with self._lock:
+                item = self._lru.get(chave)
+                if item is not None and item[0] < time.monotonic():
+                    del self._lru[chave]
+                    item = None
+                if item is not None:
+                    self._lru.move_to_end(chave)
+            valor = item[1] if item is not None else None
+        with self._lock:
+            if valor is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return valor
+
+    def gravar(self, chave, valor):
+        """Guarda `valor` em `chave` por `ttl` segundos"""
+        if self.redis is not None:
+            try:
+                self.redis.setex(self.prefixo + chave, self.ttl, self.serializar(valor))
+            except Exception:
+                with self._lock:
+                    self.erros += 1
+            return
+        with self._lock:
+            self._lru[chave] = (time.monotonic() + self.ttl, valor)
+            self._lru.move_to_end(chave)
+            while len(self._lru) > self.tamanho:
+                self._lru.popitem(last=False)
+
+    def limpar(self):
+        """Esvazia o LRU local e zera os contadores"""
+        with self._lock:
+            self._lru.clear()
+            self.hits = self.misses = self.erros = 0
+
+    def stats(self):
+        """Métricas do cache: acertos, faltas, erros do Redis e entradas locais"""
+        with self._lock:
+            return {
+                'backend': 'redis' if self.redis is not None else 'lru',
+                'hits': self.hits,
+                'misses': self.misses,
+                'erros': self.erros,
+                'entradas': len(self._lru),
+                'tamanho': self.tamanho,
+            }
+
+
+# Categorias, subcategorias e cartões (listas de dicts, em JSON no Redis)
+cache_cadastros = CacheUsuario('financas:cadastros:', CADASTROS_CACHE_TAMANHO, CADASTROS_CACHE_TTL)
+
+
+def _dashboard_para_json(valor):
+    """Serializa um valor do cache_dashboard; os Registro vão como campos e valores"""
+    return json.dumps(valor, default=_registro_para_json)
+
+
+def _dashboard_de_json(bruto):
+    """Lê o JSON de _dashboard_para_json recriando os Registro"""
+    return json.loads(bruto, object_hook=_registro_de_json)
+
+
+# Contexto montado do dashboard por (usuário, mês) e afins; só dados simples em JSON no Redis
+cache_dashboard = CacheUsuario(
+    'financas:dashboard:', DASHBOARD_CACHE_TAMANHO, DASHBOARD_CACHE_TTL,
+    serializar=_dashboard_para_json, desserializar=_dashboard_de_json
+)
+
+
+def get_cache_stats():
+    """Retorna as métricas dos caches por usuário"""
+    return {'cadastros': cache_cadastros.stats(), 'dashboard': cache_dashboard.stats()}
+
+
+def geracao_usuario(conn, usuario_id):
+    """Gerações atuais (cadastros, lancamentos) do usuário; (0, 0) se nunca escritos"""
+    row = conn.execute(
+        'SELECT cadastros, lancamentos FROM geracao_usuario WHERE usuario_id = ?', (usuario_id,)
+    ).fetchone()
+    return (row[0], row[1]) if row else (0, 0)
+
+
+def geracao_cadastros(conn, usuario_id):
+    """Geração atual dos cadastros do usuário (0 se nunca escritos)"""
+    row = conn.execute('SELECT cadastros FROM geracao_usuario WHERE usuario_id = ?', (usuario_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def cadastros_em_cache(nome, usuario_id, params, consulta):
+    """Executa `consulta` (SQL com `params`) passando pelo cache do usuário.
+
+    Retorna uma lista de dicts nova a cada chamada, então quem chama pode
+    alterá-la sem afetar o cache.
+    """
+    conn = get_db_connection()
+    try:
+        chave = f"{usuario_id}:{geracao_cadastros(conn, usuario_id)}:{nome}:{':'.join(map(str, params))}"
+        valor = cache_cadastros.obter(chave)
+        if valor is None:
+            valor = [dict(row) for row in conn.execute(consulta, params).fetchall()]
+            cache_cadastros.gravar(chave, valor)
+    finally:
+        conn.close()
+    return [dict(item) for item in valor]
+
+
+def init_app(app):
+    """Registra o teardown do pool de conexões e liga o cache ao Redis da sessão, se houver"""
+    app.teardown_appcontext(close_db)
+
+    @app.errorhandler(PoolEsgotado)
+    def pool_esgotado(erro):
+        app.logger.warning(f'[Pool] Sem conexão livre em {pool.timeout}s: {pool.stats()}')
+        return 'Servidor ocupado, tente novamente em instantes.', 503, {'Retry-After': '1'}
+
+    cache_cadastros.redis = app.config.get('SESSION_REDIS')
+    cache_dashboard.redis = app.config.get('SESSION_REDIS')
+
+
+def limites_mes(ano, mes):
+    """Retorna (primeiro dia do mês, primeiro dia do mês seguinte) em ISO"""
+    inicio = date(int(ano), int(mes), 1)
+    fim = date(inicio.year + 1, 1, 1) if inicio.month == 12 else date(inicio.year, inicio.month + 1, 1)
+    return inicio.isoformat(), fim.isoformat()
+
+
+def limites_ano(ano):
+    """Retorna (1º de janeiro do ano, 1º de janeiro do ano seguinte) em ISO"""
+    return date(int(ano), 1, 1).isoformat(), date(int(ano) + 1, 1, 1).isoformat()
+
+
+def ler_periodo(mes=None, ano=None):
+    """Converte mes/ano da query string em int (None quando vazios).
+
+    Levanta ValueError se não forem números ou se o período não existir no
+    calendário (mês fora de 1-12, ano fora de 1-9998), antes que limites_mes
+    falhe no meio da consulta.
+    """
+    mes = int(mes) if mes else None
+    ano = int(ano) if ano else None
+    if (mes is not None and not 1 <= mes <= 12) or (ano is not None and not 1 <= ano <= 9998):
+        raise ValueError(f'Período inválido: mês {mes}, ano {ano}')
+    return mes, ano
+
+
+def filtro_periodo(conn, tabela, alias, usuario_id, mes=None, ano=None):
+    """Monta um filtro de período sargável sobre `alias`.data_inicio.
+
+    Em vez de strftime() na coluna (que impede o uso de índice), gera
+    intervalos semiabertos `data_inicio >= ? AND data_inicio < ?`:
+      - mês + ano: o mês em questão
+      - só ano: o ano inteiro
+      - só mês: o mês em cada ano com lançamentos do usuário; os intervalos
+        vão numa subconsulta de ids para o SQLite resolver cada um pelo índice
+        (usuario_id, data_inicio) em vez de percorrer todas as linhas do usuário
+
+    Retorna (sql, params); sql vazio quando não há filtro de data. Mês ou ano
+    inválido não encontra nada, como o antigo filtro por strftime().
+    """
+    try:
+        mes, ano = ler_periodo(mes, ano)
+    except ValueError:
+        return '0', []
+    coluna = f'{alias}.data_inicio'
+
+    if mes and ano:
+        return f'{coluna} >= ? AND {coluna} < ?', list(limites_mes(ano, mes))
+    if ano:
+        return f'{coluna} >= ? AND {coluna} < ?', list(limites_ano(ano))
+    if mes:
+        anos = intervalo_anos(conn, tabela, usuario_id)
+        if not anos:
+            return '0', []
+        partes = []
+        params = []
+        for a in range(anos[0], anos[1] + 1):
+            partes.append('(usuario_id = ? AND data_inicio >= ? AND data_inicio < ?)')
+            params.append(usuario_id)
+            params.extend(limites_mes(a, mes))
+        return f'{alias}.id IN (SELECT id FROM {tabela} WHERE ' + ' OR '.join(partes) + ')', params
+    return '', []
+
+
+def intervalo_anos(conn, tabela, usuario_id):
+    """Retorna (primeiro, último) ano com lançamentos do usuário, ou None.
+
+    MIN e MAX em subconsultas separadas viram buscas pontuais no índice
+    (usuario_id, data_inicio).
+    """
+    row = conn.execute(f'''
+        SELECT (SELECT MIN(data_inicio) FROM {tabela} WHERE usuario_id = ?) AS inicio,
+               (SELECT MAX(data_inicio) FROM {tabela} WHERE usuario_id = ?) AS fim
+    ''', (usuario_id, usuario_id)).fetchone()
+    if not row or not row['inicio']:
+        return None
+    return int(row['inicio'][:4]), int(row['fim'][:4])
+
+
+# Registros compactos das listagens de despesas/receitas
+CAMPOS_DATA = frozenset({'data_inicio', 'data_fim'})
+
+
+class Registro:
+    """Base das linhas de despesa/receita entregues às listagens.
+
+    Cada subclasse (uma por conjunto de colunas, ver tipo_registro) guarda os
+    valores em __slots__, sem __dict__ por instância. Colunas de data ficam
+    como texto e só viram datetime no primeiro acesso (None se inválidas).
+    """
+    __slots__ = ()
+    _campos = ()
+    _slots = ()
+
+    def __init__(self, valores):
+        for slot, valor in zip(self._slots, valores):
+            setattr(self, slot, valor)
+
+    def _asdict(self):
+        return {campo: getattr(self, campo) for campo in self._campos}
+
+    def __repr__(self):
+        return f"<Registro id={getattr(self, 'id', None)}>"
+
+
+def _data_preguicosa(slot):
+    """Propriedade que converte o texto YYYY-MM-DD em datetime uma única vez"""
+    def ler(self):
+        valor = getattr(self, slot)
+        if valor and isinstance(valor, str):
+            try:
+                valor = datetime.strptime(valor, '%Y-%m-%d')
+            except ValueError:
+                valor = None
+            setattr(self, slot, valor)
+        return valor
+    return property(ler)
+
+
+@functools.lru_cache(maxsize=64)
+def tipo_registro(campos):
+    """Subclasse de Registro para a tupla de nomes de coluna `campos`.
+
+    Criada uma vez por formato de consulta e reaproveitada, ao contrário de
+    type('obj', ...) por linha.
+    """
+    slots = tuple(f'_{campo}' if campo in CAMPOS_DATA else campo for campo in campos)
+    atributos = {'__slots__': slots, '_campos': campos, '_slots': slots}
+    for campo in campos:
+        if campo in CAMPOS_DATA:
+            atributos[campo] = _data_preguicosa(f'_{campo}')
+    return type('Registro', (Registro,), atributos)
+
+
+def _registro_para_json(valor):
+    """`default` do json.dumps: Registro vira {'__registro__': campos, 'valores': [...]}.
+
+    Datas já convertidas pelo acesso voltam a texto YYYY-MM-DD.
+    """
+    if not isinstance(valor, Registro):
+        raise TypeError(f'{type(valor).__name__} não é serializável em JSON')
+    valores = [getattr(valor, slot) for slot in valor._slots]
+    return {
+        '__registro__': valor._campos,
+        'valores': [v.strftime('%Y-%m-%d') if isinstance(v, datetime) else v for v in valores],
+    }
+
+
+def _registro_de_json(objeto):
+    """`object_hook` do json.loads: recria os Registro gravados por _registro_para_json"""
+    if '__registro__' in objeto:
+        return tipo_registro(tuple(objeto['__registro__']))(objeto['valores'])
+    return objeto
+
+
+def executar_registros(conn, query, params=()):
+    """Executa `query` devolvendo (tipo_registro, tuplas cruas)"""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    linhas = cursor.execute(query, params).fetchall()
+    return tipo_registro(tuple(coluna[0] for coluna in cursor.description)), linhas
+
+
+def consultar_registros(conn, query, params=()):
+    """Executa `query` e devolve a lista de Registro"""
+    tipo, linhas = executar_registros(conn, query, params)
+    return [tipo(linha) for linha in linhas]
+
+
+# Paginação das listagens de despesas/receitas
+POR_PAGINA_PADRAO = int(os.environ.get('LISTA_POR_PAGINA', 50))
+POR_PAGINA_MAXIMO = 500
+
+
+def ler_por_pagina(valor):
+    """Converte o parâmetro por_pagina, limitado a [1, POR_PAGINA_MAXIMO]"""
+    try:
+        por_pagina = int(valor)
+    except (TypeError, ValueError):
+        return POR_PAGINA_PADRAO
+    return max(1, min(por_pagina, POR_PAGINA_MAXIMO))
+
+
+def codificar_cursor(data_inicio, id_):
+    """Cursor da posição de uma linha na ordem (data_inicio DESC, id DESC)"""
+    return f"{data_inicio}_{id_}"
+
+
+def decodificar_cursor(cursor):
+    """'AAAA-MM-DD_id' -> (data_inicio, id); None se ausente ou inválido"""
+    if not cursor:
+        return None
+    data_inicio, _, id_ = cursor.rpartition('_')
+    try:
+        return (data_inicio, int(id_)) if data_inicio else None
+    except ValueError:
+        return None
+
+
+def pagina_keyset(conn, query, params, alias, cursor=None, por_pagina=POR_PAGINA_PADRAO):
+    """Executa uma página de `query` (SELECT ... WHERE ..., sem ORDER BY).
+
+    Ordena por (data_inicio DESC, id DESC) e continua estritamente depois do
+    cursor, sem OFFSET: a página N custa o mesmo que a primeira e o índice
+    (usuario_id, data_inicio) já entrega as linhas nessa ordem. Busca uma linha
+    a mais só para saber se existe próxima página.
+
+    Retorna (registros, proximo_cursor); proximo_cursor é None na última página.
+    """
+    params = list(params)
+    posicao = decodificar_cursor(cursor)
+    if posicao:
+        query += f' AND ({alias}.data_inicio, {alias}.id) < (?, ?)'
+        params.extend(posicao)
+    query += f' ORDER BY {alias}.data_inicio DESC, {alias}.id DESC LIMIT ?'
+    params.append(por_pagina + 1)
+
+    tipo, linhas = executar_registros(conn, query, params)
+    proximo_cursor = None
+    if len(linhas) > por_pagina:
+        linhas = linhas[:por_pagina]
+        ultima = dict(zip(tipo._campos, linhas[-1]))
+        proximo_cursor = codificar_cursor(ultima['data_inicio'], ultima['id'])
+    return [tipo(linha) for linha in linhas], proximo_cursor
+
+
 def get_categorias_receitas(usuario_id=None):
     """Retorna todas as categorias de receitas do usuário"""
-    conn = get_db_connection()
     if usuario_id:
-        categorias = conn.execute('SELECT * FROM categoria_receita WHERE usuario_id = ? ORDER BY nome', (usuario_id,)).fetchall()
-    else:
-        categorias = conn.execute('SELECT * FROM categoria_receita ORDER BY nome').fetchall()
+        return cadastros_em_cache(
+            'categorias_receitas', usuario_id, (usuario_id,),
+            'SELECT * FROM categoria_receita WHERE usuario_id = ? ORDER BY nome'
+        )
+    conn = get_db_connection()
+    categorias = conn.execute('SELECT * FROM categoria_receita ORDER BY nome').fetchall()
     conn.close()
     return categorias
 
+
 def get_subcategorias_receitas(categoria_id=None, usuario_id=None):
     """Retorna subcategorias de receitas, opcionalmente filtradas por categoria e usuário"""
-    conn = get_db_connection()
     if categoria_id and usuario_id:
-        subcategorias = conn.execute(
-            'SELECT * FROM subcategoria_receita WHERE categoria_id = ? AND usuario_id = ? ORDER BY nome',
-            (categoria_id, usuario_id)
-        ).fetchall()
-    elif usuario_id:
-        subcategorias = conn.execute(
+        return cadastros_em_cache(
+            'subcategorias_receitas_categoria', usuario_id, (categoria_id, usuario_id),
+            'SELECT * FROM subcategoria_receita WHERE categoria_id = ? AND usuario_id = ? ORDER BY nome'
+        )
+    if usuario_id:
+        return cadastros_em_cache(
+            'subcategorias_receitas', usuario_id, (usuario_id, usuario_id),
             '''SELECT sr.*, cr.nome as categoria_nome 
                FROM subcategoria_receita sr 
                JOIN categoria_receita cr ON sr.categoria_id = cr.id 
                WHERE sr.usuario_id = ? AND cr.usuario_id = ?
-               ORDER BY cr.nome, sr.nome''',
-            (usuario_id, usuario_id)
-        ).fetchall()
-    elif categoria_id:
+               ORDER BY cr.nome, sr.nome'''
+        )
+    conn = get_db_connection()
+    if categoria_id:
         subcategorias = conn.execute(
             'SELECT * FROM subcategoria_receita WHERE categoria_id = ? ORDER BY nome',
             (categoria_id,)
@@ -59,34 +647,38 @@ def get_subcategorias_receitas(categoria_id=None, usuario_id=None):
     conn.close()
     return subcategorias
 
+
 def get_categorias_despesas(usuario_id=None):
     """Retorna todas as categorias de despesas do usuário"""
-    conn = get_db_connection()
     if usuario_id:
-        categorias = conn.execute('SELECT * FROM categoria_despesa WHERE usuario_id = ? ORDER BY nome', (usuario_id,)).fetchall()
-    else:
-        categorias = conn.execute('SELECT * FROM categoria_despesa ORDER BY nome').fetchall()
+        return cadastros_em_cache(
+            'categorias_despesas', usuario_id, (usuario_id,),
+            'SELECT * FROM categoria_despesa WHERE usuario_id = ? ORDER BY nome'
+        )
+    conn = get_db_connection()
+    categorias = conn.execute('SELECT * FROM categoria_despesa ORDER BY nome').fetchall()
     conn.close()
     return categorias
 
+
 def get_subcategorias_despesas(categoria_id=None, usuario_id=None):
     """Retorna subcategorias de despesas, opcionalmente filtradas por categoria e usuário"""
-    conn = get_db_connection()
     if categoria_id and usuario_id:
-        subcategorias = conn.execute(
-            'SELECT * FROM subcategoria_despesa WHERE categoria_id = ? AND usuario_id = ? ORDER BY nome',
-            (categoria_id, usuario_id)
-        ).fetchall()
-    elif usuario_id:
-        subcategorias = conn.execute(
+        return cadastros_em_cache(
+            'subcategorias_despesas_categoria', usuario_id, (categoria_id, usuario_id),
+            'SELECT * FROM subcategoria_despesa WHERE categoria_id = ? AND usuario_id = ? ORDER BY nome'
+        )
+    if usuario_id:
+        return cadastros_em_cache(
+            'subcategorias_despesas', usuario_id, (usuario_id, usuario_id),
             '''SELECT sd.*, cd.nome as categoria_nome 
                FROM subcategoria_despesa sd 
                JOIN categoria_despesa cd ON sd.categoria_id = cd.id 
                WHERE sd.usuario_id = ? AND cd.usuario_id = ?
-               ORDER BY cd.nome, sd.nome''',
-            (usuario_id, usuario_id)
-        ).fetchall()
-    elif categoria_id:
+               ORDER BY cd.nome, sd.nome'''
+        )
+    conn = get_db_connection()
+    if categoria_id:
         subcategorias = conn.execute(
             'SELECT * FROM subcategoria_despesa WHERE categoria_id = ? ORDER BY nome',
             (categoria_id,)
@@ -101,238 +693,359 @@ def get_subcategorias_despesas(categoria_id=None, usuario_id=None):
     conn.close()
     return subcategorias
 
-def calcular_numero_parcelas(data_inicio, data_fim, tipo_recorrencia):
-    """Calcula o número de parcelas baseado no tipo de recorrência e intervalo de datas"""
-    from datetime import datetime
-    from dateutil.relativedelta import relativedelta
-    
-    if not data_fim:
-        return 'x'  # Infinito se não há data fim
+# Passo de cada tipo de recorrência, em (meses, dias)
+PASSOS_RECORRENCIA = {
+    'semanal': (0, 7),
+    'quinzenal': (0, 14),
+    'mensal': (1, 0),
+    'bimestral': (2, 0),
+    'trimestral': (3, 0),
+    'quadrimestral': (4, 0),
+    'semestral': (6, 0),
+    'anual': (12, 0)
+}
+
+# Proteção contra intervalos absurdos (ex: semanal por décadas)
+MAX_PARCELAS = 1000
+
+
+def _data_no_mes(indice_mes, dia):
+    """Data do `dia` no mês `indice_mes` (ano * 12 + mês - 1), limitado ao último dia do mês"""
+    ano, mes = divmod(indice_mes, 12)
+    return date(ano, mes + 1, min(dia, calendar.monthrange(ano, mes + 1)[1]))
+
+
+def calcular_vencimentos(data_inicio, tipo_recorrencia, data_fim=None, dia_comum=None):
+    """Calcula todas as datas de vencimento de uma recorrência de uma vez.
+
+    Cada vencimento k é calculado a partir de data_inicio (o ajuste de dia de
+    um mês não contamina os seguintes) e entra enquanto não passa de data_fim;
+    sem data_fim vai até o fim do ano seguinte ao início. O primeiro sempre
+    entra. Nas recorrências mensais e maiores o vencimento cai no dia_comum
+    (ou no dia de data_inicio), limitado ao último dia do mês: dia 31 vira
+    30/04, 28/02 ou 29/02. Tipos desconhecidos (ex: 'unica') geram só
+    data_inicio. Retorna lista de date.
+    """
+    inicio = datetime.strptime(data_inicio, '%Y-%m-%d').date()
+    if tipo_recorrencia not in PASSOS_RECORRENCIA:
+        return [inicio]
     
-    data_inicio_obj = datetime.strptime(data_inicio, '%Y-%m-%d').date()
-    data_fim_obj = datetime.strptime(data_fim, '%Y-%m-%d').date()
+    if data_fim:
+        limite = datetime.strptime(data_fim, '%Y-%m-%d').date()
+    else:
+        limite = date(inicio.year + 1, 12, 31)
+    if limite < inicio:
+        return []
     
-    # Mapeamento de tipos para incrementos
-    incrementos = {
-        'semanal': lambda d: d + relativedelta(weeks=1),
-        'quinzenal': lambda d: d + relativedelta(weeks=2),
-        'mensal': lambda d: d + relativedelta(months=1),
-        'bimestral': lambda d: d + relativedelta(months=2),
-        'trimestral': lambda d: d + relativedelta(months=3),
-        'quadrimestral': lambda d: d + relativedelta(months=4),
-        'semestral': lambda d: d + relativedelta(months=6),
-        'anual': lambda d: d + relativedelta(years=1)
-    }
+    meses, dias = PASSOS_RECORRENCIA[tipo_recorrencia]
+    if dias:
+        total = min((limite - inicio).days // dias + 1, MAX_PARCELAS)
+        return [inicio + timedelta(days=dias * k) for k in range(total)]
     
-    if tipo_recorrencia not in incrementos:
-        return '1'
+    dia = dia_comum or inicio.day
+    mes_inicio = inicio.year * 12 + inicio.month - 1
+    mes_limite = limite.year * 12 + limite.month - 1
+    total = (mes_limite - mes_inicio) // meses + 1
+    # Só o vencimento no mês do limite pode passar dele
+    if total > 1 and _data_no_mes(mes_inicio + (total - 1) * meses, dia) > limite:
+        total -= 1
+    total = min(total, MAX_PARCELAS)
     
-    # Contar quantas vezes o tipo de recorrência acontece no intervalo
-    contador = 0
-    data_atual = data_inicio_obj
-    incremento_func = incrementos[tipo_recorrencia]
+    return [_data_no_mes(mes_inicio + k * meses, dia) for k in range(total)]
+
+
+def periodo_compra_parcelada(dia_vencimento, mes_primeira_fatura, parcelas):
+    """(data_inicio, data_fim) de uma compra parcelada no cartão.
+
+    A 1ª parcela vence no dia de vencimento do cartão no mês da 1ª fatura
+    (YYYY-MM), limitado ao último dia do mês, e a última `parcelas` - 1 meses
+    depois, no mesmo dia. Com as datas, calcular_vencimentos(..., 'mensal')
+    gera exatamente `parcelas` vencimentos. Levanta ValueError se o mês for
+    inválido.
+    """
+    ano, mes = map(int, mes_primeira_fatura.split('-'))
+    if not 1 <= mes <= 12:
+        raise ValueError(f'Mês inválido: {mes_primeira_fatura}')
+    indice = ano * 12 + mes - 1
+    primeira = _data_no_mes(indice, dia_vencimento)
+    ultima = _data_no_mes(indice + parcelas - 1, primeira.day)
+    return primeira.isoformat(), ultima.isoformat()
+
+
+def calcular_numero_parcelas(data_inicio, data_fim, tipo_recorrencia, dia_comum=None):
+    """Calcula o número de parcelas baseado no tipo de recorrência e intervalo de datas"""
+    if not data_fim:
+        return 'x'  # Infinito se não há data fim
     
-    while data_atual <= data_fim_obj:
-        contador += 1
-        data_atual = incremento_func(data_atual)
-        
-        # Proteção contra loops infinitos
-        if contador > 1000:
-            break
+    if tipo_recorrencia not in PASSOS_RECORRENCIA:
+        return '1'
     
-    return str(contador)
+    return str(len(calcular_vencimentos(data_inicio, tipo_recorrencia, data_fim, dia_comum)))
+
 
 def get_cartoes_credito(usuario_id):
     """Retorna todos os cartões de crédito do usuário"""
-    conn = get_db_connection()
-    cartoes = conn.execute('''
+    return cadastros_em_cache('cartoes', usuario_id, (usuario_id,), '''
         SELECT c.*, i.nome as instituicao_nome 
         FROM cartao_credito c
         JOIN instituicao_financeira i ON c.instituicao_id = i.id
         WHERE c.usuario_id = ? AND c.ativo = 1
         ORDER BY c.created_at DESC
-    ''', (usuario_id,)).fetchall()
-    conn.close()
-    return cartoes
+    ''')
 
-def gerar_parcelas_receita(categoria_id, subcategoria_id, data_inicio, data_fim, tipo_recorrencia, valor_parcela, dia_comum, user_id, fixo=False):
-    """Gera parcelas individuais para uma receita"""
-    from datetime import datetime
-    from dateutil.relativedelta import relativedelta
-    
-    conn = get_db_connection()
-    
-    # Se for tipo único, inserir apenas um registro
-    if tipo_recorrencia == 'unica':
-        cursor = conn.execute('''
-            INSERT INTO receita (categoria_id, subcategoria_id, data_inicio, valor, tipo_recorrencia, numero_parcelas, parcela_atual, usuario_id, fixo)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (categoria_id, subcategoria_id, data_inicio, valor_parcela, 'unica', '1', 1, user_id, fixo))
-        
-        conn.commit()
-        conn.close()
-        return [cursor.lastrowid]
-    
-    # Calcular número de parcelas baseado no tipo de recorrência
-    numero_parcelas = calcular_numero_parcelas(data_inicio, data_fim, tipo_recorrencia)
-    
-    # Mapeamento de tipos para incrementos
-    incrementos = {
-        'semanal': lambda d: d + relativedelta(weeks=1),
-        'quinzenal': lambda d: d + relativedelta(weeks=2),
-        'mensal': lambda d: d + relativedelta(months=1),
-        'bimestral': lambda d: d + relativedelta(months=2),
-        'trimestral': lambda d: d + relativedelta(months=3),
-        'quadrimestral': lambda d: d + relativedelta(months=4),
-        'semestral': lambda d: d + relativedelta(months=6),
-        'anual': lambda d: d + relativedelta(years=1)
-    }
+# Recorrências sem data_fim são materializadas só até um horizonte móvel;
+# garantir_horizonte() estende as séries conforme as telas pedem períodos adiante.
+RECORRENCIA_HORIZONTE_MESES = int(os.environ.get('RECORRENCIA_HORIZONTE_MESES', 3))
+RECORRENCIA_HORIZONTE_MAXIMO_MESES = int(os.environ.get('RECORRENCIA_HORIZONTE_MAXIMO_MESES', 60))
+
+# Colunas da série copiadas para cada ocorrência materializada
+COLUNAS_REGRA_SERIE = ('categoria_id', 'subcategoria_id', 'valor', 'fixo', 'cartao_id')
+
+
+def inicio_do_mes_adiante(meses):
+    """Primeiro dia (ISO) do mês seguinte a `meses` meses após o atual"""
+    hoje = date.today()
+    indice = hoje.year * 12 + hoje.month + meses
+    return date(indice // 12, indice % 12 + 1, 1).isoformat()
+
+
+def janela_visualizada(mes=None, ano=None):
+    """Limite exclusivo (ISO) do período filtrado numa listagem, ou None se aberto ou inválido"""
+    try:
+        mes, ano = ler_periodo(mes, ano)
+    except ValueError:
+        return None
+    if mes and ano:
+        return limites_mes(ano, mes)[1]
+    if ano:
+        return limites_ano(ano)[1]
+    return None
+
+
+def garantir_horizonte(conn, usuario_id, ate=None):
+    """Materializa as ocorrências das séries sem data_fim do usuário com data < ate.
+
+    As telas chamam antes de consultar um período (mês do dashboard, fatura,
+    listagem). `ate` vale no mínimo o horizonte padrão e no máximo
+    RECORRENCIA_HORIZONTE_MAXIMO_MESES à frente. Cada série guarda até onde já
+    foi materializada (materializada_ate), então no caso comum isto é uma
+    única consulta sem resultado. Retorna quantas ocorrências criou.
+
+    Sem transação aberta em `conn`, grava numa transação própria com BEGIN
+    IMMEDIATE e relê as séries já com o lock de escrita, para que duas
+    requisições simultâneas não materializem as mesmas ocorrências. Se quem
+    chama já tem uma transação aberta, grava dentro dela (num savepoint) e o
+    commit fica com quem chama.
+    """
+    ate = min(max(ate or '', inicio_do_mes_adiante(RECORRENCIA_HORIZONTE_MESES)),
+              inicio_do_mes_adiante(RECORRENCIA_HORIZONTE_MAXIMO_MESES))
+    pendentes = '''
+        SELECT * FROM serie_recorrencia
+        WHERE usuario_id = ? AND data_fim IS NULL AND materializada_ate < ?
+    '''
+    if not conn.execute(pendentes, (usuario_id, ate)).fetchone():
+        return 0
     
-    # Determinar quantas parcelas gerar
-    if numero_parcelas == 'x':
-        # Gerar até o final do ano subsequente (ano atual + 1)
-        dt_inicio = datetime.strptime(data_inicio, '%Y-%m-%d').date()
-        ano_limite = dt_inicio.year + 1
-        dt_limite = datetime(ano_limite, 12, 31).date()
-        
-        # Contagem precisa
-        count = 0
-        tmp = dt_inicio
-        inc = incrementos.get(tipo_recorrencia, incrementos['mensal'])
-        
-        while tmp <= dt_limite:
-            count += 1
-            tmp = inc(tmp)
+    propria = not conn.in_transaction
+    conn.execute('BEGIN IMMEDIATE' if propria else 'SAVEPOINT garantir_horizonte')
+    try:
+        # Relida com o lock de escrita: outra requisição pode ter materializado antes
+        series = conn.execute(pendentes, (usuario_id, ate)).fetchall()
+        ultimo_dia = (date.fromisoformat(ate) - timedelta(days=1)).isoformat()
+        criadas = 0
+        for serie in series:
+            tabela = serie['tabela']
+            categoria = conn.execute(
+                f'SELECT 1 FROM categoria_{tabela} WHERE id = ?', (serie['categoria_id'],)
+            ).fetchone()
+            if not categoria:
+                # Categoria excluída: a série termina na última ocorrência gerada
+                conn.execute('UPDATE serie_recorrencia SET data_fim = ultima_data WHERE id = ?', (serie['id'],))
+                continue
+            coluna_dia_comum = 'dia_comum_pagamento' if tabela == 'despesa' else 'dia_comum_recebimento'
+            colunas_regra = [c for c in COLUNAS_REGRA_SERIE if tabela == 'despesa' or c != 'cartao_id']
+            # Mesmo dia de vencimento da série: dia_comum ou o dia da primeira ocorrência
+            dia_ancora = serie['dia_comum'] or int(serie['data_inicio'][8:10])
+            datas = calcular_vencimentos(serie['ultima_data'], serie['tipo_recorrencia'], ultimo_dia, dia_ancora)[1:]
             
-        parcelas_a_gerar = count if count > 0 else 1
-    else:
-        parcelas_a_gerar = int(numero_parcelas)
-    
-    # Gerar parcelas individuais (sem registro pai)
-    data_atual = datetime.strptime(data_inicio, '%Y-%m-%d').date()
-    if data_fim:
-        data_limite = datetime.strptime(data_fim, '%Y-%m-%d').date()
-    else:
-        data_limite = None
-    
-    incremento_func = incrementos.get(tipo_recorrencia, incrementos['mensal'])
-    parcelas_criadas = []
-    
-    for i in range(parcelas_a_gerar):
-        # Se há data fim e passamos dela, parar
-        if data_limite and data_atual > data_limite:
-            break
+            if datas:
+                colunas = colunas_regra + ['usuario_id', 'data_inicio', 'tipo_recorrencia', 'numero_parcelas', 'parcela_atual', coluna_dia_comum, 'serie_id']
+                regra = tuple(serie[c] for c in colunas_regra) + (usuario_id,)
+                conn.executemany(
+                    f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})",
+                    [
+                        regra + (data.isoformat(), serie['tipo_recorrencia'], 'x', serie['ultima_parcela'] + i, serie['dia_comum'], serie['id'])
+                        for i, data in enumerate(datas, 1)
+                    ]
+                )
+                criadas += len(datas)
             
-        # Ajustar dia se especificado
-        if dia_comum:
-            try:
-                data_atual = data_atual.replace(day=dia_comum)
-            except ValueError:
-                # Dia não existe no mês (ex: 31 em fevereiro)
-                pass
-        
-        # Inserir parcela individual
-        cursor = conn.execute('''
-            INSERT INTO receita (categoria_id, subcategoria_id, data_inicio, valor, tipo_recorrencia, numero_parcelas, parcela_atual, dia_comum_recebimento, usuario_id, fixo)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (categoria_id, subcategoria_id, data_atual.strftime('%Y-%m-%d'), valor_parcela, tipo_recorrencia, numero_parcelas, i+1, dia_comum, user_id, fixo))
-        
-        parcelas_criadas.append(cursor.lastrowid)
-        
-        # Próximo período baseado no tipo de recorrência
-        data_atual = incremento_func(data_atual)
+            conn.execute('''
+                UPDATE serie_recorrencia
+                SET materializada_ate = ?, ultima_data = ?, ultima_parcela = ultima_parcela + ?
+                WHERE id = ?
+            ''', (ate, datas[-1].isoformat() if datas else serie['ultima_data'], len(datas), serie['id']))
+        if propria:
+            conn.commit()
+        else:
+            conn.execute('RELEASE garantir_horizonte')
+    except Exception:
+        if propria:
+            conn.rollback()
+        else:
+            conn.execute('ROLLBACK TO garantir_horizonte')
+            conn.execute('RELEASE garantir_horizonte')
+        raise
     
-    conn.commit()
-    conn.close()
-    return parcelas_criadas
+    return criadas
 
-def gerar_parcelas_despesa(categoria_id, subcategoria_id, data_inicio, data_fim, tipo_recorrencia, valor_parcela, dia_comum, user_id, fixo=False, cartao_id=None):
-    """Gera parcelas individuais para uma despesa"""
-    from datetime import datetime
-    from dateutil.relativedelta import relativedelta
-    
+
+def estender_recorrencias(ate=None):
+    """Roda garantir_horizonte para todos os usuários com séries abertas (job agendado)"""
     conn = get_db_connection()
+    usuarios = [row['usuario_id'] for row in conn.execute(
+        'SELECT DISTINCT usuario_id FROM serie_recorrencia WHERE data_fim IS NULL'
+    )]
+    criadas = sum(garantir_horizonte(conn, usuario_id, ate) for usuario_id in usuarios)
+    conn.close()
+    return criadas
+
+
+def inserir_parcelas(tabela, coluna_dia_comum, colunas_fixas, data_inicio, data_fim, tipo_recorrencia, dia_comum, conn=None):
+    """Insere todas as parcelas de um lançamento com um único executemany.
+
+    `colunas_fixas` (dict) são os valores comuns a todas as parcelas. Parcelas
+    de uma recorrência ganham uma serie_recorrencia própria (serie_id), que
+    guarda também a regra; sem data_fim só se materializa até o horizonte
+    padrão e garantir_horizonte() continua depois. Tudo entra numa só
+    transação, em que as linhas recebem ids consecutivos; por isso os ids são
+    lidos com uma consulta por intervalo a partir do último.
+
+    Não faz commit nem rollback: as parcelas entram na transação de `conn`
+    (sem ela, a conexão da requisição) e quem chama confirma ou desfaz.
+    """
+    horizonte = None
+    limite = data_fim
+    if not data_fim and tipo_recorrencia in PASSOS_RECORRENCIA:
+        horizonte = inicio_do_mes_adiante(RECORRENCIA_HORIZONTE_MESES)
+        # Início depois do horizonte: o limite não pode vir antes da primeira ocorrência
+        limite = max((date.fromisoformat(horizonte) - timedelta(days=1)).isoformat(), data_inicio)
     
-    # Se for tipo único, inserir apenas um registro
-    if tipo_recorrencia == 'unica':
-        cursor = conn.execute('''
-            INSERT INTO despesa (categoria_id, subcategoria_id, data_inicio, valor, tipo_recorrencia, numero_parcelas, parcela_atual, usuario_id, fixo, cartao_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (categoria_id, subcategoria_id, data_inicio, valor_parcela, 'unica', '1', 1, user_id, fixo, cartao_id))
-        
-        conn.commit()
-        conn.close()
-        return [cursor.lastrowid]
+    datas = calcular_vencimentos(data_inicio, tipo_recorrencia, limite, dia_comum)
+    if not datas:
+        return []
     
-    # Calcular número de parcelas baseado no tipo de recorrência
-    numero_parcelas = calcular_numero_parcelas(data_inicio, data_fim, tipo_recorrencia)
+    recorrente = tipo_recorrencia in PASSOS_RECORRENCIA
+    numero_parcelas = 'x' if recorrente and not data_fim else str(len(datas))
+    dia_comum = dia_comum if recorrente else None
     
-    # Mapeamento de tipos para incrementos
-    incrementos = {
-        'semanal': lambda d: d + relativedelta(weeks=1),
-        'quinzenal': lambda d: d + relativedelta(weeks=2),
-        'mensal': lambda d: d + relativedelta(months=1),
-        'bimestral': lambda d: d + relativedelta(months=2),
-        'trimestral': lambda d: d + relativedelta(months=3),
-        'quadrimestral': lambda d: d + relativedelta(months=4),
-        'semestral': lambda d: d + relativedelta(months=6),
-        'anual': lambda d: d + relativedelta(years=1)
-    }
+    colunas = list(colunas_fixas) + ['data_inicio', 'tipo_recorrencia', 'numero_parcelas', 'parcela_atual', coluna_dia_comum, 'serie_id']
+    valores_fixos = tuple(colunas_fixas.values())
     
-    # Determinar quantas parcelas gerar
-    if numero_parcelas == 'x':
-        # Gerar até o final do ano subsequente (ano atual + 1)
-        dt_inicio = datetime.strptime(data_inicio, '%Y-%m-%d').date()
-        ano_limite = dt_inicio.year + 1
-        dt_limite = datetime(ano_limite, 12, 31).date()
-        
-        # Contagem precisa
-        count = 0
-        tmp = dt_inicio
-        inc = incrementos.get(tipo_recorrencia, incrementos['mensal'])
-        
-        while tmp <= dt_limite:
-            count += 1
-            tmp = inc(tmp)
-            
-        parcelas_a_gerar = count if count > 0 else 1
-    else:
-        parcelas_a_gerar = int(numero_parcelas)
+    if conn is None:
+        conn = get_db_connection()
+    serie_id = None
+    if recorrente:
+        if horizonte:
+            # A primeira ocorrência sempre entra, mesmo depois do horizonte
+            horizonte = max(horizonte, (datas[-1] + timedelta(days=1)).isoformat())
+        serie_id = conn.execute('''
+            INSERT INTO serie_recorrencia (usuario_id, tabela, tipo_recorrencia, dia_comum, data_inicio, data_fim,
+                                           categoria_id, subcategoria_id, valor, fixo, cartao_id,
+                                           ultima_data, ultima_parcela, materializada_ate)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            colunas_fixas['usuario_id'], tabela, tipo_recorrencia, dia_comum, datas[0].isoformat(), data_fim,
+            *(colunas_fixas.get(c) for c in COLUNAS_REGRA_SERIE),
+            datas[-1].isoformat(), len(datas), horizonte
+        )).lastrowid
     
-    # Gerar parcelas individuais (sem registro pai)
-    data_atual = datetime.strptime(data_inicio, '%Y-%m-%d').date()
-    if data_fim:
-        data_limite = datetime.strptime(data_fim, '%Y-%m-%d').date()
-    else:
-        data_limite = None
-    
-    incremento_func = incrementos.get(tipo_recorrencia, incrementos['mensal'])
-    parcelas_criadas = []
+    linhas = [
+        valores_fixos + (data.isoformat(), tipo_recorrencia, numero_parcelas, parcela, dia_comum, serie_id)
+        for parcela, data in enumerate(datas, 1)
+    ]
+    conn.executemany(
+        f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})",
+        linhas
+    )
+    ultimo_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+    return [row[0] for row in conn.execute(
+        f'SELECT id FROM {tabela} WHERE id BETWEEN ? AND ? ORDER BY id',
+        (ultimo_id - len(linhas) + 1, ultimo_id)
+    )]
+
+
+def gerar_parcelas_receita(categoria_id, subcategoria_id, data_inicio, data_fim, tipo_recorrencia, valor_parcela, dia_comum, user_id, fixo=False, conn=None):
+    """Gera parcelas individuais para uma receita"""
+    return inserir_parcelas('receita', 'dia_comum_recebimento', {
+        'categoria_id': categoria_id,
+        'subcategoria_id': subcategoria_id,
+        'valor': valor_parcela,
+        'usuario_id': user_id,
+        'fixo': fixo
+    }, data_inicio, data_fim, tipo_recorrencia, dia_comum, conn)
+
+
+def gerar_parcelas_despesa(categoria_id, subcategoria_id, data_inicio, data_fim, tipo_recorrencia, valor_parcela, dia_comum, user_id, fixo=False, cartao_id=None, conn=None):
+    """Gera parcelas individuais para uma despesa"""
+    return inserir_parcelas('despesa', 'dia_comum_pagamento', {
+        'categoria_id': categoria_id,
+        'subcategoria_id': subcategoria_id,
+        'valor': valor_parcela,
+        'usuario_id': user_id,
+        'fixo': fixo,
+        'cartao_id': cartao_id
+    }, data_inicio, data_fim, tipo_recorrencia, dia_comum, conn)
+
+
+# Operações sobre "esta e as próximas" parcelas de uma série (índice serie_id + data_inicio)
+def atualizar_serie(conn, tabela, serie_id, usuario_id, depois_de, valores, deslocamento_dias=0):
+    """Aplica `valores` (dict coluna -> valor) às parcelas da série com data_inicio > depois_de.
+
+    Com deslocamento_dias, as datas dessas parcelas também andam esse número de
+    dias. A regra da série acompanha (valores e dia de vencimento), para que as
+    ocorrências ainda não materializadas saiam iguais. Não faz commit.
+    Retorna quantas parcelas foram alteradas.
+    """
+    atribuicoes = [f'{coluna} = ?' for coluna in valores]
+    params = list(valores.values())
+    regra = {coluna: valor for coluna, valor in valores.items() if coluna in COLUNAS_REGRA_SERIE}
+    if deslocamento_dias:
+        atribuicoes.append('data_inicio = date(data_inicio, ?)')
+        params.append(f'{deslocamento_dias:+} days')
+        regra['dia_comum'] = (date.fromisoformat(depois_de) + timedelta(days=deslocamento_dias)).day
+    if not atribuicoes:
+        return 0
     
-    for i in range(parcelas_a_gerar):
-        # Se há data fim e passamos dela, parar
-        if data_limite and data_atual > data_limite:
-            break
-            
-        # Ajustar dia se especificado
-        if dia_comum:
-            try:
-                data_atual = data_atual.replace(day=dia_comum)
-            except ValueError:
-                # Dia não existe no mês (ex: 31 em fevereiro)
-                pass
-        
-        # Inserir parcela individual
-        cursor = conn.execute('''
-            INSERT INTO despesa (categoria_id, subcategoria_id, data_inicio, valor, tipo_recorrencia, numero_parcelas, parcela_atual, dia_comum_pagamento, usuario_id, fixo, cartao_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (categoria_id, subcategoria_id, data_atual.strftime('%Y-%m-%d'), valor_parcela, tipo_recorrencia, numero_parcelas, i+1, dia_comum, user_id, fixo, cartao_id))
-        
-        parcelas_criadas.append(cursor.lastrowid)
-        
-        # Próximo período baseado no tipo de recorrência
-        data_atual = incremento_func(data_atual)
+    regra_sql = [f'{coluna} = ?' for coluna in regra]
+    regra_params = list(regra.values())
+    if deslocamento_dias:
+        regra_sql.append('ultima_data = date(ultima_data, ?)')
+        regra_params.append(f'{deslocamento_dias:+} days')
+    if regra_sql:
+        conn.execute(
+            f"UPDATE serie_recorrencia SET {', '.join(regra_sql)} WHERE id = ? AND usuario_id = ?",
+            regra_params + [serie_id, usuario_id]
+        )
     
-    conn.commit()
-    conn.close()
-    return parcelas_criadas
+    params.extend([serie_id, depois_de, usuario_id])
+    return conn.execute(f'''
+        UPDATE {tabela} SET {', '.join(atribuicoes)}
+        WHERE serie_id = ? AND data_inicio > ? AND usuario_id = ?
+    ''', params).rowcount
+
+
+def excluir_serie(conn, tabela, serie_id, usuario_id, a_partir_de):
+    """Exclui as parcelas da série com data_inicio >= a_partir_de. Não faz commit.
+
+    A série passa a terminar antes de a_partir_de, então garantir_horizonte()
+    não volta a gerá-las. Retorna quantas parcelas foram excluídas.
+    """
+    conn.execute('''
+        UPDATE serie_recorrencia SET data_fim = date(?, '-1 day')
+        WHERE id = ? AND usuario_id = ? AND (data_fim IS NULL OR data_fim >= ?)
+    ''', (a_partir_de, serie_id, usuario_id, a_partir_de))
+    return conn.execute(
+        f'DELETE FROM {tabela} WHERE serie_id = ? AND data_inicio >= ? AND usuario_id = ?',
+        (serie_id, a_partir_de, usuario_id)
+    ).rowcount
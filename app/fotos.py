@@ -0,0 +1,216 @@
+"""Processamento das fotos de perfil em segundo plano.
+
+O upload só grava o arquivo no spool e enfileira o trabalho; um pool de
+threads por worker decodifica a imagem (reduzida já na decodificação, com
+Image.draft, quando é JPEG), gera os tamanhos de TAMANHOS_FOTO e grava cada um
+em JPEG e WebP. O estado de cada trabalho fica num arquivo JSON no spool,
+visível a todos os workers do gunicorn, e é consultado pela tela de recorte.
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, url_for
+from PIL import Image
+
+FOTO_SPOOL_DIR = os.environ.get('FOTO_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'financas_fotos'))
+FOTO_WORKERS = int(os.environ.get('FOTO_WORKERS', 2))
+FOTO_MAX_BYTES = int(os.environ.get('FOTO_MAX_BYTES', 10 * 1024 * 1024))
+FOTO_MAX_PIXELS = int(os.environ.get('FOTO_MAX_PIXELS', 64_000_000))
+# Trabalho "processando" há mais que isso é dado como perdido (worker reiniciado)
+FOTO_TIMEOUT = int(os.environ.get('FOTO_TIMEOUT', 60))
+FOTO_STATUS_TTL = 3600
+
+PASTA_FOTOS = os.path.join('img', 'profile_users')
+
+# Sufixo do arquivo -> lado em pixels. Sem sufixo é a foto da página de perfil
+# ({username}.jpg, o nome de sempre); '_avatar' é a da barra lateral.
+TAMANHOS_FOTO = {'': 200, '_avatar': 72}
+FORMATOS_FOTO = (
+    ('jpg', 'JPEG', {'quality': 85, 'optimize': True}),
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    """Pool de threads do processo, criado no primeiro uso (depois do fork do gunicorn)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=FOTO_WORKERS, thread_name_prefix='fotos')
+        return _executor
+
+
+def _apos_fork():
+    # Threads não atravessam o fork: o filho cria o próprio pool se precisar
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_apos_fork)
+
+
+def processar_foto(origem, pasta, username):
+    """Gera todos os tamanhos e formatos da foto de `username` em `pasta`.
+
+    Recusa (ValueError) imagens acima de FOTO_MAX_PIXELS antes de decodificar.
+    Cada arquivo é gravado com outro nome e renomeado no fim, então quem lê
+    nunca vê uma foto pela metade. Retorna os nomes dos arquivos gerados.
+    """
+    maior = max(TAMANHOS_FOTO.values())
+    with Image.open(origem) as img:
+        if img.width * img.height > FOTO_MAX_PIXELS:
+            raise ValueError('Imagem muito grande')
+        # JPEG: decodifica direto em 1/2, 1/4 ou 1/8 da resolução, guardando o
+        # dobro do maior tamanho para o LANCZOS (a mesma folga do thumbnail())
+        img.draft('RGB', (maior * 2, maior * 2))
+        img.load()
+
+        # Converter para RGB se necessário (para garantir compatibilidade com JPEG)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGB')
+
+        gerados = []
+        for sufixo, lado in sorted(TAMANHOS_FOTO.items(), key=lambda item: -item[1]):
+            reduzida = img.copy()
+            reduzida.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+
+            # Centraliza numa imagem quadrada com fundo branco
+            quadrada = Image.new('RGB', (lado, lado), (255, 255, 255))
+            quadrada.paste(reduzida, ((lado - reduzida.width) // 2, (lado - reduzida.height) // 2))
+
+            for extensao, formato, opcoes in FORMATOS_FOTO:
+                nome = f'{username}{sufixo}.{extensao}'
+                temporario = os.path.join(pasta, f'.{nome}.{uuid.uuid4().hex}')
+                quadrada.save(temporario, formato, **opcoes)
+                os.replace(temporario, os.path.join(pasta, nome))
+                gerados.append(nome)
+            # A próxima (menor) parte desta, bem mais barata que a original
+            img = quadrada
+    return gerados
+
+
+def _caminho_status(job_id):
+    return os.path.join(FOTO_SPOOL_DIR, f'{job_id}.json')
+
+
+def _gravar_status(job_id, status):
+    temporario = _caminho_status(job_id) + '.tmp'
+    with open(temporario, 'w') as arquivo:
+        json.dump(status, arquivo)
+    os.replace(temporario, _caminho_status(job_id))
+
+
+def _limpar_spool():
+    """Remove estados de trabalhos antigos"""
+    limite = time.time() - FOTO_STATUS_TTL
+    for nome in os.listdir(FOTO_SPOOL_DIR):
+        caminho = os.path.join(FOTO_SPOOL_DIR, nome)
+        try:
+            if os.path.getmtime(caminho) < limite:
+                os.remove(caminho)
+        except OSError:
+            pass
+
+
+def _executar(job_id, origem, pasta, username):
+    status = {'username': username, 'criado_em': time.time()}
+    try:
+        status.update(status='pronta', arquivos=processar_foto(origem, pasta, username))
+    except ValueError as e:
+        status.update(status='erro', message=str(e))
+    except Exception as e:
+        print(f"Erro ao processar foto de {username}: {e}")
+        status.update(status='erro', message='Não foi possível processar a imagem')
+    finally:
+        try:
+            os.remove(origem)
+        except OSError:
+            pass
+    _gravar_status(job_id, status)
+
+
+def enfileirar_foto(arquivo, pasta, username):
+    """Grava o upload no spool e agenda o processamento; retorna o id do trabalho.
+
+    Recusa (ValueError) arquivos acima de FOTO_MAX_BYTES.
+    """
+    os.makedirs(FOTO_SPOOL_DIR, exist_ok=True)
+    os.makedirs(pasta, exist_ok=True)
+    _limpar_spool()
+
+    job_id = uuid.uuid4().hex
+    origem = os.path.join(FOTO_SPOOL_DIR, f'{job_id}.upload')
+    arquivo.save(origem)
+    if os.path.getsize(origem) > FOTO_MAX_BYTES:
+        os.remove(origem)
+        raise ValueError('Arquivo muito grande')
+
+    _gravar_status(job_id, {'status': 'processando', 'username': username, 'criado_em': time.time()})
+    _pool().submit(_executar, job_id, origem, pasta, username)
+    return job_id
+
+
+def status_foto(job_id, username):
+    """Estado do trabalho `job_id` do usuário, ou None se não existir"""
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return None
+    try:
+        with open(_caminho_status(job_id)) as arquivo:
+            status = json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+    if status.get('username') != username:
+        return None
+    if status['status'] == 'processando' and time.time() - status['criado_em'] > FOTO_TIMEOUT:
+        status.update(status='erro', message='Tempo esgotado ao processar a imagem')
+    return status
+
+
+def remover_fotos(pasta, username):
+    """Apaga todos os tamanhos e formatos da foto; retorna se havia alguma"""
+    removida = False
+    for sufixo in TAMANHOS_FOTO:
+        for extensao, _, _ in FORMATOS_FOTO:
+            caminho = os.path.join(pasta, f'{username}{sufixo}.{extensao}')
+            if os.path.exists(caminho):
+                os.remove(caminho)
+                removida = True
+    return removida
+
+
+def versao_foto(username):
+    """Data de modificação da foto principal (0 sem foto), para ETags de páginas que a mostram"""
+    try:
+        return os.stat(os.path.join(current_app.static_folder, PASTA_FOTOS, f'{username}.jpg')).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def urls_foto(username, sufixo=''):
+    """URLs JPEG e WebP da foto no tamanho `sufixo`, ou None se o usuário não tem foto.
+
+    Fotos enviadas antes dos tamanhos e do WebP só têm {username}.jpg; nesse
+    caso ela é usada para qualquer tamanho. Disponível nos templates como
+    foto_perfil().
+    """
+    if not username:
+        return None
+    pasta = os.path.join(current_app.static_folder, PASTA_FOTOS)
+    for candidato in dict.fromkeys((sufixo, '')):
+        if os.path.exists(os.path.join(pasta, f'{username}{candidato}.jpg')):
+            webp = os.path.exists(os.path.join(pasta, f'{username}{candidato}.webp'))
+            return {
+                'jpg': url_for('static', filename=f'img/profile_users/{username}{candidato}.jpg'),
+                'webp': url_for('static', filename=f'img/profile_users/{username}{candidato}.webp') if webp else None,
+            }
+    return None
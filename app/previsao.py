@@ -0,0 +1,188 @@
+"""Previsão do saldo dia a dia para os próximos meses.
+
+Parte do saldo do mês atual (pagos até o fim do mês, como o dashboard) e soma,
+no dia em que cada um cai, os lançamentos ainda pendentes: os já
+materializados (parcelas e recorrências geradas) a partir do mês atual e as
+ocorrências futuras das séries sem data_fim, projetadas sem gravar nada.
+Despesas de cartão saem no dia de vencimento do cartão no mês da fatura.
+Pendências do mês atual com data já passada contam como hoje; as de meses
+anteriores ficam de fora, como no saldo do dashboard.
+
+Datas e valores viram arrays do NumPy: os vencimentos das séries saem de
+aritmética de meses em lote e o saldo diário de um bincount seguido de soma
+acumulada, sem laço por dia ou por ocorrência. Sem NumPy instalado a previsão
+fica indisponível (DISPONIVEL = False) e o resto da aplicação segue normal.
+"""
+from datetime import date
+
+from app.database import PASSOS_RECORRENCIA, executar_registros
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DISPONIVEL = np is not None
+
+PREVISAO_MESES = 12
+PREVISAO_MESES_MAX = 60
+
+# Somados por dia (e cartão, na ordem de idx_despesa_usuario_data_valor, que
+# cobre a consulta); o vencimento do cartão só entra depois de agrupar
+_LANCAMENTOS = '''
+    SELECT 1 AS sinal, r.data_inicio, SUM(r.valor) AS valor, NULL AS dia_vencimento
+    FROM receita r
+    WHERE r.usuario_id = ? AND r.data_inicio >= ? AND r.data_inicio < ?
+      AND (r.pago = 0 OR r.data_inicio >= ?)
+    GROUP BY r.data_inicio
+    UNION ALL
+    SELECT -1, g.data_inicio, g.valor, c.dia_vencimento
+    FROM (
+        SELECT d.data_inicio, d.cartao_id, SUM(d.valor) AS valor
+        FROM despesa d
+        WHERE d.usuario_id = ? AND d.data_inicio >= ? AND d.data_inicio < ?
+          AND (d.pago = 0 OR d.data_inicio >= ?)
+        GROUP BY d.data_inicio, d.cartao_id
+    ) g
+    LEFT JOIN cartao_credito c ON c.id = g.cartao_id
+'''
+
+# Séries sem data_fim cuja categoria ainda existe (garantir_horizonte encerra as outras)
+_SERIES_ABERTAS = '''
+    SELECT CASE WHEN s.tabela = 'receita' THEN 1 ELSE -1 END AS sinal, s.tipo_recorrencia,
+           s.ultima_data, COALESCE(s.dia_comum, CAST(substr(s.data_inicio, 9, 2) AS INTEGER)) AS dia_ancora,
+           s.valor, c.dia_vencimento
+    FROM serie_recorrencia s
+    LEFT JOIN cartao_credito c ON c.id = s.cartao_id
+    WHERE s.usuario_id = ? AND s.data_fim IS NULL AND s.ultima_data IS NOT NULL AND s.ultima_data < ?
+      AND CASE s.tabela
+          WHEN 'receita' THEN EXISTS (SELECT 1 FROM categoria_receita WHERE id = s.categoria_id)
+          ELSE EXISTS (SELECT 1 FROM categoria_despesa WHERE id = s.categoria_id)
+      END
+'''
+
+
+def _dia_no_mes(meses, dias):
+    """Datas do dia `dias` em cada mês de `meses` (datetime64[M]), limitado ao último dia do mês"""
+    inicio = meses.astype('datetime64[D]')
+    tamanho = ((meses + 1).astype('datetime64[D]') - inicio).astype(np.int64)
+    return inicio + (np.minimum(dias, tamanho) - 1)
+
+
+def _no_vencimento_do_cartao(datas, dia_vencimento):
+    """Troca a data das despesas de cartão (dia_vencimento não nulo) pelo vencimento da fatura do mês"""
+    cartao = ~np.isnan(dia_vencimento)
+    if cartao.any():
+        datas = datas.copy()
+        datas[cartao] = _dia_no_mes(datas[cartao].astype('datetime64[M]'), dia_vencimento[cartao].astype(np.int64))
+    return datas
+
+
+def _ocorrencias_series(series, fim):
+    """Vencimentos e valores das séries depois de ultima_data e antes de `fim`.
+
+    As séries são agrupadas por passo (em meses ou em dias) e cada grupo vira
+    uma grade séries x ocorrências, filtrada por uma máscara.
+    """
+    datas, valores = [], []
+    for (meses, dias), grupo in _agrupar_por_passo(series).items():
+        ultima = np.array([s['ultima_data'] for s in grupo], dtype='datetime64[D]')
+        valor = np.array([s['sinal'] * (s['valor'] or 0) for s in grupo], dtype=np.float64)
+        if dias:
+            quantidade = int((fim - ultima.min()).astype(np.int64)) // dias + 1
+            k = np.arange(1, quantidade + 1)
+            grade = ultima[:, None] + k[None, :] * dias
+        else:
+            ancora = np.array([s['dia_ancora'] for s in grupo], dtype=np.int64)
+            primeiro = ultima.astype('datetime64[M]')
+            quantidade = int((fim.astype('datetime64[M]') - primeiro.min()).astype(np.int64)) // meses + 1
+            k = np.arange(1, quantidade + 1)
+            grade = _dia_no_mes(primeiro[:, None] + k[None, :] * meses, ancora[:, None])
+        dentro = grade < fim
+        linhas = np.nonzero(dentro)[0]
+        vencimento = np.array([s['dia_vencimento'] for s in grupo], dtype=np.float64)
+        datas.append(_no_vencimento_do_cartao(grade[dentro], vencimento[linhas]))
+        valores.append(valor[linhas])
+    if not datas:
+        return np.array([], dtype='datetime64[D]'), np.array([], dtype=np.float64)
+    return np.concatenate(datas), np.concatenate(valores)
+
+
+def _agrupar_por_passo(series):
+    grupos = {}
+    for serie in series:
+        passo = PASSOS_RECORRENCIA.get(serie['tipo_recorrencia'])
+        if passo:
+            grupos.setdefault(passo, []).append(serie)
+    return grupos
+
+
+def projetar_saldo(conn, usuario_id, saldo_inicial, meses=PREVISAO_MESES, hoje=None):
+    """Saldo previsto em cada dia de hoje até o fim do `meses`-ésimo mês à frente.
+
+    `saldo_inicial` é o saldo pago até o fim do mês atual
+    (calcular_saldo_mes_dinamico). Retorna um dict com as listas diárias
+    'saldo', 'entradas' e 'saidas' (alinhadas a partir de 'inicio') e o resumo:
+    saldo final, menor saldo e sua data, e o primeiro dia negativo (ou None).
+    """
+    hoje = np.datetime64(hoje or date.today(), 'D')
+    mes_atual = hoje.astype('datetime64[M]')
+    inicio_mes = str(mes_atual.astype('datetime64[D]'))
+    proximo_mes = str((mes_atual + 1).astype('datetime64[D]'))
+    fim = (mes_atual + meses + 1).astype('datetime64[D]')
+
+    _, rows = executar_registros(conn, _LANCAMENTOS, (usuario_id, inicio_mes, str(fim), proximo_mes) * 2)
+    if rows:
+        sinal, data, valor, dia_vencimento = zip(*rows)
+        datas = _no_vencimento_do_cartao(
+            np.array(data, dtype='datetime64[D]'), np.array(dia_vencimento, dtype=np.float64)
+        )
+        valores = np.array(valor, dtype=np.float64) * np.array(sinal, dtype=np.float64)
+    else:
+        datas, valores = np.array([], dtype='datetime64[D]'), np.array([], dtype=np.float64)
+
+    series = conn.execute(_SERIES_ABERTAS, (usuario_id, str(fim))).fetchall()
+    datas_series, valores_series = _ocorrencias_series(series, fim)
+    datas = np.concatenate([datas, datas_series])
+    valores = np.concatenate([valores, valores_series])
+
+    # Ocorrências projetadas em meses anteriores (série sem materializar há muito) ficam de fora
+    manter = (datas >= np.datetime64(inicio_mes)) & (datas < fim)
+    datas, valores = datas[manter], valores[manter]
+
+    dias = int((fim - hoje).astype(np.int64))
+    deslocamento = np.maximum((datas - hoje).astype(np.int64), 0)
+    entradas = np.bincount(deslocamento, weights=np.where(valores > 0, valores, 0), minlength=dias)
+    saidas = np.bincount(deslocamento, weights=np.where(valores < 0, -valores, 0), minlength=dias)
+    # O saldo inicial já inclui o que foi pago no mês; só os pendentes movem o saldo
+    saldo = saldo_inicial + np.cumsum(entradas - saidas)
+
+    menor = int(np.argmin(saldo))
+    negativos = np.flatnonzero(saldo < 0)
+    return {
+        'inicio': str(hoje),
+        'saldo_inicial': float(saldo_inicial),
+        'saldo': np.round(saldo, 2).tolist(),
+        'entradas': np.round(entradas, 2).tolist(),
+        'saidas': np.round(saidas, 2).tolist(),
+        'saldo_final': float(round(saldo[-1], 2)),
+        'menor_saldo': float(round(saldo[menor], 2)),
+        'data_menor_saldo': str(hoje + menor),
+        'primeiro_negativo': str(hoje + int(negativos[0])) if negativos.size else None,
+    }
+
+
+def pontos_grafico(previsao, largura=720, altura=180, pontos=240):
+    """Pontos "x,y" de uma polyline SVG com o saldo previsto (reduzido a até `pontos`).
+
+    A escala sempre inclui o zero; retorna (pontos, y da linha do zero).
+    """
+    saldo = np.asarray(previsao['saldo'])
+    indices = np.unique(np.linspace(0, saldo.size - 1, min(pontos, saldo.size)).astype(np.int64))
+    valores = saldo[indices]
+    minimo, maximo = min(valores.min(), 0.0), max(valores.max(), 0.0)
+    escala = (maximo - minimo) or 1.0
+    x = indices * (largura / max(saldo.size - 1, 1))
+    y = altura - (valores - minimo) * (altura / escala)
+    zero = altura - (0 - minimo) * (altura / escala)
+    return ' '.join(f'{a:.1f},{b:.1f}' for a, b in zip(x, y)), zero
@@ -1,40 +1,161 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app
 from app.database import get_db_connection, gerar_parcelas_receita, gerar_parcelas_despesa
 import hashlib
+import hmac
 import os
+import threading
+import time
 from datetime import date, timedelta
+from functools import lru_cache
 from werkzeug.utils import secure_filename
-from PIL import Image
+from app import fotos
 
 auth_bp = Blueprint('auth', __name__)
 
+# KDF das senhas: 'pbkdf2' (PBKDF2-HMAC-SHA256) ou 'scrypt'. O custo define a
+# latência do login; meça com benchmarks/bench_login.py antes de alterá-lo.
+PASSWORD_KDF = os.environ.get('PASSWORD_KDF', 'pbkdf2')
+PBKDF2_ITERACOES = int(os.environ.get('PBKDF2_ITERACOES', 600_000))
+SCRYPT_N = int(os.environ.get('SCRYPT_N', 2 ** 14))
+SCRYPT_R = int(os.environ.get('SCRYPT_R', 8))
+SCRYPT_P = int(os.environ.get('SCRYPT_P', 1))
+
+
+class HistogramaTempos:
+    """Histograma de durações em milissegundos, com faixas fixas, seguro entre threads"""
+
+    FAIXAS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.contagens = [0] * (len(self.FAIXAS_MS) + 1)
+        self.total = 0
+        self.soma_ms = 0.0
+        self.maximo_ms = 0.0
+
+    def registrar(self, ms):
+        faixa = next((i for i, limite in enumerate(self.FAIXAS_MS) if ms <= limite), len(self.FAIXAS_MS))
+        with self._lock:
+            self.contagens[faixa] += 1
+            self.total += 1
+            self.soma_ms += ms
+            self.maximo_ms = max(self.maximo_ms, ms)
+
+    def _percentil(self, fracao):
+        """Limite superior da faixa que contém o percentil (o máximo, na última faixa)"""
+        alvo = fracao * self.total
+        acumulado = 0
+        for i, contagem in enumerate(self.contagens):
+            acumulado += contagem
+            if contagem and acumulado >= alvo:
+                return self.FAIXAS_MS[i] if i < len(self.FAIXAS_MS) else self.maximo_ms
+        return 0.0
+
+    def stats(self):
+        with self._lock:
+            rotulos = [f'<={limite}' for limite in self.FAIXAS_MS] + [f'>{self.FAIXAS_MS[-1]}']
+            return {
+                'total': self.total,
+                'media_ms': self.soma_ms / self.total if self.total else 0.0,
+                'max_ms': self.maximo_ms,
+                'p50_ms': self._percentil(0.50),
+                'p95_ms': self._percentil(0.95),
+                'p99_ms': self._percentil(0.99),
+                'faixas': dict(zip(rotulos, self.contagens)),
+            }
+
+
+# 'kdf': só a derivação da senha; 'login': o POST de login inteiro (consulta, KDF e rehash)
+tempos_login = {'kdf': HistogramaTempos(), 'login': HistogramaTempos()}
+
+
+def get_login_stats():
+    """Retorna o KDF configurado e os histogramas de tempo do login"""
+    return {
+        'kdf': PASSWORD_KDF,
+        'custo': _prefixo_kdf().rstrip('$'),
+        'tempos': {nome: histograma.stats() for nome, histograma in tempos_login.items()},
+    }
+
+
+def _prefixo_kdf():
+    """Prefixo (algoritmo e custo) dos hashes gerados com a configuração atual"""
+    if PASSWORD_KDF == 'scrypt':
+        return f'scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$'
+    return f'pbkdf2_sha256${PBKDF2_ITERACOES}$'
+
+
+def _scrypt(password, sal, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=sal, n=n, r=r, p=p, maxmem=128 * r * (n + p + 2) + 1024 * 1024)
+
+
 def hash_password(password):
-    """Gera hash da senha usando SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Gera o hash da senha com o KDF configurado e sal aleatório.
+
+    Formatos: pbkdf2_sha256$iteracoes$sal$hash e scrypt$n$r$p$sal$hash (hex).
+    """
+    sal = os.urandom(16)
+    if PASSWORD_KDF == 'scrypt':
+        derivado = _scrypt(password, sal, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    else:
+        derivado = hashlib.pbkdf2_hmac('sha256', password.encode(), sal, PBKDF2_ITERACOES)
+    return f'{_prefixo_kdf()}{sal.hex()}${derivado.hex()}'
+
+
+def _derivar(password, hashed):
+    """Recalcula a senha com algoritmo, custo e sal de `hashed`.
+
+    Retorna (esperado, calculado) em hex, ou None se o formato for desconhecido.
+    Hashes antigos (SHA-256 sem sal, 64 caracteres hex) continuam aceitos.
+    """
+    partes = hashed.split('$')
+    try:
+        if partes[0] == 'pbkdf2_sha256' and len(partes) == 4:
+            derivado = hashlib.pbkdf2_hmac('sha256', password.encode(), bytes.fromhex(partes[2]), int(partes[1]))
+            return partes[3], derivado.hex()
+        if partes[0] == 'scrypt' and len(partes) == 6:
+            n, r, p = (int(x) for x in partes[1:4])
+            return partes[5], _scrypt(password, bytes.fromhex(partes[4]), n, r, p).hex()
+    except ValueError:
+        return None
+    if len(hashed) == 64 and len(partes) == 1:
+        return hashed, hashlib.sha256(password.encode()).hexdigest()
+    return None
+
 
 def check_password(password, hashed):
-    """Verifica se a senha está correta"""
-    return hash_password(password) == hashed
+    """Verifica se a senha está correta (comparação em tempo constante)"""
+    inicio = time.perf_counter()
+    derivado = _derivar(password, hashed or '')
+    correta = derivado is not None and hmac.compare_digest(derivado[0], derivado[1])
+    tempos_login['kdf'].registrar((time.perf_counter() - inicio) * 1000)
+    return correta
+
+
+def precisa_rehash(hashed):
+    """True se o hash é legado ou foi gerado com outro KDF ou custo que o configurado"""
+    return not hashed.startswith(_prefixo_kdf())
+
+
+@lru_cache(maxsize=1)
+def _hash_ficticio():
+    """Hash usado quando o usuário não existe, para o login custar o mesmo tempo"""
+    return hash_password(os.urandom(16).hex())
 
 def get_current_user_id():
     """Retorna o ID do usuário atual da sessão"""
     return session.get('user_id')
 
 
-def criar_categorias_padrao(usuario_id):
-    """Cria categorias e subcategorias padrão para um novo usuário"""
-    conn = get_db_connection()
-    
-    # Categorias e subcategorias de receitas
-    categorias_receitas = {
+# Cadastros iniciais de todo usuário novo: por tipo, categoria -> subcategorias
+CATEGORIAS_PADRAO = {
+    'receita': {
         'Salário': ['Salário Principal', 'Décimo Terceiro', 'Férias', 'PLR'],
         'Freelance': ['Projetos', 'Consultoria', 'Trabalhos Extras'],
         'Investimentos': ['Dividendos', 'Rendimentos', 'Ganho Capital'],
         'Outros': ['Vendas', 'Reembolsos', 'Presentes']
-    }
-    
-    # Categorias e subcategorias de despesas
-    categorias_despesas = {
+    },
+    'despesa': {
         'Moradia': ['Aluguel/Financiamento', 'Condomínio', 'IPTU', 'Seguro Residencial'],
         'Alimentação': ['Supermercado', 'Restaurantes', 'Delivery', 'Lanchonetes'],
         'Transporte': ['Combustível', 'Uber/Táxi', 'Transporte Público', 'Manutenção Veículo'],
@@ -44,142 +165,124 @@ def criar_categorias_padrao(usuario_id):
         'Vestuário': ['Roupas', 'Calçados', 'Acessórios'],
         'Utilidades': ['Energia Elétrica', 'Água', 'Internet', 'Telefone', 'Gás'],
         'Outros': ['Impostos', 'Taxas', 'Diversos']
-    }
-    
-    try:
-        # Inserir categorias e subcategorias de receitas
-        for categoria_nome, subcategorias in categorias_receitas.items():
-            categoria_id = conn.execute(
-                '''INSERT INTO categoria_receita (nome, usuario_id) VALUES (?, ?)''',
-                (categoria_nome, usuario_id)
-            ).lastrowid
-            
-            for subcategoria_nome in subcategorias:
-                conn.execute(
-                    '''INSERT INTO subcategoria_receita (nome, categoria_id, usuario_id) VALUES (?, ?, ?)''',
-                    (subcategoria_nome, categoria_id, usuario_id)
-                )
-        
-        # Inserir categorias e subcategorias de despesas
-        for categoria_nome, subcategorias in categorias_despesas.items():
-            categoria_id = conn.execute(
-                '''INSERT INTO categoria_despesa (nome, usuario_id) VALUES (?, ?)''',
-                (categoria_nome, usuario_id)
-            ).lastrowid
-            
-            for subcategoria_nome in subcategorias:
-                conn.execute(
-                    '''INSERT INTO subcategoria_despesa (nome, categoria_id, usuario_id) VALUES (?, ?, ?)''',
-                    (subcategoria_nome, categoria_id, usuario_id)
-                )
-        
-        conn.commit()
-        print(f"✅ Categorias padrão criadas para usuário {usuario_id}")
-        
-    except Exception as e:
-        print(f"❌ Erro ao criar categorias padrão: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+    },
+}
 
-def criar_lancamentos_exemplo(usuario_id):
-    """Cria lançamentos de exemplo para um novo usuário"""
-    conn = get_db_connection()
-    
-    try:
-        # Obter primeira categoria e subcategoria de receita
-        categoria_receita = conn.execute(
-            'SELECT id FROM categoria_receita WHERE usuario_id = ? ORDER BY id LIMIT 1',
-            (usuario_id,)
-        ).fetchone()
-        
-        subcategoria_receita = conn.execute(
-            'SELECT id FROM subcategoria_receita WHERE usuario_id = ? ORDER BY id LIMIT 1',
-            (usuario_id,)
-        ).fetchone()
-        
-        # Obter primeira categoria e subcategoria de despesa
-        categoria_despesa = conn.execute(
-            'SELECT id FROM categoria_despesa WHERE usuario_id = ? ORDER BY id LIMIT 1',
-            (usuario_id,)
-        ).fetchone()
-        
-        subcategoria_despesa = conn.execute(
-            'SELECT id FROM subcategoria_despesa WHERE usuario_id = ? ORDER BY id LIMIT 1',
-            (usuario_id,)
-        ).fetchone()
-        
-        data_hoje = date.today().strftime('%Y-%m-%d')
-        
-        # Criar receita de exemplo (Salário)
-        if categoria_receita:
-            gerar_parcelas_receita(
-                categoria_id=categoria_receita['id'],
-                subcategoria_id=subcategoria_receita['id'] if subcategoria_receita else None,
-                data_inicio=data_hoje,
-                data_fim=None,
-                tipo_recorrencia='unica',
-                valor_parcela=5000.00,  # R$ 5.000,00
-                dia_comum=None,
-                user_id=usuario_id
-            )
-            print(f"✅ Receita de exemplo criada para usuário {usuario_id}: R$ 5.000,00")
-        
-        # Criar despesa de exemplo (Moradia)
-        if categoria_despesa:
-            gerar_parcelas_despesa(
-                categoria_id=categoria_despesa['id'],
-                subcategoria_id=subcategoria_despesa['id'] if subcategoria_despesa else None,
-                data_inicio=data_hoje,
-                data_fim=None,
-                tipo_recorrencia='unica',
-                valor_parcela=1200.00,  # R$ 1.200,00
-                dia_comum=None,
-                user_id=usuario_id
-            )
-            print(f"✅ Despesa de exemplo criada para usuário {usuario_id}: R$ 1.200,00")
-    
-    except Exception as e:
-        print(f"❌ Erro ao criar lançamentos de exemplo para usuário {usuario_id}: {e}")
-    
-    finally:
-        conn.close()
+# Lançamentos de exemplo (tipo, valor), na primeira categoria e subcategoria do tipo
+LANCAMENTOS_EXEMPLO = (('receita', 5000.00), ('despesa', 1200.00))
+
+
+def criar_categorias_padrao(conn, usuario_id):
+    """Cria as categorias e subcategorias de CATEGORIAS_PADRAO para um novo usuário.
+
+    Um executemany por tabela, na transação de quem chama (sem commit). As
+    linhas de um executemany recebem ids consecutivos dentro da transação, como
+    em inserir_parcelas, então os ids saem do último inserido. Retorna, por
+    tipo, (id da primeira categoria, id da primeira subcategoria).
+    """
+    primeiras = {}
+    for tipo, categorias in CATEGORIAS_PADRAO.items():
+        conn.executemany(
+            f'INSERT INTO categoria_{tipo} (nome, usuario_id) VALUES (?, ?)',
+            [(nome, usuario_id) for nome in categorias]
+        )
+        ultima_categoria = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        categoria_ids = range(ultima_categoria - len(categorias) + 1, ultima_categoria + 1)
+        
+        subcategorias = [
+            (nome, categoria_id, usuario_id)
+            for categoria_id, nomes in zip(categoria_ids, categorias.values())
+            for nome in nomes
+        ]
+        conn.executemany(
+            f'INSERT INTO subcategoria_{tipo} (nome, categoria_id, usuario_id) VALUES (?, ?, ?)',
+            subcategorias
+        )
+        ultima_subcategoria = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        primeiras[tipo] = (categoria_ids[0], ultima_subcategoria - len(subcategorias) + 1)
+    return primeiras
+
+def criar_lancamentos_exemplo(conn, usuario_id, primeiras):
+    """Cria os LANCAMENTOS_EXEMPLO de um novo usuário na transação de quem chama.
+
+    `primeiras` é o retorno de criar_categorias_padrao.
+    """
+    data_hoje = date.today().strftime('%Y-%m-%d')
+    for tipo, valor in LANCAMENTOS_EXEMPLO:
+        categoria_id, subcategoria_id = primeiras[tipo]
+        gerar_parcelas = gerar_parcelas_receita if tipo == 'receita' else gerar_parcelas_despesa
+        gerar_parcelas(
+            categoria_id=categoria_id,
+            subcategoria_id=subcategoria_id,
+            data_inicio=data_hoje,
+            data_fim=None,
+            tipo_recorrencia='unica',
+            valor_parcela=valor,
+            dia_comum=None,
+            user_id=usuario_id,
+            conn=conn
+        )
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     """Página de login"""
     if request.method == 'POST':
-        username = request.form['username']
-        password = request.form['password']
-        remember_me = request.form.get('remember_me') == '1'
+        inicio = time.perf_counter()
+        try:
+            return _processar_login()
+        finally:
+            tempos_login['login'].registrar((time.perf_counter() - inicio) * 1000)
+    
+    return render_template('auth/login.html')
+
+def _processar_login():
+    """POST do login: confere a senha e migra o hash para o KDF atual quando preciso"""
+    username = request.form['username']
+    password = request.form['password']
+    remember_me = request.form.get('remember_me') == '1'
+    
+    conn = get_db_connection()
+    user = conn.execute(
+        'SELECT * FROM usuario WHERE username = ? AND ativo = 1',
+        (username,)
+    ).fetchone()
+    
+    if user:
+        senha_correta = check_password(password, user['password_hash'])
+    else:
+        # Usuário inexistente paga o mesmo KDF, sem revelar pelo tempo quais existem
+        check_password(password, _hash_ficticio())
+        senha_correta = False
+    
+    if senha_correta and precisa_rehash(user['password_hash']):
+        # Migração transparente: hash legado ou de custo antigo é refeito com a senha em mãos
+        conn.execute(
+            'UPDATE usuario SET password_hash = ? WHERE id = ? AND password_hash = ?',
+            (hash_password(password), user['id'], user['password_hash'])
+        )
+        conn.commit()
+    conn.close()
+    
+    if senha_correta:
+        session['user_id'] = user['id']
+        session['username'] = user['username']
+        session['nome_completo'] = user['nome_completo']
+        
+        if remember_me:
+            # Sessão permanente por 30 dias
+            session.permanent = True
+            current_app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)
+        else:
+            # Sessão expira ao fechar o browser (ou 1h)
+            session.permanent = True
+            current_app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=1)
         
-        conn = get_db_connection()
-        user = conn.execute(
-            'SELECT * FROM usuario WHERE username = ? AND ativo = 1',
-            (username,)
-        ).fetchone()
-        conn.close()
+        flash(f'Bem-vindo, {user["nome_completo"] or user["username"]}!', 'success')
         
-        if user and check_password(password, user['password_hash']):
-            session['user_id'] = user['id']
-            session['username'] = user['username']
-            session['nome_completo'] = user['nome_completo']
-            
-            if remember_me:
-                # Sessão permanente por 30 dias
-                session.permanent = True
-                current_app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)
-            else:
-                # Sessão expira ao fechar o browser (ou 1h)
-                session.permanent = True
-                current_app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=1)
-            
-            flash(f'Bem-vindo, {user["nome_completo"] or user["username"]}!', 'success')
-            
-            next_page = request.args.get('next')
-            return redirect(next_page) if next_page else redirect(url_for('dashboard.index'))
-        else:
-            flash('Usuário ou senha incorretos', 'error')
+        next_page = request.args.get('next')
+        return redirect(next_page) if next_page else redirect(url_for('dashboard.index'))
+    else:
+        flash('Usuário ou senha incorretos', 'error')
     
     return render_template('auth/login.html')
 
@@ -227,23 +330,27 @@ def register():
             conn.close()
             return render_template('auth/register.html')
         
-        # Criar novo usuário
+        # Usuário, categorias padrão e lançamentos de exemplo numa única transação.
+        # O KDF roda antes, para não segurar o lock de escrita do banco.
         password_hash = hash_password(password)
-        cursor = conn.execute(
-            '''INSERT INTO usuario (username, password_hash, nome_completo, email)
-               VALUES (?, ?, ?, ?)''',
-            (username, password_hash, nome_completo, email)
-        )
-        usuario_id = cursor.lastrowid
-        conn.commit()
+        try:
+            cursor = conn.execute(
+                '''INSERT INTO usuario (username, password_hash, nome_completo, email)
+                   VALUES (?, ?, ?, ?)''',
+                (username, password_hash, nome_completo, email)
+            )
+            usuario_id = cursor.lastrowid
+            primeiras = criar_categorias_padrao(conn, usuario_id)
+            criar_lancamentos_exemplo(conn, usuario_id, primeiras)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            conn.close()
+            print(f"❌ Erro ao criar usuário {username}: {e}")
+            flash('Erro ao criar usuário. Tente novamente.', 'error')
+            return render_template('auth/register.html')
         conn.close()
         
-        # Criar categorias padrão para o novo usuário
-        criar_categorias_padrao(usuario_id)
-        
-        # Criar lançamentos de exemplo para o novo usuário
-        criar_lancamentos_exemplo(usuario_id)
-        
         flash('Usuário criado com sucesso! Categorias padrão e lançamentos de exemplo foram adicionados automaticamente. Faça login para continuar.', 'success')
         return redirect(url_for('auth.login'))
     
@@ -351,7 +458,11 @@ def update_profile():
 @auth_bp.route('/upload-photo', methods=['POST'])
 @login_required
 def upload_photo():
-    """Upload de foto de perfil"""
+    """Upload de foto de perfil.
+
+    Só grava o arquivo e agenda o processamento (app.fotos); a tela consulta
+    /auth/photo-status/<job_id> até a foto ficar pronta.
+    """
     try:
         if 'photo' not in request.files:
             return jsonify({'success': False, 'message': 'Nenhum arquivo enviado'})
@@ -361,7 +472,7 @@ def upload_photo():
             return jsonify({'success': False, 'message': 'Nenhum arquivo selecionado'})
         
         # Validar tipo de arquivo
-        allowed_extensions = {'png', 'jpg', 'jpeg', 'gif'}
+        allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
         if not ('.' in file.filename and 
                 file.filename.rsplit('.', 1)[1].lower() in allowed_extensions):
             return jsonify({'success': False, 'message': 'Tipo de arquivo não permitido'})
@@ -371,75 +482,53 @@ def upload_photo():
         if not username:
             return jsonify({'success': False, 'message': 'Usuário não autenticado'})
         
-        # Definir caminho do arquivo
-        upload_folder = 'app/static/img/profile_users'
-        if not os.path.exists(upload_folder):
-            os.makedirs(upload_folder)
-        
-        # Nome do arquivo será sempre o username + .jpg
-        filename = f"{username}.jpg"
-        filepath = os.path.join(upload_folder, filename)
-        
-        # Processar e salvar a imagem
+        pasta = os.path.join(current_app.static_folder, fotos.PASTA_FOTOS)
         try:
-            # Usar PIL se disponível, senão salvar diretamente
-            from PIL import Image
-            
-            # Abrir a imagem
-            img = Image.open(file.stream)
-            
-            # Converter para RGB se necessário (para garantir compatibilidade com JPEG)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                img = img.convert('RGB')
-            
-            # Redimensionar para 200x200 mantendo proporção
-            img.thumbnail((200, 200), Image.Resampling.LANCZOS)
-            
-            # Criar uma nova imagem quadrada 200x200 com fundo branco
-            new_img = Image.new('RGB', (200, 200), (255, 255, 255))
-            
-            # Calcular posição para centralizar a imagem
-            x = (200 - img.width) // 2
-            y = (200 - img.height) // 2
-            
-            # Colar a imagem redimensionada no centro
-            new_img.paste(img, (x, y))
-            
-            # Salvar como JPEG
-            new_img.save(filepath, 'JPEG', quality=85, optimize=True)
-            
-        except ImportError:
-            # Se PIL não estiver disponível, salvar o arquivo diretamente
-            file.seek(0)  # Voltar ao início do arquivo
-            file.save(filepath)
-        
-        # URL da foto para retornar
-        photo_url = url_for('static', filename=f'img/profile_users/{filename}')
+            job_id = fotos.enfileirar_foto(file, pasta, username)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)})
         
         return jsonify({
-            'success': True, 
-            'message': 'Foto atualizada com sucesso!',
-            'photo_url': photo_url
-        })
+            'success': True,
+            'status': 'processando',
+            'message': 'Foto recebida, processando...',
+            'status_url': url_for('auth.photo_status', job_id=job_id)
+        }), 202
         
     except Exception as e:
         print(f"Erro no upload de foto: {e}")
         return jsonify({'success': False, 'message': 'Erro interno do servidor'})
 
 
+@auth_bp.route('/photo-status/<job_id>')
+@login_required
+def photo_status(job_id):
+    """Estado do processamento de uma foto enviada: processando, pronta ou erro"""
+    status = fotos.status_foto(job_id, session.get('username'))
+    if status is None:
+        return jsonify({'success': False, 'status': 'erro', 'message': 'Upload não encontrado'}), 404
+    
+    resposta = {'success': status['status'] != 'erro', 'status': status['status']}
+    perfil = fotos.urls_foto(session['username'])
+    if status['status'] == 'pronta' and perfil:
+        resposta.update(
+            message='Foto atualizada com sucesso!',
+            photo_url=perfil['jpg'],
+            photo_urls={'perfil': perfil, 'avatar': fotos.urls_foto(session['username'], '_avatar')}
+        )
+    elif status['status'] == 'erro':
+        resposta['message'] = status.get('message', 'Erro ao processar a imagem')
+    return jsonify(resposta)
+
+
 @auth_bp.route('/remove-photo', methods=['POST'])
 @login_required
 def remove_photo():
-    """Remove a foto de perfil do usuário"""
+    """Remove a foto de perfil do usuário (todos os tamanhos e formatos)"""
     try:
         username = session['username']
         
-        # Caminho da foto
-        filepath = os.path.join(current_app.static_folder, 'img', 'profile_users', f'{username}.jpg')
-        
-        # Verificar se o arquivo existe e removê-lo
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        if fotos.remover_fotos(os.path.join(current_app.static_folder, fotos.PASTA_FOTOS), username):
             return jsonify({
                 'success': True, 
                 'message': 'Foto removida com sucesso!'
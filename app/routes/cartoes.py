@@ -1,9 +1,162 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
-from app.database import get_db_connection
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, make_response
+from app.database import get_db_connection, limites_mes, garantir_horizonte, geracao_usuario, cache_dashboard
 from app.routes.auth import login_required, get_current_user_id
+from datetime import date
+import hashlib
 
 cartoes_bp = Blueprint('cartoes', __name__, url_prefix='/cartoes')
 
+def montar_faturas(conn, user_id, ano, mes):
+    """Monta as faturas do mês agrupadas por instituição e cartão.
+
+    Lê apenas as despesas de cartão do mês (intervalo sargável em
+    idx_despesa_usuario_data_valor); os totais e o "todos pagos" de cada grupo vêm
+    de funções de janela, então o laço em Python só aninha as linhas.
+    Retorna (faturas_view, gastos_por_cartao_id).
+    """
+    inicio, fim = limites_mes(ano, mes)
+    rows = conn.execute('''
+        SELECT
+            d.id, d.cartao_id, d.valor, d.data_inicio, d.parcela_atual, d.numero_parcelas, d.pago,
+            c.nome_cartao,
+            c.dia_vencimento,
+            i.nome as nome_banco,
+            cat.nome as categoria_nome,
+            sub.nome as subcategoria_nome,
+            SUM(d.valor) OVER (PARTITION BY i.nome) as total_banco,
+            MIN(d.pago) OVER (PARTITION BY i.nome) as banco_pago,
+            SUM(d.valor) OVER (PARTITION BY i.nome, c.nome_cartao) as total_cartao,
+            MIN(d.pago) OVER (PARTITION BY i.nome, c.nome_cartao) as cartao_pago,
+            SUM(d.valor) OVER (PARTITION BY d.cartao_id) as total_cartao_id
+        FROM despesa d
+        JOIN cartao_credito c ON d.cartao_id = c.id
+        JOIN instituicao_financeira i ON c.instituicao_id = i.id
+        JOIN categoria_despesa cat ON d.categoria_id = cat.id
+        LEFT JOIN subcategoria_despesa sub ON d.subcategoria_id = sub.id
+        WHERE d.usuario_id = ? AND d.data_inicio >= ? AND d.data_inicio < ?
+        ORDER BY d.data_inicio DESC, d.id
+    ''', (user_id, inicio, fim)).fetchall()
+
+    faturas_view = {}
+    gastos_por_cartao_id = {}
+    for row in rows:
+        banco = row['nome_banco']
+        cartao = row['nome_cartao']
+        gastos_por_cartao_id[row['cartao_id']] = row['total_cartao_id']
+
+        dados_banco = faturas_view.get(banco)
+        if dados_banco is None:
+            dados_banco = faturas_view[banco] = {
+                'valor_total': row['total_banco'],
+                'dia_vencimento': row['dia_vencimento'],
+                'cartoes': {},
+                'todos_pagos': bool(row['banco_pago'])
+            }
+        dados_cartao = dados_banco['cartoes'].get(cartao)
+        if dados_cartao is None:
+            dados_cartao = dados_banco['cartoes'][cartao] = {
+                'valor_total': row['total_cartao'],
+                'itens': [],
+                'todos_pagos': bool(row['cartao_pago'])
+            }
+
+        descricao = row['categoria_nome']
+        if row['subcategoria_nome']:
+            descricao += f" - {row['subcategoria_nome']}"
+        dados_cartao['itens'].append({
+            'descricao': descricao,
+            'valor': row['valor'],
+            'data': row['data_inicio'],
+            'parcela_atual': row['parcela_atual'],
+            'numero_parcelas': row['numero_parcelas'],
+            'id': row['id'],
+            'pago': bool(row['pago'])
+        })
+    return faturas_view, gastos_por_cartao_id
+
+
+def bloqueado_por_cartao(conn, user_id, ano, mes, cartao_id=None):
+    """Total que consome o limite de cada cartão: {cartao_id: valor_bloqueado}.
+
+    1. Compras Parceladas: todas as parcelas não pagas e não fixas, lidas de
+       cartao_uso (mantida por triggers em despesa).
+    2. Assinaturas/Fixos/Recorrentes: apenas o valor do mês selecionado consome
+       o limite (pois são renovadas mensalmente).
+    Com `cartao_id`, calcula só aquele cartão.
+    """
+    filtro_cartao = 'AND {}.cartao_id = ?' if cartao_id is not None else ''
+    params_cartao = (cartao_id,) if cartao_id is not None else ()
+
+    bloqueado = {
+        row['cartao_id']: row['parcelado_pendente']
+        for row in conn.execute(f'''
+            SELECT u.cartao_id, u.parcelado_pendente FROM cartao_uso u
+            WHERE u.usuario_id = ? {filtro_cartao.format('u')}
+        ''', (user_id, *params_cartao))
+    }
+
+    inicio_mes, fim_mes = limites_mes(ano, mes)
+    bloqueado_recorrente = conn.execute(f'''
+        SELECT d.cartao_id, SUM(d.valor) as total
+        FROM despesa d
+        JOIN cartao_credito c ON d.cartao_id = c.id
+        WHERE d.usuario_id = ? AND d.pago = 0 AND d.cartao_id IS NOT NULL {filtro_cartao.format('d')}
+        AND (d.numero_parcelas = '1' OR d.numero_parcelas = 'x' OR d.fixo = 1)
+        AND d.data_inicio >= ? AND d.data_inicio < ?
+        GROUP BY d.cartao_id
+    ''', (user_id, *params_cartao, inicio_mes, fim_mes)).fetchall()
+    for row in bloqueado_recorrente:
+        bloqueado[row['cartao_id']] = bloqueado.get(row['cartao_id'], 0.0) + row['total']
+    return bloqueado
+
+def liberacao_limite(conn, user_id, ano, mes, cartao_id=None):
+    """Limite que cada cartão libera mês a mês, conforme as parcelas forem pagas.
+
+    Uma consulta agrupada por (cartão, mês da fatura) soma as parcelas
+    pendentes a partir de mes/ano, no mesmo intervalo de
+    idx_despesa_usuario_data_valor das faturas. O parcelado_pendente de
+    cartao_uso é o ponto de partida (o mesmo do valor_bloqueado); o que não
+    aparece nos meses são parcelas de faturas anteriores ainda não pagas
+    ('vencido'), que seguem bloqueando. Com `cartao_id`, só aquele cartão.
+    Retorna {cartao_id: {'bloqueado', 'vencido', 'meses'}}, cada mês com o
+    valor liberado, a quantidade de parcelas e o parcelado que segue bloqueado.
+    """
+    filtro_cartao = 'AND {}.cartao_id = ?' if cartao_id is not None else ''
+    params_cartao = (cartao_id,) if cartao_id is not None else ()
+
+    meses_por_cartao = {}
+    for row in conn.execute(f'''
+        SELECT d.cartao_id, substr(d.data_inicio, 1, 7) AS ano_mes, SUM(d.valor) AS liberado, COUNT(*) AS parcelas
+        FROM despesa d
+        WHERE d.usuario_id = ? AND d.data_inicio >= ? AND d.pago = 0 AND d.cartao_id IS NOT NULL {filtro_cartao.format('d')}
+          AND d.numero_parcelas != '1' AND d.numero_parcelas != 'x' AND d.fixo = 0
+        GROUP BY d.cartao_id, ano_mes
+        ORDER BY d.cartao_id, ano_mes
+    ''', (user_id, limites_mes(ano, mes)[0], *params_cartao)):
+        meses_por_cartao.setdefault(row['cartao_id'], []).append(row)
+
+    linha_do_tempo = {}
+    for row in conn.execute(f'''
+        SELECT u.cartao_id, u.parcelado_pendente FROM cartao_uso u
+        WHERE u.usuario_id = ? AND u.parcelas_pendentes > 0 {filtro_cartao.format('u')}
+    ''', (user_id, *params_cartao)):
+        restante = row['parcelado_pendente']
+        meses = []
+        for mes_row in meses_por_cartao.get(row['cartao_id'], []):
+            restante -= mes_row['liberado']
+            meses.append({
+                'ano_mes': mes_row['ano_mes'],
+                'liberado': round(mes_row['liberado'], 2),
+                'parcelas': mes_row['parcelas'],
+                'bloqueado_depois': round(max(restante, 0.0), 2),
+            })
+        linha_do_tempo[row['cartao_id']] = {
+            'bloqueado': round(row['parcelado_pendente'], 2),
+            'vencido': round(max(restante, 0.0), 2),
+            'meses': meses,
+        }
+    return linha_do_tempo
+
 @cartoes_bp.route('/')
 @login_required
 def index():
@@ -38,124 +191,21 @@ def index():
     # Filtros de Mês e Ano (Default: Atual)
     from datetime import datetime
     hoje = datetime.now()
-    mes_selecionado = request.args.get('mes', str(hoje.month))
-    ano_selecionado = request.args.get('ano', str(hoje.year))
-    filtro_vencimento = f"{ano_selecionado}-{int(mes_selecionado):02d}"
-
-    # Buscar TODAS as despesas de cartão para montar a hierarquia
-    despesas_raw = conn.execute('''
-        SELECT 
-            d.*,
-            c.nome_cartao,
-            c.dia_vencimento,
-            i.nome as nome_banco,
-            i.id as instituicao_id,
-            cat.nome as categoria_nome,
-            sub.nome as subcategoria_nome,
-            strftime('%Y-%m', d.data_inicio) as mes_compra,
-            strftime('%Y-%m', d.data_inicio) as mes_vencimento
-        FROM despesa d
-        JOIN cartao_credito c ON d.cartao_id = c.id
-        JOIN instituicao_financeira i ON c.instituicao_id = i.id
-        JOIN categoria_despesa cat ON d.categoria_id = cat.id
-        LEFT JOIN subcategoria_despesa sub ON d.subcategoria_id = sub.id
-        WHERE d.usuario_id = ?
-        ORDER BY mes_vencimento DESC, d.data_inicio DESC
-    ''', (user_id,)).fetchall()
-
-    faturas_view = {}
-    gastos_por_cartao_id = {}
+    mes_selecionado = request.args.get('mes', hoje.month, type=int)
+    ano_selecionado = request.args.get('ano', hoje.year, type=int)
+    if mes_selecionado < 1 or mes_selecionado > 12:
+        mes_selecionado = hoje.month
+    if ano_selecionado < 2000 or ano_selecionado > 2100:
+        ano_selecionado = hoje.year
     
-    for row in despesas_raw:
-        if row['mes_vencimento'] != filtro_vencimento:
-            continue
-
-        banco = row['nome_banco']
-        cartao = row['nome_cartao']
-        valor = row['valor']
-        cid = row['cartao_id']
-        
-        # Somar gastos por ID de cartão
-        gastos_por_cartao_id[cid] = gastos_por_cartao_id.get(cid, 0.0) + valor
-        
-        # Construir descrição faturas
-        descricao = row['categoria_nome']
-        if row['subcategoria_nome']:
-            descricao += f" - {row['subcategoria_nome']}"
-        
-        if banco not in faturas_view:
-            faturas_view[banco] = {
-                'valor_total': 0.0,
-                'dia_vencimento': row['dia_vencimento'],
-                'cartoes': {}
-            }
-            
-        faturas_view[banco]['valor_total'] += valor
-        
-        if cartao not in faturas_view[banco]['cartoes']:
-            faturas_view[banco]['cartoes'][cartao] = {
-                'valor_total': 0.0,
-                'itens': []
-            }
-            
-        faturas_view[banco]['cartoes'][cartao]['valor_total'] += valor
-        
-        faturas_view[banco]['cartoes'][cartao]['itens'].append({
-            'descricao': descricao,
-            'valor': valor,
-            'data': row['data_inicio'],
-            'parcela_atual': row['parcela_atual'],
-            'numero_parcelas': row['numero_parcelas'],
-            'id': row['id'],
-            'pago': bool(row['pago'])
-        })
+    # Recorrências sem data_fim precisam existir até o mês da fatura exibida
+    garantir_horizonte(conn, user_id, limites_mes(ano_selecionado, mes_selecionado)[1])
 
-    # Calcular 'todos_pagos' por cartao e por banco
-    for banco, dados_banco in faturas_view.items():
-        banco_pago = True
-        for cartao, dados_cartao in dados_banco['cartoes'].items():
-            cartao_pago = all(item['pago'] for item in dados_cartao['itens'])
-            dados_cartao['todos_pagos'] = cartao_pago
-            if not cartao_pago:
-                banco_pago = False
-        dados_banco['todos_pagos'] = banco_pago
+    # Faturas do mês: só as compras do mês selecionado, já agrupadas no SQL
+    faturas_view, gastos_por_cartao_id = montar_faturas(conn, user_id, ano_selecionado, mes_selecionado)
 
     # Calcular total bloqueado (consumo total do limite)
-    # Lógica: 
-    # 1. Compras Parceladas: Somar TODAS as parcelas que ainda não foram pagas.
-    # 2. Assinaturas/Fixos/Recorrentes: Apenas o valor do mês selecionado consome o limite (pois são renovadas mensalmente).
-    bloqueado_por_cartao_id = {}
-    
-    # Primeiro: Gastos de compras parceladas (todas as parcelas não pagas e não fixas)
-    bloqueado_parcelado = conn.execute('''
-        SELECT cartao_id, SUM(valor) as total
-        FROM despesa
-        WHERE usuario_id = ? AND pago = 0 AND cartao_id IS NOT NULL
-        AND (numero_parcelas != '1' AND numero_parcelas != 'x')
-        AND fixo = 0
-        GROUP BY cartao_id
-    ''', (user_id,)).fetchall()
-    
-    # Segundo: Gastos recorrentes, fixos ou de parcela única no mês selecionado
-    bloqueado_recorrente = conn.execute('''
-        SELECT cartao_id, SUM(valor) as total
-        FROM (
-            SELECT d.cartao_id, d.valor,
-            strftime('%Y-%m', d.data_inicio) as mes_vencimento
-            FROM despesa d
-            JOIN cartao_credito c ON d.cartao_id = c.id
-            WHERE d.usuario_id = ? AND d.pago = 0 AND d.cartao_id IS NOT NULL
-            AND (d.numero_parcelas = '1' OR d.numero_parcelas = 'x' OR d.fixo = 1)
-        )
-        WHERE mes_vencimento = ?
-        GROUP BY cartao_id
-    ''', (user_id, filtro_vencimento)).fetchall()
-
-    for row in bloqueado_parcelado:
-        bloqueado_por_cartao_id[row['cartao_id']] = row['total']
-    
-    for row in bloqueado_recorrente:
-        bloqueado_por_cartao_id[row['cartao_id']] = bloqueado_por_cartao_id.get(row['cartao_id'], 0.0) + row['total']
+    bloqueado_por_cartao_id = bloqueado_por_cartao(conn, user_id, ano_selecionado, mes_selecionado)
 
     # Agrupar cartões por Instituição e adicionar valores calculados
     cartoes_agrupados = {}
@@ -178,8 +228,8 @@ def index():
                          cartoes=cartoes_agrupados,
                          instituicoes=instituicoes,
                          faturas=faturas_view,
-                         mes_selecionado=int(mes_selecionado),
-                         ano_selecionado=int(ano_selecionado))
+                         mes_selecionado=mes_selecionado,
+                         ano_selecionado=ano_selecionado)
 
 @cartoes_bp.route('/detalhes/<int:cartao_id>')
 @login_required
@@ -203,29 +253,7 @@ def detalhes(cartao_id):
     # Recalcular estatísticas para este cartão específico (mesma lógica do index)
     from datetime import datetime
     hoje = datetime.now()
-    filtro_vencimento = f"{hoje.year}-{int(hoje.month):02d}"
-
-    # 1. Compras Parceladas Reais (Não fixas)
-    bloqueado_parcelado = conn.execute('''
-        SELECT SUM(valor) as total FROM despesa
-        WHERE usuario_id = ? AND cartao_id = ? AND pago = 0
-        AND (numero_parcelas != '1' AND numero_parcelas != 'x')
-        AND fixo = 0
-    ''', (user_id, cartao_id)).fetchone()['total'] or 0.0
-
-    # 2. Assinaturas e Fixos (Apenas Mês Atual)
-    bloqueado_recorrente = conn.execute('''
-        SELECT SUM(valor) as total FROM (
-            SELECT d.valor,
-            strftime('%Y-%m', d.data_inicio) as mes_vencimento
-            FROM despesa d
-            JOIN cartao_credito c ON d.cartao_id = c.id
-            WHERE d.usuario_id = ? AND d.cartao_id = ? AND d.pago = 0
-            AND (d.numero_parcelas = '1' OR d.numero_parcelas = 'x' OR d.fixo = 1)
-        ) WHERE mes_vencimento = ?
-    ''', (user_id, cartao_id, filtro_vencimento)).fetchone()['total'] or 0.0
-
-    valor_bloqueado = bloqueado_parcelado + bloqueado_recorrente
+    valor_bloqueado = bloqueado_por_cartao(conn, user_id, hoje.year, hoje.month, cartao_id).get(cartao_id, 0.0)
     cartao_dict = dict(cartao_row)
     cartao_dict['valor_bloqueado'] = valor_bloqueado
     cartao_dict['valor_disponivel'] = max(0.0, cartao_dict['limite_total'] - valor_bloqueado)
@@ -248,6 +276,49 @@ def detalhes(cartao_id):
         'despesas': [dict(d) for d in despesas]
     })
 
+@cartoes_bp.route('/liberacao/<int:cartao_id>')
+@login_required
+def liberacao(cartao_id):
+    """Linha do tempo em JSON do limite liberado mês a mês pelas parcelas do cartão (para gráfico).
+
+    Fica no cache por cartão e geração do usuário: qualquer escrita em
+    despesas ou no cartão gera outra chave (e outro ETag).
+    """
+    user_id = get_current_user_id()
+    conn = get_db_connection()
+
+    cartao = conn.execute('''
+        SELECT id, nome_cartao, limite_total FROM cartao_credito WHERE id = ? AND usuario_id = ?
+    ''', (cartao_id, user_id)).fetchone()
+    if not cartao:
+        conn.close()
+        return jsonify({'success': False, 'message': 'Cartão não encontrado'}), 404
+
+    hoje = date.today()
+    geracao = geracao_usuario(conn, user_id)
+    chave = f'liberacao:{user_id}:{cartao_id}:{hoje:%Y-%m}:{geracao[0]}:{geracao[1]}'
+    etag = hashlib.sha1(chave.encode('utf-8')).hexdigest()
+    if etag in request.if_none_match:
+        conn.close()
+        response = make_response('', 304)
+    else:
+        resultado = cache_dashboard.obter(chave)
+        if resultado is None:
+            linha = liberacao_limite(conn, user_id, hoje.year, hoje.month, cartao_id).get(
+                cartao_id, {'bloqueado': 0.0, 'vencido': 0.0, 'meses': []}
+            )
+            limite = cartao['limite_total'] or 0.0
+            for mes in linha['meses']:
+                # Só o parcelado: recorrentes e fixos do mês também consomem o limite
+                mes['disponivel_depois'] = round(max(0.0, limite - mes['bloqueado_depois']), 2)
+            resultado = {'success': True, 'cartao': dict(cartao), **linha}
+            cache_dashboard.gravar(chave, resultado)
+        conn.close()
+        response = jsonify(resultado)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @cartoes_bp.route('/adicionar', methods=['POST'])
 @login_required
 def adicionar():
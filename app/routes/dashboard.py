@@ -1,57 +1,210 @@
-from flask import Blueprint, render_template, request
-from app.database import get_db_connection
+from flask import Blueprint, render_template, request, session, make_response, current_app, jsonify, abort
+from app.database import (get_db_connection, limites_mes, consultar_registros, garantir_horizonte,
+                          geracao_usuario, cache_dashboard)
 from app.routes.auth import login_required, get_current_user_id
+from app.fotos import versao_foto
+from app import assets, previsao, simulacao
 from datetime import datetime, date
-import calendar
+from functools import lru_cache
+import hashlib
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+MESES_NOMES = {
+    1: 'Janeiro', 2: 'Fevereiro', 3: 'Março', 4: 'Abril',
+    5: 'Maio', 6: 'Junho', 7: 'Julho', 8: 'Agosto',
+    9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'
+}
+
+# Tendência: meses exibidos por padrão e no máximo
+TENDENCIA_MESES = 12
+TENDENCIA_MESES_MAX = 36
+
 def calcular_saldo_mes_dinamico(ano, mes, user_id):
-    """Calcula o saldo acumulado até o final de um mês específico para um usuário baseado apenas em valores pagos"""
-    from datetime import date
-    import calendar
-    
+    """Calcula o saldo acumulado até o final de um mês específico para um usuário baseado apenas em valores pagos.
+
+    Lê o saldo materializado em saldo_mensal (mantido por triggers): é o
+    saldo_acumulado do último mês com movimento até o mês pedido.
+    """
     conn = get_db_connection()
     
-    # Calcular o último dia do mês
-    ultimo_dia = date(ano, mes, calendar.monthrange(ano, mes)[1])
+    saldo = conn.execute('''
+        SELECT saldo_acumulado FROM saldo_mensal
+        WHERE usuario_id = ? AND ano_mes <= ?
+        ORDER BY ano_mes DESC LIMIT 1
+    ''', (user_id, f'{ano:04d}-{mes:02d}')).fetchone()
     
-    # Somar apenas as receitas PAGAS até o final do mês para o usuário
-    receitas = conn.execute('''
-        SELECT COALESCE(SUM(valor), 0) as total
-        FROM receita 
-        WHERE data_inicio <= ? AND usuario_id = ? AND pago = 1
-    ''', (ultimo_dia, user_id)).fetchone()
+    conn.close()
     
-    # Somar apenas as despesas PAGAS até o final do mês para o usuário
-    despesas = conn.execute('''
-        SELECT COALESCE(SUM(valor), 0) as total
-        FROM despesa 
-        WHERE data_inicio <= ? AND usuario_id = ? AND pago = 1
-    ''', (ultimo_dia, user_id)).fetchone()
+    return saldo['saldo_acumulado'] if saldo else 0
+
+def totais_por_categoria(conn, user_id, inicio, fim):
+    """Totais do período por categoria, de receitas e despesas, numa única consulta.
+
+    Lê agregado_categoria_mes (mantido por triggers), então o período vai de
+    mês inteiro a mês inteiro: `inicio` e `fim` são primeiros dias de mês, com
+    `fim` exclusivo, como os de limites_mes. Retorna (receitas_por_categoria,
+    despesas_por_categoria); cada item tem nome, total, total_pago e
+    total_pendente, ordenados por total decrescente.
+    """
+    rows = conn.execute('''
+        SELECT a.tipo, c.nome AS nome, SUM(a.total) AS total,
+               SUM(CASE WHEN a.pago = 1 THEN a.total ELSE 0 END) AS total_pago,
+               SUM(CASE WHEN a.pago = 1 THEN 0 ELSE a.total END) AS total_pendente
+        FROM agregado_categoria_mes a
+        JOIN categoria_receita c ON a.categoria_id = c.id
+        WHERE a.usuario_id = ? AND a.tipo = 'receita' AND a.ano_mes >= ? AND a.ano_mes < ?
+        GROUP BY c.nome
+        UNION ALL
+        SELECT a.tipo, c.nome, SUM(a.total),
+               SUM(CASE WHEN a.pago = 1 THEN a.total ELSE 0 END),
+               SUM(CASE WHEN a.pago = 1 THEN 0 ELSE a.total END)
+        FROM agregado_categoria_mes a
+        JOIN categoria_despesa c ON a.categoria_id = c.id
+        WHERE a.usuario_id = ? AND a.tipo = 'despesa' AND a.ano_mes >= ? AND a.ano_mes < ?
+        GROUP BY c.nome
+        ORDER BY tipo, total DESC
+    ''', (user_id, inicio[:7], fim[:7], user_id, inicio[:7], fim[:7])).fetchall()
     
-    conn.close()
+    receitas_por_categoria = [dict(r) for r in rows if r['tipo'] == 'receita']
+    despesas_por_categoria = [dict(r) for r in rows if r['tipo'] == 'despesa']
+    return receitas_por_categoria, despesas_por_categoria
+
+def meses_ate(ano, mes, meses):
+    """Os `meses` meses ('YYYY-MM') que terminam em ano/mes, do mais antigo ao mais recente"""
+    ultimo = ano * 12 + mes - 1
+    return [f'{i // 12:04d}-{i % 12 + 1:02d}' for i in range(ultimo - meses + 1, ultimo + 1)]
+
+def tendencia_mensal(conn, user_id, ano, mes, meses=TENDENCIA_MESES):
+    """Totais mês a mês dos `meses` meses até ano/mes, no geral e por categoria.
+
+    Uma consulta em agregado_categoria_mes: no máximo uma linha por mês e
+    categoria, qualquer que seja o número de lançamentos. Cada série é uma
+    lista alinhada com 'meses'; as categorias vêm por total decrescente.
+    """
+    serie = meses_ate(ano, mes, meses)
+    posicao = {ano_mes: i for i, ano_mes in enumerate(serie)}
+    rows = conn.execute('''
+        SELECT a.tipo, a.ano_mes, c.nome AS nome, SUM(a.total) AS total,
+               SUM(CASE WHEN a.pago = 1 THEN a.total ELSE 0 END) AS total_pago
+        FROM agregado_categoria_mes a
+        JOIN categoria_receita c ON a.categoria_id = c.id
+        WHERE a.usuario_id = ? AND a.tipo = 'receita' AND a.ano_mes BETWEEN ? AND ?
+        GROUP BY a.ano_mes, c.nome
+        UNION ALL
+        SELECT a.tipo, a.ano_mes, c.nome, SUM(a.total),
+               SUM(CASE WHEN a.pago = 1 THEN a.total ELSE 0 END)
+        FROM agregado_categoria_mes a
+        JOIN categoria_despesa c ON a.categoria_id = c.id
+        WHERE a.usuario_id = ? AND a.tipo = 'despesa' AND a.ano_mes BETWEEN ? AND ?
+        GROUP BY a.ano_mes, c.nome
+    ''', (user_id, serie[0], serie[-1], user_id, serie[0], serie[-1])).fetchall()
+    
+    totais = {tipo: {'total': [0.0] * meses, 'pago': [0.0] * meses} for tipo in ('receita', 'despesa')}
+    categorias = {'receita': {}, 'despesa': {}}
+    for row in rows:
+        i = posicao[row['ano_mes']]
+        totais[row['tipo']]['total'][i] += row['total']
+        totais[row['tipo']]['pago'][i] += row['total_pago']
+        categorias[row['tipo']].setdefault(row['nome'], [0.0] * meses)[i] += row['total']
     
-    saldo = receitas['total'] - despesas['total']
-    return saldo
+    def por_total(tipo):
+        ordenadas = sorted(categorias[tipo].items(), key=lambda item: -sum(item[1]))
+        return [{'nome': nome, 'totais': valores} for nome, valores in ordenadas]
+    
+    return {
+        'meses': serie,
+        'receitas': totais['receita'],
+        'despesas': totais['despesa'],
+        'saldo': [r - d for r, d in zip(totais['receita']['total'], totais['despesa']['total'])],
+        'receitas_por_categoria': por_total('receita'),
+        'despesas_por_categoria': por_total('despesa'),
+    }
 
-@dashboard_bp.route('/')
-@login_required
-def index():
-    # Obter ID do usuário logado
-    user_id = get_current_user_id()
+def resumo_ano(conn, user_id, ano):
+    """Os 12 meses de `ano` numa consulta: receitas, despesas, pagas/pendentes e saldos.
+
+    Os totais vêm de agregado_categoria_mes agrupado por mês; o saldo de
+    abertura do ano vem de saldo_mensal e o de cada mês é a soma móvel
+    (função de janela) do que foi pago nos meses anteriores. Os saldos seguem
+    o dashboard: saldo_fechamento é o saldo_atual do mês (abertura + pagos) e
+    saldo_previsto inclui os pendentes.
+    """
+    rows = conn.execute('''
+        WITH RECURSIVE numeros(mes) AS (
+            SELECT 1 UNION ALL SELECT mes + 1 FROM numeros WHERE mes < 12
+        ),
+        movimento AS (
+            SELECT ano_mes,
+                   SUM(CASE WHEN tipo = 'receita' THEN total ELSE 0 END) AS receitas,
+                   SUM(CASE WHEN tipo = 'receita' AND pago = 1 THEN total ELSE 0 END) AS receitas_pagas,
+                   SUM(CASE WHEN tipo = 'despesa' THEN total ELSE 0 END) AS despesas,
+                   SUM(CASE WHEN tipo = 'despesa' AND pago = 1 THEN total ELSE 0 END) AS despesas_pagas
+            FROM agregado_categoria_mes
+            WHERE usuario_id = ? AND tipo IN ('receita', 'despesa') AND ano_mes BETWEEN ? AND ?
+            GROUP BY ano_mes
+        ),
+        meses AS (
+            SELECT n.mes, COALESCE(m.receitas, 0) AS receitas, COALESCE(m.receitas_pagas, 0) AS receitas_pagas,
+                   COALESCE(m.despesas, 0) AS despesas, COALESCE(m.despesas_pagas, 0) AS despesas_pagas
+            FROM numeros n
+            LEFT JOIN movimento m ON m.ano_mes = printf('%04d-%02d', ?, n.mes)
+        )
+        SELECT mes, receitas, receitas_pagas, receitas - receitas_pagas AS receitas_pendentes,
+               despesas, despesas_pagas, despesas - despesas_pagas AS despesas_pendentes,
+               abertura + COALESCE(SUM(receitas_pagas - despesas_pagas) OVER anteriores, 0) AS saldo_abertura
+        FROM meses, (
+            SELECT COALESCE((
+                SELECT saldo_acumulado FROM saldo_mensal
+                WHERE usuario_id = ? AND ano_mes < ?
+                ORDER BY ano_mes DESC LIMIT 1
+            ), 0) AS abertura
+        )
+        WINDOW anteriores AS (ORDER BY mes ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING)
+        ORDER BY mes
+    ''', (user_id, f'{ano:04d}-01', f'{ano:04d}-12', ano, user_id, f'{ano:04d}-01')).fetchall()
     
-    # Obter mês e ano atual ou do parâmetro
-    now = datetime.now()
-    mes = int(request.args.get('mes', now.month))
-    ano = int(request.args.get('ano', now.year))
+    meses = []
+    for row in rows:
+        mes = dict(row)
+        mes['nome'] = MESES_NOMES[mes['mes']]
+        mes['saldo_fechamento'] = mes['saldo_abertura'] + mes['receitas_pagas'] - mes['despesas_pagas']
+        mes['saldo_previsto'] = mes['saldo_abertura'] + mes['receitas'] - mes['despesas']
+        meses.append(mes)
     
-    # Validar mês e ano
-    if mes < 1 or mes > 12:
-        mes = now.month
-    if ano < 2000 or ano > 2100:
-        ano = now.year
+    campos = ('receitas', 'receitas_pagas', 'receitas_pendentes', 'despesas', 'despesas_pagas', 'despesas_pendentes')
+    return {
+        'ano': ano,
+        'meses': meses,
+        'totais': {campo: sum(mes[campo] for mes in meses) for campo in campos},
+        'saldo_abertura': meses[0]['saldo_abertura'],
+        'saldo_fechamento': meses[-1]['saldo_fechamento'],
+    }
+
+def lancamento_saldo_anterior(categoria_nome, valor, mes_anterior, ano_anterior, primeiro_dia):
+    """Linha virtual do saldo/déficit do mês anterior (sempre considerada paga)"""
+    return {
+        'id': None,
+        'categoria_nome': categoria_nome,
+        'subcategoria_nome': f'{mes_anterior:02d}/{ano_anterior}',
+        'data_inicio': primeiro_dia.isoformat(),
+        'valor': valor,
+        'tipo_recorrencia': 'unica',
+        'numero_parcelas': '1',
+        'parcela_atual': 1,
+        'fixo': False,
+        'pago': True,
+        'virtual': True
+    }
 
+def montar_dashboard(user_id, ano, mes):
+    """Monta o contexto do dashboard de um mês.
+
+    Saldo anterior vem de saldo_mensal; totais, pagos/pendentes e quebras por
+    categoria vêm de uma única consulta agrupada, sem somar as listas em Python.
+    As recorrências do mês já devem estar materializadas (dashboard_em_cache
+    chama garantir_horizonte antes de ler a geração).
+    """
     # Calcular saldo do mês anterior
     mes_anterior = mes - 1 if mes > 1 else 12
     ano_anterior = ano if mes > 1 else ano - 1
@@ -61,152 +214,359 @@ def index():
     # Conectar ao banco
     conn = get_db_connection()
     
-    # Calcular primeiro e último dia do mês
+    # Intervalo semiaberto do mês [primeiro dia, primeiro dia do mês seguinte)
     primeiro_dia = date(ano, mes, 1)
-    ultimo_dia = date(ano, mes, calendar.monthrange(ano, mes)[1])
+    inicio, fim = limites_mes(ano, mes)
     
     # Buscar receitas do mês para o usuário
-    receitas = conn.execute('''
+    receitas = consultar_registros(conn, '''
         SELECT r.*, cr.nome as categoria_nome, 
                COALESCE(sr.nome, 'Sem subcategoria') as subcategoria_nome
         FROM receita r
         JOIN categoria_receita cr ON r.categoria_id = cr.id
         LEFT JOIN subcategoria_receita sr ON r.subcategoria_id = sr.id
-        WHERE r.data_inicio BETWEEN ? AND ? AND r.usuario_id = ?
+        WHERE r.usuario_id = ? AND r.data_inicio >= ? AND r.data_inicio < ?
         ORDER BY r.data_inicio DESC
-    ''', (primeiro_dia, ultimo_dia, user_id)).fetchall()
-    
-    # Converter para lista para poder adicionar o saldo anterior
-    receitas = list(receitas)
-    
-    # Adicionar saldo anterior como receita virtual se positivo
-    if saldo_anterior > 0:
-        receita_virtual = type('obj', (object,), {
-            'id': None,
-            'categoria_nome': 'Saldo Anterior',
-            'subcategoria_nome': f'{mes_anterior:02d}/{ano_anterior}',
-            'data_inicio': primeiro_dia.isoformat(),
-            'valor': saldo_anterior,
-            'tipo_recorrencia': 'unica',
-            'numero_parcelas': '1',
-            'parcela_atual': 1,
-            'fixo': False,
-            'pago': True,  # Saldo anterior sempre considerado como "pago"
-            'virtual': True
-        })()
-        receitas.insert(0, receita_virtual)
+    ''', (user_id, inicio, fim))
     
     # Buscar despesas do mês para o usuário
-    despesas = conn.execute('''
+    despesas = consultar_registros(conn, '''
         SELECT d.*, cd.nome as categoria_nome, 
                COALESCE(sd.nome, 'Sem subcategoria') as subcategoria_nome
         FROM despesa d
         JOIN categoria_despesa cd ON d.categoria_id = cd.id
         LEFT JOIN subcategoria_despesa sd ON d.subcategoria_id = sd.id
-        WHERE d.data_inicio BETWEEN ? AND ? AND d.usuario_id = ?
+        WHERE d.usuario_id = ? AND d.data_inicio >= ? AND d.data_inicio < ?
         ORDER BY d.data_inicio DESC
-    ''', (primeiro_dia, ultimo_dia, user_id)).fetchall()
-    
-    # Converter para lista para poder adicionar o déficit anterior
-    despesas = list(despesas)
-    
-    # Adicionar déficit anterior como despesa virtual se negativo
-    if saldo_anterior < 0:
-        despesa_virtual = type('obj', (object,), {
-            'id': None,
-            'categoria_nome': 'Déficit Anterior',
-            'subcategoria_nome': f'{mes_anterior:02d}/{ano_anterior}',
-            'data_inicio': primeiro_dia.isoformat(),
-            'valor': abs(saldo_anterior),
-            'tipo_recorrencia': 'unica',
-            'numero_parcelas': '1',
-            'parcela_atual': 1,
-            'fixo': False,
-            'pago': True,  # Déficit anterior sempre considerado como "pago"
-            'virtual': True
-        })()
-        despesas.insert(0, despesa_virtual)
-
-    # Calcular totais (incluindo saldo anterior se existir)
-    total_receitas = sum(float(r.valor if hasattr(r, 'valor') else r['valor']) for r in receitas)
-    total_despesas = sum(float(d.valor if hasattr(d, 'valor') else d['valor']) for d in despesas)
-    saldo_previsto = total_receitas - total_despesas
-    
-    # Calcular saldo atual (apenas valores pagos)
-    total_receitas_pagas = 0
-    total_receitas_pendentes = 0
-    total_despesas_pagas = 0
-    total_despesas_pendentes = 0
-    
-    for r in receitas:
-        valor = float(r.valor if hasattr(r, 'valor') else r['valor'])
-        # Receitas virtuais sempre consideradas pagas, ou receitas com pago=True
-        if (hasattr(r, 'virtual') and r.virtual) or (hasattr(r, 'pago') and r.pago) or (not hasattr(r, 'virtual') and r['pago']):
-            total_receitas_pagas += valor
-        else:
-            total_receitas_pendentes += valor
-    
-    for d in despesas:
-        valor = float(d.valor if hasattr(d, 'valor') else d['valor'])
-        # Despesas virtuais sempre consideradas pagas, ou despesas com pago=True
-        if (hasattr(d, 'virtual') and d.virtual) or (hasattr(d, 'pago') and d.pago) or (not hasattr(d, 'virtual') and d['pago']):
-            total_despesas_pagas += valor
-        else:
-            total_despesas_pendentes += valor
-    
-    saldo_atual = total_receitas_pagas - total_despesas_pagas
-    
-    # Buscar totais por categoria de receita para o usuário (excluindo virtuais)
-    receitas_por_categoria = conn.execute('''
-        SELECT cr.nome, SUM(r.valor) as total
-        FROM receita r
-        JOIN categoria_receita cr ON r.categoria_id = cr.id
-        WHERE r.data_inicio BETWEEN ? AND ? AND r.usuario_id = ?
-        GROUP BY cr.nome
-        ORDER BY total DESC
-    ''', (primeiro_dia, ultimo_dia, user_id)).fetchall()
-    
-    # Buscar totais por categoria de despesa para o usuário (excluindo virtuais)
-    despesas_por_categoria = conn.execute('''
-        SELECT cd.nome, SUM(d.valor) as total
-        FROM despesa d
-        JOIN categoria_despesa cd ON d.categoria_id = cd.id
-        WHERE d.data_inicio BETWEEN ? AND ? AND d.usuario_id = ?
-        GROUP BY cd.nome
-        ORDER BY total DESC
-    ''', (primeiro_dia, ultimo_dia, user_id)).fetchall()
+    ''', (user_id, inicio, fim))
+    
+    # Totais por categoria (excluindo virtuais), já com a parte paga
+    receitas_por_categoria, despesas_por_categoria = totais_por_categoria(conn, user_id, inicio, fim)
     
     conn.close()
     
-    # Lista de meses para navegação
-    meses_nomes = {
-        1: 'Janeiro', 2: 'Fevereiro', 3: 'Março', 4: 'Abril',
-        5: 'Maio', 6: 'Junho', 7: 'Julho', 8: 'Agosto',
-        9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'
-    }
+    total_receitas = sum(c['total'] for c in receitas_por_categoria)
+    total_receitas_pagas = sum(c['total_pago'] for c in receitas_por_categoria)
+    total_receitas_pendentes = sum(c['total_pendente'] for c in receitas_por_categoria)
+    total_despesas = sum(c['total'] for c in despesas_por_categoria)
+    total_despesas_pagas = sum(c['total_pago'] for c in despesas_por_categoria)
+    total_despesas_pendentes = sum(c['total_pendente'] for c in despesas_por_categoria)
+    
+    # Saldo anterior entra como receita (se positivo) ou despesa (se negativo) virtual, já paga
+    if saldo_anterior > 0:
+        receitas.insert(0, lancamento_saldo_anterior('Saldo Anterior', saldo_anterior, mes_anterior, ano_anterior, primeiro_dia))
+        total_receitas += saldo_anterior
+        total_receitas_pagas += saldo_anterior
+    elif saldo_anterior < 0:
+        despesas.insert(0, lancamento_saldo_anterior('Déficit Anterior', abs(saldo_anterior), mes_anterior, ano_anterior, primeiro_dia))
+        total_despesas += abs(saldo_anterior)
+        total_despesas_pagas += abs(saldo_anterior)
     
     meses = [
-        {'numero': i, 'nome': meses_nomes[i]}
+        {'numero': i, 'nome': MESES_NOMES[i]}
         for i in range(1, 13)
     ]
     
-    return render_template('dashboard/index.html',
-                         receitas=receitas,
-                         despesas=despesas,
-                         total_receitas=total_receitas,
-                         total_despesas=total_despesas,
-                         total_receitas_pagas=total_receitas_pagas,
-                         total_receitas_pendentes=total_receitas_pendentes,
-                         total_despesas_pagas=total_despesas_pagas,
-                         total_despesas_pendentes=total_despesas_pendentes,
-                         saldo_previsto=saldo_previsto,
-                         saldo_atual=saldo_atual,
-                         saldo_anterior=saldo_anterior,
-                         mes_anterior=mes_anterior,
-                         ano_anterior=ano_anterior,
-                         receitas_por_categoria=receitas_por_categoria,
-                         despesas_por_categoria=despesas_por_categoria,
-                         mes_atual=mes,
-                         ano_atual=ano,
-                         nome_mes=meses_nomes[mes],
-                         meses=meses)
+    return {
+        'receitas': receitas,
+        'despesas': despesas,
+        'total_receitas': total_receitas,
+        'total_despesas': total_despesas,
+        'total_receitas_pagas': total_receitas_pagas,
+        'total_receitas_pendentes': total_receitas_pendentes,
+        'total_despesas_pagas': total_despesas_pagas,
+        'total_despesas_pendentes': total_despesas_pendentes,
+        'saldo_previsto': total_receitas - total_despesas,
+        'saldo_atual': total_receitas_pagas - total_despesas_pagas,
+        'saldo_anterior': saldo_anterior,
+        'mes_anterior': mes_anterior,
+        'ano_anterior': ano_anterior,
+        'receitas_por_categoria': receitas_por_categoria,
+        'despesas_por_categoria': despesas_por_categoria,
+        'mes_atual': mes,
+        'ano_atual': ano,
+        'nome_mes': MESES_NOMES[mes],
+        'meses': meses,
+    }
+
+@lru_cache(maxsize=None)
+def versao_templates(pagina='dashboard/index.html'):
+    """Hash do template da página, do base.html e do build dos estáticos; um deploy que os altere muda todos os ETags"""
+    digest = hashlib.sha1()
+    for nome in ('base.html', pagina):
+        origem, _, _ = current_app.jinja_env.loader.get_source(current_app.jinja_env, nome)
+        digest.update(origem.encode('utf-8'))
+    # Um build novo dos estáticos muda os nomes com hash referenciados pela página
+    digest.update(assets.versao().encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+def etag_pagina(pagina, chave, geracao):
+    """ETag de uma página: muda com `chave`, os dados do usuário (geração), o template e o cabeçalho (sessão e foto)"""
+    chave = f"{chave}:{geracao[0]}:{geracao[1]}:{versao_templates(pagina)}:" \
+            f"{session.get('username')}:{session.get('nome_completo')}:{versao_foto(session.get('username'))}"
+    return hashlib.sha1(chave.encode('utf-8')).hexdigest()
+
+def etag_dashboard(user_id, ano, mes, geracao):
+    """ETag do dashboard de um mês"""
+    return etag_pagina('dashboard/index.html', f'{user_id}:{ano}:{mes}', geracao)
+
+def dashboard_em_cache(conn, user_id, ano, mes, geracao):
+    """Contexto do dashboard do cache por (usuário, mês, geração), montando se faltar.
+
+    Retorna (contexto, geracao). Numa falta o horizonte das recorrências é
+    garantido antes de reler a geração, para que as linhas geradas agora não
+    invalidem na hora o que vai ser guardado. Se outra escrita chegar entre a
+    leitura da geração e a montagem, o contexto guardado só fica mais novo que
+    a chave, e a próxima leitura (com a geração nova) o remonta.
+    """
+    chave = f'{user_id}:{ano}:{mes}:{geracao[0]}:{geracao[1]}'
+    contexto = cache_dashboard.obter(chave)
+    if contexto is not None:
+        return contexto, geracao
+    
+    garantir_horizonte(conn, user_id, limites_mes(ano, mes)[1])
+    geracao = geracao_usuario(conn, user_id)
+    contexto = montar_dashboard(user_id, ano, mes)
+    cache_dashboard.gravar(f'{user_id}:{ano}:{mes}:{geracao[0]}:{geracao[1]}', contexto)
+    return contexto, geracao
+
+def resumo_ano_em_cache(conn, user_id, ano, geracao):
+    """resumo_ano do cache por (usuário, ano, geração), montando se faltar"""
+    chave = f'ano:{user_id}:{ano}:{geracao[0]}:{geracao[1]}'
+    resumo = cache_dashboard.obter(chave)
+    if resumo is None:
+        resumo = resumo_ano(conn, user_id, ano)
+        cache_dashboard.gravar(chave, resumo)
+    return resumo
+
+def geracao_ano(conn, user_id, ano):
+    """Garante as recorrências até o fim do ano e retorna a geração já com elas"""
+    garantir_horizonte(conn, user_id, limites_mes(ano, 12)[1])
+    return geracao_usuario(conn, user_id)
+
+@dashboard_bp.route('/')
+@login_required
+def index():
+    # Obter ID do usuário logado
+    user_id = get_current_user_id()
+    
+    # Obter mês e ano atual ou do parâmetro
+    now = datetime.now()
+    mes = int(request.args.get('mes', now.month))
+    ano = int(request.args.get('ano', now.year))
+    
+    # Validar mês e ano
+    if mes < 1 or mes > 12:
+        mes = now.month
+    if ano < 2000 or ano > 2100:
+        ano = now.year
+
+    conn = get_db_connection()
+    geracao = geracao_usuario(conn, user_id)
+    
+    # Mesma geração que o navegador já tem: nada mudou, não consulta nem renderiza.
+    # Com mensagens flash pendentes a página precisa ser renderizada para consumi-las.
+    etag = etag_dashboard(user_id, ano, mes, geracao)
+    if '_flashes' not in session and etag in request.if_none_match:
+        conn.close()
+        response = make_response('', 304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    contexto, geracao_montada = dashboard_em_cache(conn, user_id, ano, mes, geracao)
+    conn.close()
+    if geracao_montada != geracao:
+        etag = etag_dashboard(user_id, ano, mes, geracao_montada)
+    
+    response = make_response(render_template('dashboard/index.html', **contexto))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@dashboard_bp.route('/tendencia')
+@login_required
+def tendencia():
+    """Tendência em JSON dos últimos `meses` meses até mes/ano (padrão: 12 até o mês atual)"""
+    user_id = get_current_user_id()
+    
+    now = datetime.now()
+    mes = request.args.get('mes', now.month, type=int)
+    ano = request.args.get('ano', now.year, type=int)
+    meses = request.args.get('meses', TENDENCIA_MESES, type=int)
+    if mes < 1 or mes > 12:
+        mes = now.month
+    if ano < 2000 or ano > 2100:
+        ano = now.year
+    meses = min(max(meses, 1), TENDENCIA_MESES_MAX)
+    
+    conn = get_db_connection()
+    garantir_horizonte(conn, user_id, limites_mes(ano, mes)[1])
+    
+    # Depende só dos lançamentos e dos nomes das categorias: a geração basta como ETag
+    geracao = geracao_usuario(conn, user_id)
+    etag = hashlib.sha1(f'{user_id}:{ano}:{mes}:{meses}:{geracao[0]}:{geracao[1]}'.encode('utf-8')).hexdigest()
+    if etag in request.if_none_match:
+        conn.close()
+        response = make_response('', 304)
+    else:
+        response = jsonify(tendencia_mensal(conn, user_id, ano, mes, meses))
+        conn.close()
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def ano_valido(ano):
+    if ano < 2000 or ano > 2100:
+        abort(404)
+
+@dashboard_bp.route('/ano/<int:ano>')
+@login_required
+def visao_ano(ano):
+    """Visão do ano: os 12 meses lado a lado, cada um com link para o seu dashboard"""
+    ano_valido(ano)
+    user_id = get_current_user_id()
+    
+    conn = get_db_connection()
+    geracao = geracao_ano(conn, user_id, ano)
+    etag = etag_pagina('dashboard/ano.html', f'{user_id}:{ano}', geracao)
+    if '_flashes' not in session and etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        response = make_response(render_template('dashboard/ano.html', **resumo_ano_em_cache(conn, user_id, ano, geracao)))
+    conn.close()
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@dashboard_bp.route('/ano/<int:ano>.json')
+@login_required
+def visao_ano_json(ano):
+    """Os 12 meses do ano em JSON (mesmos dados da visão do ano)"""
+    ano_valido(ano)
+    user_id = get_current_user_id()
+    
+    conn = get_db_connection()
+    geracao = geracao_ano(conn, user_id, ano)
+    etag = hashlib.sha1(f'ano:{user_id}:{ano}:{geracao[0]}:{geracao[1]}'.encode('utf-8')).hexdigest()
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        response = jsonify(resumo_ano_em_cache(conn, user_id, ano, geracao))
+    conn.close()
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def previsao_em_cache(conn, user_id, meses):
+    """Previsão do saldo do cache por (usuário, dia, meses, geração), calculando se faltar.
+
+    Retorna (previsao, geracao). O dia entra na chave porque a projeção parte
+    de hoje.
+    """
+    garantir_horizonte(conn, user_id)
+    geracao = geracao_usuario(conn, user_id)
+    hoje = date.today()
+    chave = f'previsao:{user_id}:{hoje.isoformat()}:{meses}:{geracao[0]}:{geracao[1]}'
+    resultado = cache_dashboard.obter(chave)
+    if resultado is None:
+        saldo_inicial = calcular_saldo_mes_dinamico(hoje.year, hoje.month, user_id)
+        resultado = previsao.projetar_saldo(conn, user_id, saldo_inicial, meses, hoje)
+        cache_dashboard.gravar(chave, resultado)
+    return resultado, geracao
+
+def meses_previsao():
+    meses = request.args.get('meses', previsao.PREVISAO_MESES, type=int)
+    return min(max(meses, 1), previsao.PREVISAO_MESES_MAX)
+
+@dashboard_bp.route('/previsao')
+@login_required
+def visao_previsao():
+    """Gráfico do saldo previsto dia a dia para os próximos meses"""
+    user_id = get_current_user_id()
+    meses = meses_previsao()
+    if not previsao.DISPONIVEL:
+        return render_template('dashboard/previsao.html', disponivel=False, meses=meses)
+    
+    conn = get_db_connection()
+    resultado, _ = previsao_em_cache(conn, user_id, meses)
+    conn.close()
+    pontos, zero = previsao.pontos_grafico(resultado)
+    return render_template('dashboard/previsao.html', disponivel=True, meses=meses,
+                           previsao=resultado, pontos=pontos, zero=zero)
+
+@dashboard_bp.route('/previsao.json')
+@login_required
+def visao_previsao_json():
+    """Saldo previsto dia a dia em JSON (?meses=, padrão 12, máximo 60)"""
+    if not previsao.DISPONIVEL:
+        return jsonify({'success': False, 'message': 'Previsão indisponível: instale o numpy'}), 503
+    user_id = get_current_user_id()
+    meses = meses_previsao()
+    
+    conn = get_db_connection()
+    resultado, geracao = previsao_em_cache(conn, user_id, meses)
+    conn.close()
+    
+    etag = hashlib.sha1(f"previsao:{user_id}:{resultado['inicio']}:{meses}:{geracao[0]}:{geracao[1]}".encode('utf-8')).hexdigest()
+    response = make_response('', 304) if etag in request.if_none_match else jsonify(resultado)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def base_simulacao_em_cache(conn, user_id, cartao_id, hoje):
+    """Base da simulação do cartão (simulacao.base_cartao com os saldos previstos) do cache.
+
+    A chave leva o mês atual e a geração: a base só muda quando os dados
+    mudam, então cada tecla do formulário só faz a sobreposição em memória.
+    Retorna None se o cartão não for do usuário.
+    """
+    janela = simulacao.ano_meses(hoje.year, hoje.month, simulacao.SIMULACAO_MESES)
+    ultimo_ano = int(janela[-1][:4])
+    geracao = geracao_ano(conn, user_id, ultimo_ano)
+    chave = f'simulacao:{user_id}:{cartao_id}:{janela[0]}:{geracao[0]}:{geracao[1]}'
+    base = cache_dashboard.obter(chave)
+    if base is None:
+        base = simulacao.base_cartao(conn, user_id, cartao_id, hoje.year, hoje.month)
+        if base is None:
+            return None
+        resumos = [resumo_ano_em_cache(conn, user_id, ano, geracao) for ano in range(hoje.year, ultimo_ano + 1)]
+        simulacao.incluir_saldos(base, resumos)
+        cache_dashboard.gravar(chave, base)
+    return base
+
+@dashboard_bp.route('/simulacao')
+@login_required
+def simular_compra():
+    """Efeito de uma compra parcelada nas faturas, no limite do cartão e no saldo, sem gravar nada.
+
+    Recebe os campos do formulário de despesa: cartao_id, valor_total_bem,
+    qtd_parcelas_input e mes_primeira_fatura (YYYY-MM).
+    """
+    user_id = get_current_user_id()
+    valor_total = request.args.get('valor_total_bem', '')
+    try:
+        # Converter valor: se tem vírgula, tratar como separador decimal brasileiro
+        if ',' in valor_total:
+            valor_total = valor_total.replace('.', '').replace(',', '.')
+        valor_total = float(valor_total)
+        parcelas = int(request.args.get('qtd_parcelas_input', ''))
+        cartao_id = int(request.args.get('cartao_id', ''))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Valores inválidos para compra parcelada.'}), 400
+    if valor_total <= 0 or not 1 < parcelas <= simulacao.SIMULACAO_PARCELAS_MAX:
+        return jsonify({'success': False, 'message': f'Informe um valor positivo e de 2 a {simulacao.SIMULACAO_PARCELAS_MAX} parcelas.'}), 400
+    
+    conn = get_db_connection()
+    base = base_simulacao_em_cache(conn, user_id, cartao_id, date.today())
+    conn.close()
+    if base is None:
+        return jsonify({'success': False, 'message': 'Cartão não encontrado'}), 404
+    
+    try:
+        parcelas_compra = simulacao.parcelas_compra(
+            base['cartao']['dia_vencimento'], valor_total, parcelas, request.args.get('mes_primeira_fatura', '')
+        )
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Mês da 1ª fatura inválido.'}), 400
+    return jsonify({'success': True, **simulacao.simular_compra(base, parcelas_compra)})
@@ -1,5 +1,5 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
-from app.database import get_db_connection, get_categorias_despesas, get_subcategorias_despesas, gerar_parcelas_despesa, get_cartoes_credito
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, get_template_attribute
+from app.database import get_db_connection, get_categorias_despesas, get_subcategorias_despesas, gerar_parcelas_despesa, get_cartoes_credito, filtro_periodo, limites_mes, pagina_keyset, ler_por_pagina, POR_PAGINA_PADRAO, garantir_horizonte, janela_visualizada, atualizar_serie, excluir_serie, periodo_compra_parcelada
 from app.routes.auth import login_required, get_current_user_id
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
@@ -16,7 +16,7 @@ def toggle_pagamento(id):
     try:
         # Verificar se a despesa pertence ao usuário
         despesa = conn.execute(
-            'SELECT pago FROM despesa WHERE id = ? AND usuario_id = ?', 
+            'SELECT pago, fatura_id FROM despesa WHERE id = ? AND usuario_id = ?', 
             (id, user_id)
         ).fetchone()
         
@@ -30,38 +30,14 @@ def toggle_pagamento(id):
         pagar_fatura = request.json.get('pagar_fatura') if request.json else False
         
         if pagar_fatura:
-            # Buscar info para atualizar tudo da mesma instituição e mês
-            dados_cartao = conn.execute('''
-                SELECT c.instituicao_id, d.data_inicio
-                FROM despesa d
-                JOIN cartao_credito c ON d.cartao_id = c.id
-                WHERE d.id = ?
-            ''', (id,)).fetchone()
-            
-            if dados_cartao:
-                vencimento = datetime.strptime(dados_cartao['data_inicio'], '%Y-%m-%d')
-                
-                rows = conn.execute('''
-                    UPDATE despesa 
-                    SET pago = ?
-                    WHERE id IN (
-                        SELECT d2.id 
-                        FROM despesa d2
-                        JOIN cartao_credito c2 ON d2.cartao_id = c2.id
-                        WHERE d2.usuario_id = ?
-                        AND c2.instituicao_id = ?
-                        AND strftime('%m', d2.data_inicio) = ? 
-                        AND strftime('%Y', d2.data_inicio) = ?
-                        AND d2.pago = ?
-                    )
-                ''', (
-                    novo_status,
-                    user_id, 
-                    dados_cartao['instituicao_id'], 
-                    f'{vencimento.month:02d}', 
-                    str(vencimento.year),
-                    not novo_status
-                ))
+            # Quitar/reabrir a fatura inteira (mesma instituição e mês de vencimento)
+            if despesa['fatura_id']:
+                # Só os itens com o status anterior; totais e status da fatura
+                # são ajustados pelas triggers
+                rows = conn.execute(
+                    'UPDATE despesa SET pago = ? WHERE fatura_id = ? AND pago = ?',
+                    (novo_status, despesa['fatura_id'], not novo_status)
+                )
                 
                 msg = f'Fatura {"paga" if novo_status else "reaberta"} com sucesso! ({rows.rowcount} itens atualizados)'
                 
@@ -100,63 +76,41 @@ def check_fatura(id):
     conn = get_db_connection()
     
     try:
-        # Buscar dados da despesa e do cartão
+        # Dados da despesa e totais da fatura dela (mantidos por triggers)
         despesa = conn.execute('''
-            SELECT d.*, c.instituicao_id, c.nome_cartao, i.nome as instituicao_nome 
+            SELECT d.valor, d.pago, f.referencia, f.itens, f.total, f.itens_pagos, f.total_pago,
+                   i.nome as instituicao_nome
             FROM despesa d
-            LEFT JOIN cartao_credito c ON d.cartao_id = c.id
-            LEFT JOIN instituicao_financeira i ON c.instituicao_id = i.id
+            JOIN fatura f ON d.fatura_id = f.id
+            JOIN instituicao_financeira i ON f.instituicao_id = i.id
             WHERE d.id = ? AND d.usuario_id = ?
         ''', (id, user_id)).fetchone()
         
-        if not despesa or not despesa['cartao_id']:
-            conn.close()
+        conn.close()
+        
+        if not despesa:
             return jsonify({'is_cartao': False})
 
-        # Data de vencimento (data_inicio)
-        vencimento = datetime.strptime(despesa['data_inicio'], '%Y-%m-%d')
-        mes = vencimento.month
-        ano = vencimento.year
-        
-        status_atual = despesa['pago']
-        
-        # Buscar outras despesas da MESMA INSTITUIÇÃO e MESMO MÊS DE VENCIMENTO com MESMO STATUS
+        # Outras despesas da MESMA INSTITUIÇÃO e MESMO MÊS DE VENCIMENTO com MESMO STATUS
         # Nota: A despesa pode ser de cartões DIFERENTES, mas da MESMA INSTITUIÇÃO (ex: 2 Nubanks virtuais)
+        if despesa['pago']:
+            qtd_mesmo_status = despesa['itens_pagos']
+            total_mesmo_status = despesa['total_pago']
+        else:
+            qtd_mesmo_status = despesa['itens'] - despesa['itens_pagos']
+            total_mesmo_status = despesa['total'] - despesa['total_pago']
         
-        query = '''
-            SELECT COUNT(*) as qtd, SUM(d.valor) as total
-            FROM despesa d
-            JOIN cartao_credito c ON d.cartao_id = c.id
-            WHERE d.usuario_id = ? 
-              AND c.instituicao_id = ? 
-              AND strftime('%m', d.data_inicio) = ? 
-              AND strftime('%Y', d.data_inicio) = ?
-              AND d.pago = ?
-              AND d.id != ?
-        '''
-        
-        resultado = conn.execute(query, (
-            user_id, 
-            despesa['instituicao_id'], 
-            f'{mes:02d}', 
-            str(ano), 
-            status_atual,
-            id
-        )).fetchone()
-        
-        qtd_pendentes = resultado['qtd']
-        valor_pendente = resultado['total'] or 0
-        
-        conn.close()
+        qtd_pendentes = qtd_mesmo_status - 1
         
         if qtd_pendentes > 0:
+            ano, mes = despesa['referencia'].split('-')
             return jsonify({
                 'is_cartao': True,
                 'tem_outras_pendentes': True,
                 'qtd': qtd_pendentes,
-                'valor_total': valor_pendente + despesa['valor'], # Soma a atual também para contexto
+                'valor_total': round(total_mesmo_status, 2), # Inclui a atual também para contexto
                 'instituicao_nome': despesa['instituicao_nome'],
-                'mes_referencia': f"{mes:02d}/{ano}"
+                'mes_referencia': f"{mes}/{ano}"
             })
             
         return jsonify({'is_cartao': True, 'tem_outras_pendentes': False})
@@ -165,17 +119,16 @@ def check_fatura(id):
         conn.close()
         return jsonify({'error': str(e)}), 500
 
-@despesas_bp.route('/')
-@login_required
-def index():
-    user_id = get_current_user_id()
-    conn = get_db_connection()
-    
-    # Obter parâmetros de filtro
-    categoria = request.args.get('categoria')
-    subcategoria = request.args.get('subcategoria')
-    mes = request.args.get('mes')
-    ano = request.args.get('ano')
+def filtros_listagem(conn, user_id, args):
+    """Lê os filtros da listagem na query string.
+
+    Retorna (mes, ano, where, params), com `where` pronto para seguir o WHERE
+    de uma consulta sobre `despesa d`.
+    """
+    categoria = args.get('categoria')
+    subcategoria = args.get('subcategoria')
+    mes = args.get('mes')
+    ano = args.get('ano')
 
     # Default para o mês atual se não houver filtros de data (primeiro acesso)
     if mes is None and ano is None:
@@ -183,87 +136,102 @@ def index():
         mes = str(hoje.month)
         ano = str(hoje.year)
     
-    # Construir query com filtros
-    query = '''
-        SELECT d.*, cd.nome as categoria_nome, sd.nome as subcategoria_nome,
-               cc.nome_cartao as cartao_nome, cc.ultimos_digitos as cartao_digitos
-        FROM despesa d
-        JOIN categoria_despesa cd ON d.categoria_id = cd.id
-        LEFT JOIN subcategoria_despesa sd ON d.subcategoria_id = sd.id
-        LEFT JOIN cartao_credito cc ON d.cartao_id = cc.id
-        WHERE d.usuario_id = ?
-    '''
-    
+    where = 'd.usuario_id = ?'
     params = [user_id]
     
     if categoria:
-        query += " AND d.categoria_id = ?"
+        where += " AND d.categoria_id = ?"
         params.append(categoria)
     
     if subcategoria:
-        query += " AND d.subcategoria_id = ?"
+        where += " AND d.subcategoria_id = ?"
         params.append(subcategoria)
     
-    if mes:
-        query += " AND strftime('%m', d.data_inicio) = ?"
-        params.append(f"{int(mes):02d}")
+    # Filtro de período sargável (usa o índice usuario_id + data_inicio)
+    filtro_data, params_data = filtro_periodo(conn, 'despesa', 'd', user_id, mes, ano)
+    if filtro_data:
+        where += f" AND {filtro_data}"
+        params.extend(params_data)
     
-    if ano:
-        query += " AND strftime('%Y', d.data_inicio) = ?"
-        params.append(str(ano))
+    return mes, ano, where, params
+
+def pagina_despesas(conn, where, params, cursor=None, por_pagina=POR_PAGINA_PADRAO):
+    """Uma página da listagem como Registro (datas convertidas sob demanda). Retorna (despesas, proximo_cursor)"""
+    query = f'''
+        SELECT d.*, cd.nome as categoria_nome, sd.nome as subcategoria_nome,
+               cc.nome_cartao as cartao_nome, cc.ultimos_digitos as cartao_digitos
+        FROM despesa d
+        JOIN categoria_despesa cd ON d.categoria_id = cd.id
+        LEFT JOIN subcategoria_despesa sd ON d.subcategoria_id = sd.id
+        LEFT JOIN cartao_credito cc ON d.cartao_id = cc.id
+        WHERE {where}
+    '''
     
-    query += " ORDER BY d.data_inicio DESC"
+    return pagina_keyset(conn, query, params, 'd', cursor, por_pagina)
+
+@despesas_bp.route('/')
+@login_required
+def index():
+    user_id = get_current_user_id()
+    conn = get_db_connection()
     
-    despesas = conn.execute(query, params).fetchall()
+    mes, ano, where, params = filtros_listagem(conn, user_id, request.args)
+    por_pagina = ler_por_pagina(request.args.get('por_pagina'))
     
-    # Converter Row objects para dicionários e converter datas
-    despesas_formatadas = []
-    total_valor = 0
-    maior_valor = 0
+    # Recorrências sem data_fim precisam existir até o fim do período filtrado
+    garantir_horizonte(conn, user_id, janela_visualizada(mes, ano))
     
-    for despesa in despesas:
-        despesa_dict = dict(despesa)
-        if despesa_dict['data_inicio']:
-            try:
-                despesa_dict['data_inicio'] = datetime.strptime(despesa_dict['data_inicio'], '%Y-%m-%d')
-            except:
-                despesa_dict['data_inicio'] = None
-        if despesa_dict.get('data_fim'):
-            try:
-                despesa_dict['data_fim'] = datetime.strptime(despesa_dict['data_fim'], '%Y-%m-%d')
-            except:
-                despesa_dict['data_fim'] = None
-        
-        # Calcular estatísticas
-        valor = float(despesa_dict.get('valor', 0))
-        total_valor += valor
-        if valor > maior_valor:
-            maior_valor = valor
-            
-        despesas_formatadas.append(type('obj', (object,), despesa_dict))
+    # Estatísticas sobre todo o filtro, agregadas no SQL (independem da página)
+    estatisticas = dict(conn.execute(f'''
+        SELECT COUNT(*) as total,
+               COALESCE(SUM(d.valor), 0) as valor_total,
+               COALESCE(AVG(d.valor), 0) as media_valor,
+               COALESCE(MAX(d.valor), 0) as maior_valor
+        FROM despesa d
+        JOIN categoria_despesa cd ON d.categoria_id = cd.id
+        WHERE {where}
+    ''', params).fetchone())
     
-    # Calcular média
-    media_valor = total_valor / len(despesas_formatadas) if despesas_formatadas else 0
+    despesas, proximo_cursor = pagina_despesas(conn, where, params, request.args.get('cursor'), por_pagina)
     
     # Obter categorias para o filtro
     categorias = get_categorias_despesas(usuario_id=user_id)
     
-    # Preparar estatísticas
-    estatisticas = {
-        'total': len(despesas_formatadas),
-        'valor_total': total_valor,
-        'media_valor': media_valor,
-        'maior_valor': maior_valor
-    }
-    
     conn.close()
     return render_template('despesas/index.html', 
-                           despesas=despesas_formatadas, 
+                           despesas=despesas, 
                            categorias=categorias, 
                            stats=estatisticas,
+                           proximo_cursor=proximo_cursor,
+                           por_pagina=por_pagina,
                            mes_selecionado=mes,
                            ano_selecionado=ano)
 
+@despesas_bp.route('/mais')
+@login_required
+def carregar_mais():
+    """Próxima página da listagem (botão "Carregar mais"), em JSON.
+
+    Recebe os mesmos filtros de index() mais o `cursor` devolvido pela página
+    anterior; as linhas vêm prontas em HTML para a tabela e para os cards.
+    """
+    user_id = get_current_user_id()
+    conn = get_db_connection()
+    
+    _, _, where, params = filtros_listagem(conn, user_id, request.args)
+    por_pagina = ler_por_pagina(request.args.get('por_pagina'))
+    despesas, proximo_cursor = pagina_despesas(conn, where, params, request.args.get('cursor'), por_pagina)
+    conn.close()
+    
+    linha_tabela = get_template_attribute('despesas/_itens.html', 'linha_tabela')
+    card_mobile = get_template_attribute('despesas/_itens.html', 'card_mobile')
+    return jsonify({
+        'quantidade': len(despesas),
+        'html_tabela': ''.join(linha_tabela(d) for d in despesas),
+        'html_cards': ''.join(card_mobile(d) for d in despesas),
+        'proximo_cursor': proximo_cursor
+    })
+
 @despesas_bp.route('/nova', methods=['GET', 'POST'])
 @login_required
 def nova():
@@ -325,22 +293,8 @@ def nova():
                     flash('Cartão não encontrado.', 'error')
                     return redirect(url_for('despesas.nova'))
                     
-                dia_vencimento = cartao['dia_vencimento']
-                ano_fatura, mes_fatura = map(int, mes_primeira_fatura.split('-'))
-                
-                try:
-                    data_inicio_obj = datetime(ano_fatura, mes_fatura, dia_vencimento).date()
-                except ValueError:
-                    # Caso dia de vencimento (ex: 31) não exista no mês, pega o último dia
-                    ultimo_dia = (datetime(ano_fatura, mes_fatura, 1) + relativedelta(months=1) - relativedelta(days=1)).day
-                    data_inicio_obj = datetime(ano_fatura, mes_fatura, ultimo_dia).date()
-                
-                data_inicio = data_inicio_obj.strftime('%Y-%m-%d')
-                
-                # Calcular Data de Fim para gerar exatamente X parcelas
-                # data_fim = data_inicio + (qtd - 1) meses
-                data_fim_obj = data_inicio_obj + relativedelta(months=qtd_parcelas - 1)
-                data_fim = data_fim_obj.strftime('%Y-%m-%d')
+                # 1ª parcela no vencimento do cartão no mês da 1ª fatura, uma por mês
+                data_inicio, data_fim = periodo_compra_parcelada(cartao['dia_vencimento'], mes_primeira_fatura, qtd_parcelas)
                 
                 flash(f'Compra parcelada configurada: 1ª parc. em {data_inicio} (Total: {qtd_parcelas}x)', 'info')
                 
@@ -425,15 +379,18 @@ def nova():
                         flash(f'Despesa atualizada para vencimento do cartão: {data_inicio}', 'info')
         
         # Gerar parcelas
+        conn = get_db_connection()
         try:
             despesa_pai_id = gerar_parcelas_despesa(
                 categoria_id, subcategoria_id, data_inicio, data_fim, 
                 tipo_recorrencia, valor_parcela, dia_comum, user_id, fixo,
-                cartao_id=cartao_id
+                cartao_id=cartao_id, conn=conn
             )
+            conn.commit()
             flash('Despesa cadastrada com sucesso!', 'success')
             return redirect(url_for('despesas.index'))
         except Exception as e:
+            conn.rollback()
             flash(f'Erro ao cadastrar despesa: {str(e)}', 'error')
     
     categorias = get_categorias_despesas(usuario_id=user_id)
@@ -572,50 +529,26 @@ def editar(id):
                     # O risco de corromper dados existentes é alto.
                     pass 
 
+            # Edição em lote: parcelas seguintes da mesma série (antes de mover a atual,
+            # para que a nova data dela não a inclua entre as "seguintes")
+            futuras = 0
+            if scope == 'future' and despesa_antiga and despesa_antiga['serie_id']:
+                futuras = atualizar_serie(conn, 'despesa', despesa_antiga['serie_id'], user_id, despesa_antiga['data_inicio'], {
+                    'categoria_id': categoria_id,
+                    'subcategoria_id': subcategoria_id,
+                    'valor': valor,
+                    'fixo': fixo,
+                    'cartao_id': cartao_id
+                }, delta_days)
+            
             conn.execute('''
                 UPDATE despesa 
                 SET categoria_id = ?, subcategoria_id = ?, data_inicio = ?, valor = ?, fixo = ?, cartao_id = ?
                 WHERE id = ?
             ''', (categoria_id, subcategoria_id, data_inicio, valor, fixo, cartao_id, id))
             
-            # Edição em Lote (apenas se solicitado e possível)
-            # Edição em Lote (apenas se solicitado e possível)
-            if scope == 'future' and despesa_antiga and despesa_antiga['tipo_recorrencia'] != 'unica':
-                # Construir query dinamicamente para incluir ajuste de data se necessário
-                sql = '''UPDATE despesa SET categoria_id = ?, subcategoria_id = ?, valor = ?, fixo = ?, cartao_id = ?'''
-                params = [categoria_id, subcategoria_id, valor, fixo, cartao_id]
-                
-                if delta_days != 0:
-                    sql += ", data_inicio = date(data_inicio, ?)"
-                    params.append(f'{delta_days:+} days')
-                
-                sql += '''
-                    WHERE usuario_id = ?
-                      AND categoria_id = ? 
-                      AND (subcategoria_id = ? OR (subcategoria_id IS NULL AND ? IS NULL))
-                      AND tipo_recorrencia = ? 
-                      AND valor = ?
-                      AND data_inicio > ?
-                      AND datetime(created_at) BETWEEN datetime(?, '-120 seconds') AND datetime(?, '+120 seconds')
-                '''
-                
-                params.extend([
-                    user_id,
-                    despesa_antiga['categoria_id'], 
-                    despesa_antiga['subcategoria_id'], despesa_antiga['subcategoria_id'],
-                    despesa_antiga['tipo_recorrencia'],
-                    despesa_antiga['valor'],
-                    despesa_antiga['data_inicio'],
-                    despesa_antiga['created_at'], despesa_antiga['created_at']
-                ])
-                
-                conn.execute(sql, params)
-                
-                alteradas = conn.total_changes
-                if alteradas > 1:
-                    flash(f'Despesa atual e {alteradas-1} futuras foram atualizadas!', 'success')
-                else:
-                    flash('Despesa atualizada com sucesso!', 'success')
+            if futuras:
+                flash(f'Despesa atual e {futuras} futuras foram atualizadas!', 'success')
             else:
                 flash('Despesa atualizada com sucesso!', 'success')
             
@@ -656,30 +589,11 @@ def excluir(id):
         scope = request.form.get('scope')
         
         if scope == 'future':
-            # Buscar dados da despesa original para encontrar correlatas
-            despesa = conn.execute('SELECT * FROM despesa WHERE id = ?', (id,)).fetchone()
+            despesa = conn.execute('SELECT serie_id, data_inicio FROM despesa WHERE id = ? AND usuario_id = ?', (id, user_id)).fetchone()
             
-            if despesa and despesa['tipo_recorrencia'] != 'unica':
-                # Excluir esta e as futuras com base em similaridade e data de criação (lote)
-                # Janela de 2 minutos no created_at para pegar o lote gerado junto
-                conn.execute('''
-                    DELETE FROM despesa 
-                    WHERE usuario_id = ?
-                      AND categoria_id = ? 
-                      AND (subcategoria_id = ? OR (subcategoria_id IS NULL AND ? IS NULL))
-                      AND tipo_recorrencia = ? 
-                      AND valor = ?
-                      AND data_inicio >= ?
-                      AND datetime(created_at) BETWEEN datetime(?, '-120 seconds') AND datetime(?, '+120 seconds')
-                ''', (
-                    user_id,
-                    despesa['categoria_id'], 
-                    despesa['subcategoria_id'], despesa['subcategoria_id'],
-                    despesa['tipo_recorrencia'],
-                    despesa['valor'],
-                    despesa['data_inicio'],
-                    despesa['created_at'], despesa['created_at']
-                ))
+            if despesa and despesa['serie_id']:
+                # Excluir esta e as próximas parcelas da mesma série
+                excluir_serie(conn, 'despesa', despesa['serie_id'], user_id, despesa['data_inicio'])
                 flash('Esta e as próximas despesas da série foram excluídas!', 'success')
             else:
                  # Fallback se não for recorrente ou não achar
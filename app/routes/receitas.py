@@ -1,5 +1,5 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
-from app.database import get_db_connection, get_categorias_receitas, get_subcategorias_receitas, gerar_parcelas_receita
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, get_template_attribute
+from app.database import get_db_connection, get_categorias_receitas, get_subcategorias_receitas, gerar_parcelas_receita, filtro_periodo, pagina_keyset, ler_por_pagina, POR_PAGINA_PADRAO, garantir_horizonte, janela_visualizada
 from app.routes.auth import login_required, get_current_user_id
 from datetime import datetime
 
@@ -41,17 +41,16 @@ def toggle_pagamento(id):
         conn.close()
         return jsonify({'success': False, 'message': str(e)}), 500
 
-@receitas_bp.route('/')
-@login_required
-def index():
-    user_id = get_current_user_id()
-    conn = get_db_connection()
-    
-    # Obter parâmetros de filtro
-    categoria = request.args.get('categoria')
-    subcategoria = request.args.get('subcategoria')
-    mes = request.args.get('mes')
-    ano = request.args.get('ano')
+def filtros_listagem(conn, user_id, args):
+    """Lê os filtros da listagem na query string.
+
+    Retorna (mes, ano, where, params), com `where` pronto para seguir o WHERE
+    de uma consulta sobre `receita r`.
+    """
+    categoria = args.get('categoria')
+    subcategoria = args.get('subcategoria')
+    mes = args.get('mes')
+    ano = args.get('ano')
 
     # Default para o mês atual se não houver filtros de data (primeiro acesso)
     if mes is None and ano is None:
@@ -59,85 +58,100 @@ def index():
         mes = str(hoje.month)
         ano = str(hoje.year)
     
-    # Construir query com filtros
-    query = '''
-        SELECT r.*, cr.nome as categoria_nome, sr.nome as subcategoria_nome
-        FROM receita r
-        JOIN categoria_receita cr ON r.categoria_id = cr.id
-        LEFT JOIN subcategoria_receita sr ON r.subcategoria_id = sr.id
-        WHERE r.usuario_id = ?
-    '''
-    
+    where = 'r.usuario_id = ?'
     params = [user_id]
     
     if categoria:
-        query += " AND r.categoria_id = ?"
+        where += " AND r.categoria_id = ?"
         params.append(categoria)
     
     if subcategoria:
-        query += " AND r.subcategoria_id = ?"
+        where += " AND r.subcategoria_id = ?"
         params.append(subcategoria)
     
-    if mes:
-        query += " AND strftime('%m', r.data_inicio) = ?"
-        params.append(f"{int(mes):02d}")
+    # Filtro de período sargável (usa o índice usuario_id + data_inicio)
+    filtro_data, params_data = filtro_periodo(conn, 'receita', 'r', user_id, mes, ano)
+    if filtro_data:
+        where += f" AND {filtro_data}"
+        params.extend(params_data)
     
-    if ano:
-        query += " AND strftime('%Y', r.data_inicio) = ?"
-        params.append(str(ano))
+    return mes, ano, where, params
+
+def pagina_receitas(conn, where, params, cursor=None, por_pagina=POR_PAGINA_PADRAO):
+    """Uma página da listagem como Registro (datas convertidas sob demanda). Retorna (receitas, proximo_cursor)"""
+    query = f'''
+        SELECT r.*, cr.nome as categoria_nome, sr.nome as subcategoria_nome
+        FROM receita r
+        JOIN categoria_receita cr ON r.categoria_id = cr.id
+        LEFT JOIN subcategoria_receita sr ON r.subcategoria_id = sr.id
+        WHERE {where}
+    '''
     
-    query += " ORDER BY r.data_inicio DESC"
+    return pagina_keyset(conn, query, params, 'r', cursor, por_pagina)
+
+@receitas_bp.route('/')
+@login_required
+def index():
+    user_id = get_current_user_id()
+    conn = get_db_connection()
     
-    receitas = conn.execute(query, params).fetchall()
+    mes, ano, where, params = filtros_listagem(conn, user_id, request.args)
+    por_pagina = ler_por_pagina(request.args.get('por_pagina'))
     
-    # Converter Row objects para dicionários e converter datas
-    receitas_formatadas = []
-    total_valor = 0
-    maior_valor = 0
+    # Recorrências sem data_fim precisam existir até o fim do período filtrado
+    garantir_horizonte(conn, user_id, janela_visualizada(mes, ano))
     
-    for receita in receitas:
-        receita_dict = dict(receita)
-        if receita_dict['data_inicio']:
-            try:
-                receita_dict['data_inicio'] = datetime.strptime(receita_dict['data_inicio'], '%Y-%m-%d')
-            except:
-                receita_dict['data_inicio'] = None
-        if receita_dict.get('data_fim'):
-            try:
-                receita_dict['data_fim'] = datetime.strptime(receita_dict['data_fim'], '%Y-%m-%d')
-            except:
-                receita_dict['data_fim'] = None
-        
-        # Calcular estatísticas
-        valor = float(receita_dict.get('valor', 0))
-        total_valor += valor
-        if valor > maior_valor:
-            maior_valor = valor
-            
-        receitas_formatadas.append(type('obj', (object,), receita_dict))
+    # Estatísticas sobre todo o filtro, agregadas no SQL (independem da página)
+    estatisticas = dict(conn.execute(f'''
+        SELECT COUNT(*) as total,
+               COALESCE(SUM(r.valor), 0) as valor_total,
+               COALESCE(AVG(r.valor), 0) as media_valor,
+               COALESCE(MAX(r.valor), 0) as maior_valor
+        FROM receita r
+        JOIN categoria_receita cr ON r.categoria_id = cr.id
+        WHERE {where}
+    ''', params).fetchone())
     
-    # Calcular média
-    media_valor = total_valor / len(receitas_formatadas) if receitas_formatadas else 0
+    receitas, proximo_cursor = pagina_receitas(conn, where, params, request.args.get('cursor'), por_pagina)
     
     # Obter categorias para o filtro
     categorias = get_categorias_receitas(usuario_id=user_id)
     
-    # Preparar estatísticas
-    estatisticas = {
-        'total': len(receitas_formatadas),
-        'valor_total': total_valor,
-        'media_valor': media_valor,
-        'maior_valor': maior_valor
-    }
-    
     conn.close()
     return render_template('receitas/index.html', 
-                           receitas=receitas_formatadas, 
+                           receitas=receitas, 
                            categorias=categorias, 
                            stats=estatisticas,
+                           proximo_cursor=proximo_cursor,
+                           por_pagina=por_pagina,
                            mes_selecionado=mes,
                            ano_selecionado=ano)
 
+@receitas_bp.route('/mais')
+@login_required
+def carregar_mais():
+    """Próxima página da listagem (botão "Carregar mais"), em JSON.
+
+    Recebe os mesmos filtros de index() mais o `cursor` devolvido pela página
+    anterior; as linhas vêm prontas em HTML para a tabela e para os cards.
+    """
+    user_id = get_current_user_id()
+    conn = get_db_connection()
+    
+    _, _, where, params = filtros_listagem(conn, user_id, request.args)
+    por_pagina = ler_por_pagina(request.args.get('por_pagina'))
+    receitas, proximo_cursor = pagina_receitas(conn, where, params, request.args.get('cursor'), por_pagina)
+    conn.close()
+    
+    linha_tabela = get_template_attribute('receitas/_itens.html', 'linha_tabela')
+    card_mobile = get_template_attribute('receitas/_itens.html', 'card_mobile')
+    return jsonify({
+        'quantidade': len(receitas),
+        'html_tabela': ''.join(linha_tabela(r) for r in receitas),
+        'html_cards': ''.join(card_mobile(r) for r in receitas),
+        'proximo_cursor': proximo_cursor
+    })
+
 @receitas_bp.route('/nova', methods=['GET', 'POST'])
 @login_required
 def nova():
@@ -198,14 +212,17 @@ def nova():
                 data_fim_obj = data_inicio_obj + relativedelta(months=qtd_parcelas - 1)
                 data_fim = data_fim_obj.strftime('%Y-%m-%d')
 
+                conn = get_db_connection()
                 gerar_parcelas_receita(
                     categoria_id, subcategoria_id, data_inicio, data_fim,
-                    'mensal', valor_parcela, dia, user_id, fixo=False
+                    'mensal', valor_parcela, dia, user_id, fixo=False, conn=conn
                 )
+                conn.commit()
                 flash(f'Recebimento parcelado cadastrado: {qtd_parcelas}x de R$ {valor_parcela:.2f} a partir de {data_inicio_obj.strftime("%d/%m/%Y")}!', 'success')
                 return redirect(url_for('receitas.index'))
 
             except Exception as e:
+                get_db_connection().rollback()
                 flash(f'Erro ao cadastrar recebimento parcelado: {str(e)}', 'error')
                 return redirect(url_for('receitas.nova'))
 
@@ -243,14 +260,17 @@ def nova():
         else:
             dia_comum_recebimento = None
         
+        conn = get_db_connection()
         try:
             gerar_parcelas_receita(
                 categoria_id, subcategoria_id, data_inicio, data_fim, 
-                tipo_recorrencia, valor_parcela, dia_comum_recebimento, user_id, fixo
+                tipo_recorrencia, valor_parcela, dia_comum_recebimento, user_id, fixo, conn=conn
             )
+            conn.commit()
             flash('Receita cadastrada com sucesso!', 'success')
             return redirect(url_for('receitas.index'))
         except Exception as e:
+            conn.rollback()
             flash(f'Erro ao cadastrar receita: {str(e)}', 'error')
     
     categorias = get_categorias_receitas(usuario_id=user_id)
@@ -62,14 +62,17 @@ def nova():
             dia_comum_recebimento = None
         
         # Gerar parcelas
+        conn = get_db_connection()
         try:
             receita_pai_id = gerar_parcelas_receita(
                 categoria_id, subcategoria_id, data_inicio, data_fim, 
-                tipo_recorrencia, valor_total, dia_comum_recebimento, user_id
+                tipo_recorrencia, valor_total, dia_comum_recebimento, user_id, conn=conn
             )
+            conn.commit()
             flash('Receita cadastrada com sucesso!', 'success')
             return redirect(url_for('receitas.index'))
         except Exception as e:
+            conn.rollback()
             flash(f'Erro ao cadastrar receita: {str(e)}', 'error')
     
     categorias = get_categorias_receitas(usuario_id=user_id)
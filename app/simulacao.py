@@ -0,0 +1,166 @@
+"""Simulação de uma compra parcelada no cartão antes de cadastrá-la.
+
+Mostra, mês a mês, como as parcelas de uma compra hipotética mudariam a
+fatura, o limite disponível do cartão e o saldo previsto, sem gravar nada.
+As parcelas saem das mesmas regras de despesas.nova (periodo_compra_parcelada
++ calcular_vencimentos) e o limite segue cartoes.index: parcelas pendentes
+bloqueiam o limite até serem pagas; recorrentes e fixas, só no próprio mês.
+Na linha do tempo, as faturas de cada mês são consideradas pagas no
+vencimento, liberando o limite a partir do mês seguinte.
+
+base_cartao lê do banco uma vez os totais por mês do cartão; quem chama
+guarda a base no cache por geração e cada simulação só sobrepõe as parcelas
+em memória (simular_compra), rápido o bastante para rodar a cada tecla.
+"""
+from app.database import calcular_vencimentos, limites_mes, periodo_compra_parcelada
+
+SIMULACAO_MESES = 24
+SIMULACAO_PARCELAS_MAX = 360
+
+_TOTAIS_CARTAO = '''
+    SELECT substr(d.data_inicio, 1, 7) AS ano_mes,
+           SUM(CASE WHEN d.numero_parcelas != '1' AND d.numero_parcelas != 'x' AND d.fixo = 0
+                    THEN d.valor ELSE 0 END) AS parcelado_pendente,
+           SUM(CASE WHEN d.numero_parcelas = '1' OR d.numero_parcelas = 'x' OR d.fixo = 1
+                    THEN d.valor ELSE 0 END) AS recorrente_pendente
+    FROM despesa d
+    WHERE d.usuario_id = ? AND d.cartao_id = ? AND d.pago = 0
+      AND d.data_inicio >= ? AND d.data_inicio < ?
+    GROUP BY 1
+'''
+
+
+def ano_meses(ano, mes, meses):
+    """Os `meses` meses ('YYYY-MM') a partir de mes/ano"""
+    indice = ano * 12 + mes - 1
+    return [f'{i // 12:04d}-{i % 12 + 1:02d}' for i in range(indice, indice + meses)]
+
+
+def base_cartao(conn, usuario_id, cartao_id, ano, mes, meses=SIMULACAO_MESES):
+    """Totais do cartão nos `meses` meses a partir de mes/ano, ou None se o cartão não for do usuário.
+
+    Retorna um dict com o cartão (nome, limite, vencimento), o parcelado
+    pendente de hoje (cartao_uso) e, em 'meses', para cada mês: as parcelas
+    e as recorrentes pendentes do cartão e o total da fatura da instituição.
+    O saldo previsto de cada mês entra depois, com incluir_saldos.
+    """
+    cartao = conn.execute('''
+        SELECT c.id, c.nome_cartao, c.instituicao_id, c.limite_total, c.dia_vencimento, i.nome AS instituicao_nome
+        FROM cartao_credito c
+        JOIN instituicao_financeira i ON c.instituicao_id = i.id
+        WHERE c.id = ? AND c.usuario_id = ?
+    ''', (cartao_id, usuario_id)).fetchone()
+    if not cartao:
+        return None
+
+    janela = ano_meses(ano, mes, meses)
+    inicio = limites_mes(ano, mes)[0]
+    fim = limites_mes(*map(int, janela[-1].split('-')))[1]
+    totais = {
+        row['ano_mes']: row
+        for row in conn.execute(_TOTAIS_CARTAO, (usuario_id, cartao_id, inicio, fim))
+    }
+    faturas = dict(conn.execute('''
+        SELECT referencia, total FROM fatura
+        WHERE usuario_id = ? AND instituicao_id = ? AND referencia BETWEEN ? AND ?
+    ''', (usuario_id, cartao['instituicao_id'], janela[0], janela[-1])).fetchall())
+    uso = conn.execute(
+        'SELECT parcelado_pendente FROM cartao_uso WHERE usuario_id = ? AND cartao_id = ?',
+        (usuario_id, cartao_id)
+    ).fetchone()
+
+    return {
+        'cartao': dict(cartao),
+        'parcelado_pendente': uso['parcelado_pendente'] if uso else 0.0,
+        'meses': [
+            {
+                'ano_mes': ano_mes,
+                'parcelado_pendente': totais[ano_mes]['parcelado_pendente'] if ano_mes in totais else 0.0,
+                'recorrente_pendente': totais[ano_mes]['recorrente_pendente'] if ano_mes in totais else 0.0,
+                'fatura': faturas.get(ano_mes, 0.0),
+            }
+            for ano_mes in janela
+        ],
+    }
+
+
+def incluir_saldos(base, resumos):
+    """Acrescenta a cada mês da base o saldo previsto ao fim do mês.
+
+    `resumos` são os resumo_ano dos anos da janela. O primeiro mês leva o
+    saldo_previsto do dashboard; os seguintes somam receitas - despesas do mês
+    ao anterior, contando como pagos os pendentes dos meses já passados na
+    janela (o mesmo critério da linha do tempo do limite).
+    """
+    por_mes = {f"{resumo['ano']:04d}-{mes['mes']:02d}": mes for resumo in resumos for mes in resumo['meses']}
+    saldo = None
+    for mes in base['meses']:
+        totais = por_mes[mes['ano_mes']]
+        if saldo is None:
+            saldo = totais['saldo_previsto']
+        else:
+            saldo += totais['receitas'] - totais['despesas']
+        mes['saldo_previsto'] = saldo
+    return base
+
+
+def parcelas_compra(dia_vencimento, valor_total, parcelas, mes_primeira_fatura):
+    """Vencimentos e valor de cada parcela como despesas.nova os gravaria: [(date, valor)]"""
+    data_inicio, data_fim = periodo_compra_parcelada(dia_vencimento, mes_primeira_fatura, parcelas)
+    valor = valor_total / parcelas
+    return [(vencimento, valor) for vencimento in calcular_vencimentos(data_inicio, 'mensal', data_fim)]
+
+
+def simular_compra(base, parcelas):
+    """Sobrepõe `parcelas` ([(date, valor)]) à base, mês a mês. Não consulta o banco.
+
+    Para cada mês retorna a parcela, a fatura, o limite disponível e o saldo
+    previsto, sem e com a compra, e o resumo: menor limite disponível, o
+    primeiro mês em que a compra estoura o limite e o primeiro saldo negativo.
+    """
+    por_mes = {}
+    for vencimento, valor in parcelas:
+        chave = vencimento.strftime('%Y-%m')
+        por_mes[chave] = por_mes.get(chave, 0.0) + valor
+
+    limite = base['cartao']['limite_total'] or 0.0
+    # Parcelas de meses anteriores à janela seguem pendentes, como no cartao_uso
+    bloqueado = base['parcelado_pendente']
+    bloqueado_compra = sum(por_mes.values())
+    impacto_saldo = 0.0
+    meses = []
+    for mes in base['meses']:
+        parcela = por_mes.get(mes['ano_mes'], 0.0)
+        impacto_saldo += parcela
+        bloqueado_mes = bloqueado + mes['recorrente_pendente']
+        meses.append({
+            'ano_mes': mes['ano_mes'],
+            'parcela': round(parcela, 2),
+            'fatura': round(mes['fatura'], 2),
+            'fatura_simulada': round(mes['fatura'] + parcela, 2),
+            'disponivel': round(limite - bloqueado_mes, 2),
+            'disponivel_simulado': round(limite - bloqueado_mes - bloqueado_compra, 2),
+            'saldo_previsto': round(mes['saldo_previsto'], 2),
+            'saldo_simulado': round(mes['saldo_previsto'] - impacto_saldo, 2),
+        })
+        # Paga a fatura do mês, as parcelas dele liberam o limite no mês seguinte
+        bloqueado -= mes['parcelado_pendente']
+        bloqueado_compra -= parcela
+
+    estouro = next((mes['ano_mes'] for mes in meses if mes['disponivel_simulado'] < 0), None)
+    negativo = next((mes['ano_mes'] for mes in meses if mes['saldo_simulado'] < 0), None)
+    for mes in meses:
+        # Como em cartoes.index, o disponível exibido não fica negativo
+        mes['disponivel'] = max(0.0, mes['disponivel'])
+        mes['disponivel_simulado'] = max(0.0, mes['disponivel_simulado'])
+    return {
+        'cartao': base['cartao'],
+        'parcelas': len(parcelas),
+        'valor_parcela': round(parcelas[0][1], 2) if parcelas else 0.0,
+        'primeiro_vencimento': parcelas[0][0].isoformat() if parcelas else None,
+        'ultimo_vencimento': parcelas[-1][0].isoformat() if parcelas else None,
+        'menor_disponivel': min(mes['disponivel_simulado'] for mes in meses),
+        'estoura_limite_em': estouro,
+        'primeiro_saldo_negativo': negativo,
+        'meses': meses,
+    }
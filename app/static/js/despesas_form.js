@@ -154,6 +154,83 @@ function toggleCompraParcelada(isParcelado) {
     }
 }
 
+// Simulação da Compra Parcelada (fatura, limite e saldo mês a mês, sem gravar)
+let simulacaoTimer = null;
+let simulacaoPendente = null;
+
+function formatarMoeda(valor) {
+    return valor.toLocaleString('pt-BR', { style: 'currency', currency: 'BRL' });
+}
+
+function formatarMes(anoMes) {
+    const [ano, mes] = anoMes.split('-');
+    return `${mes}/${ano}`;
+}
+
+function agendarSimulacao() {
+    // Espera o usuário parar de digitar antes de consultar
+    clearTimeout(simulacaoTimer);
+    simulacaoTimer = setTimeout(atualizarSimulacao, 250);
+}
+
+function atualizarSimulacao() {
+    const container = document.getElementById('simulacao_compra');
+    const checkbox = document.getElementById('compra_parcelada');
+    if (!container) return;
+
+    const params = new URLSearchParams({
+        cartao_id: document.getElementById('cartao_id').value,
+        valor_total_bem: document.getElementById('valor_total_bem').value,
+        qtd_parcelas_input: document.getElementById('qtd_parcelas_input').value,
+        mes_primeira_fatura: document.getElementById('mes_primeira_fatura').value
+    });
+    const preenchido = checkbox && checkbox.checked && Array.from(params.values()).every(v => v);
+    if (simulacaoPendente) simulacaoPendente.abort();
+    if (!preenchido) {
+        container.classList.add('hidden');
+        return;
+    }
+
+    simulacaoPendente = new AbortController();
+    fetch(`${container.dataset.url}?${params}`, { signal: simulacaoPendente.signal })
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                container.classList.add('hidden');
+                return;
+            }
+            const resumo = document.getElementById('simulacao_resumo');
+            let texto = `${data.parcelas}x de ${formatarMoeda(data.valor_parcela)} - menor limite disponível: ${formatarMoeda(data.menor_disponivel)}`;
+            if (data.estoura_limite_em) texto += ` - estoura o limite em ${formatarMes(data.estoura_limite_em)}`;
+            if (data.primeiro_saldo_negativo) texto += ` - saldo negativo em ${formatarMes(data.primeiro_saldo_negativo)}`;
+            resumo.textContent = texto;
+            resumo.className = 'text-[10px] mb-1.5 ' +
+                (data.estoura_limite_em || data.primeiro_saldo_negativo ? 'text-yellow-400' : 'text-gray-400');
+
+            const tbody = document.getElementById('simulacao_meses');
+            tbody.innerHTML = '';
+            data.meses.filter(m => m.parcela).forEach(m => {
+                const tr = document.createElement('tr');
+                [
+                    formatarMes(m.ano_mes),
+                    `${formatarMoeda(m.fatura)} → ${formatarMoeda(m.fatura_simulada)}`,
+                    `${formatarMoeda(m.disponivel)} → ${formatarMoeda(m.disponivel_simulado)}`,
+                    `${formatarMoeda(m.saldo_previsto)} → ${formatarMoeda(m.saldo_simulado)}`
+                ].forEach((valor, i) => {
+                    const td = document.createElement('td');
+                    td.className = 'py-0.5 whitespace-nowrap ' + (i ? 'text-right text-gray-300' : 'text-gray-400');
+                    td.textContent = valor;
+                    tr.appendChild(td);
+                });
+                tbody.appendChild(tr);
+            });
+            container.classList.remove('hidden');
+        })
+        .catch(error => {
+            if (error.name !== 'AbortError') console.error('Erro ao simular compra:', error);
+        });
+}
+
 // Lógica de Submit e Exclusão (Lote)
 function submitDelete(id, scope) {
     const form = document.createElement('form');
@@ -246,6 +323,11 @@ document.addEventListener('DOMContentLoaded', function () {
     if (compraParceladaCheckbox) {
         compraParceladaCheckbox.addEventListener('change', function () {
             toggleCompraParcelada(this.checked);
+            agendarSimulacao();
+        });
+        ['valor_total_bem', 'qtd_parcelas_input', 'mes_primeira_fatura', 'cartao_id'].forEach(id => {
+            const campo = document.getElementById(id);
+            if (campo) campo.addEventListener(campo.tagName === 'SELECT' ? 'change' : 'input', agendarSimulacao);
         });
     }
 
@@ -0,0 +1,5 @@
+"""Benchmarks de desempenho sobre bancos sintéticos.
+
+Rode a partir da raiz do projeto, por exemplo:
+    python -m benchmarks.bench_filtro_periodo
+"""
@@ -0,0 +1,90 @@
+"""Quebras por categoria: GROUP BY sobre receita/despesa (caminho antigo) vs.
+agregado_categoria_mes, para o mês do dashboard, para a tendência de 12 meses
+e para o ano inteiro (12 meses navegados um a um vs. resumo_ano).
+
+    python -m benchmarks.bench_agregado [linhas_por_usuario]
+"""
+import os
+import sys
+
+from benchmarks.dados_sinteticos import banco_temporario, medir
+
+
+def totais_antigos(conn, user_id, inicio, fim):
+    """Réplica das consultas antigas de dashboard.index"""
+    return conn.execute('''
+        SELECT 'receita' AS tipo, cr.nome AS nome, SUM(r.valor) AS total,
+               SUM(CASE WHEN r.pago = 1 THEN r.valor ELSE 0 END) AS total_pago
+        FROM receita r
+        JOIN categoria_receita cr ON r.categoria_id = cr.id
+        WHERE r.usuario_id = ? AND r.data_inicio >= ? AND r.data_inicio < ?
+        GROUP BY cr.nome
+        UNION ALL
+        SELECT 'despesa', cd.nome, SUM(d.valor),
+               SUM(CASE WHEN d.pago = 1 THEN d.valor ELSE 0 END)
+        FROM despesa d
+        JOIN categoria_despesa cd ON d.categoria_id = cd.id
+        WHERE d.usuario_id = ? AND d.data_inicio >= ? AND d.data_inicio < ?
+        GROUP BY cd.nome
+    ''', (user_id, inicio, fim, user_id, inicio, fim)).fetchall()
+
+
+def tendencia_antiga(conn, user_id, inicio, fim):
+    """A mesma tendência agrupando os lançamentos por mês e categoria"""
+    return conn.execute('''
+        SELECT 'receita', substr(r.data_inicio, 1, 7), cr.nome, SUM(r.valor)
+        FROM receita r
+        JOIN categoria_receita cr ON r.categoria_id = cr.id
+        WHERE r.usuario_id = ? AND r.data_inicio >= ? AND r.data_inicio < ?
+        GROUP BY 2, 3
+        UNION ALL
+        SELECT 'despesa', substr(d.data_inicio, 1, 7), cd.nome, SUM(d.valor)
+        FROM despesa d
+        JOIN categoria_despesa cd ON d.categoria_id = cd.id
+        WHERE d.usuario_id = ? AND d.data_inicio >= ? AND d.data_inicio < ?
+        GROUP BY 2, 3
+    ''', (user_id, inicio, fim, user_id, inicio, fim)).fetchall()
+
+
+def ano_mes_a_mes(conn, user_id, ano):
+    """O ano como o usuário o via antes: saldo anterior e totais, um mês por vez"""
+    for mes in range(1, 13):
+        inicio = f'{ano:04d}-{mes:02d}-01'
+        fim = f'{ano + 1:04d}-01-01' if mes == 12 else f'{ano:04d}-{mes + 1:02d}-01'
+        conn.execute(
+            'SELECT saldo_acumulado FROM saldo_mensal WHERE usuario_id = ? AND ano_mes < ? ORDER BY ano_mes DESC LIMIT 1',
+            (user_id, inicio[:7])
+        ).fetchone()
+        totais_antigos(conn, user_id, inicio, fim)
+
+
+def main():
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    print(f'Gerando {linhas} linhas para 1 usuário...')
+    with banco_temporario(linhas=linhas, usuarios=1) as caminho:
+        # app.database lê DB_PATH na importação
+        os.environ['DB_PATH'] = caminho
+        from app.database import _abrir_conexao
+        from app.routes.dashboard import resumo_ano, tendencia_mensal, totais_por_categoria
+
+        conn = _abrir_conexao()
+        linhas_agregado = conn.execute('SELECT COUNT(*) FROM agregado_categoria_mes').fetchone()[0]
+        print(f'agregado_categoria_mes: {linhas_agregado} linhas')
+        print(f"{'consulta':<22}{'antigo p50/p95 (ms)':>24}{'novo p50/p95 (ms)':>24}")
+        cenarios = [
+            ('mês 06/2020', lambda: totais_antigos(conn, 1, '2020-06-01', '2020-07-01'),
+             lambda: totais_por_categoria(conn, 1, '2020-06-01', '2020-07-01')),
+            ('12 meses até 12/2020', lambda: tendencia_antiga(conn, 1, '2020-01-01', '2021-01-01'),
+             lambda: tendencia_mensal(conn, 1, 2020, 12, 12)),
+            ('36 meses até 12/2022', lambda: tendencia_antiga(conn, 1, '2020-01-01', '2023-01-01'),
+             lambda: tendencia_mensal(conn, 1, 2022, 12, 36)),
+            ('ano 2020', lambda: ano_mes_a_mes(conn, 1, 2020), lambda: resumo_ano(conn, 1, 2020)),
+        ]
+        for nome, antigo, novo in cenarios:
+            a, n = medir(antigo), medir(novo)
+            print(f'{nome:<22}{a[0]:>11.2f} / {a[1]:<10.2f}{n[0]:>11.2f} / {n[1]:<10.2f}')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
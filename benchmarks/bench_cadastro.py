@@ -0,0 +1,114 @@
+"""Compara o cadastro antigo de um usuário (usuário, categorias padrão com um
+INSERT por linha e lançamentos de exemplo, cada etapa com conexão e commit
+próprios) com o atual (tudo numa transação, um executemany por tabela):
+latência, conexões abertas e commits por cadastro.
+O hash da senha fica de fora; ele é medido em bench_login.
+
+    python -m benchmarks.bench_cadastro [cadastros]
+"""
+import itertools
+import sqlite3
+import sys
+from datetime import date
+
+from benchmarks.dados_sinteticos import banco_temporario, medir
+
+
+class Contador:
+    """Abre conexões configuradas como as da aplicação e conta conexões e commits"""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.conexoes = self.commits = 0
+
+    def conectar(self):
+        conn = sqlite3.connect(self.caminho)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.set_trace_callback(self._contar_commit)
+        self.conexoes += 1
+        return conn
+
+    def _contar_commit(self, sql):
+        if sql.strip().upper() == 'COMMIT':
+            self.commits += 1
+
+
+def cadastro_antigo(contador, username):
+    """Réplica do caminho antigo de auth.register + criar_categorias_padrao + criar_lancamentos_exemplo"""
+    from app.routes.auth import CATEGORIAS_PADRAO
+
+    conn = contador.conectar()
+    usuario_id = conn.execute(
+        "INSERT INTO usuario (username, password_hash, nome_completo, email) VALUES (?, 'x', '', '')", (username,)
+    ).lastrowid
+    conn.commit()
+    conn.close()
+
+    conn = contador.conectar()
+    for tipo, categorias in CATEGORIAS_PADRAO.items():
+        for categoria_nome, subcategorias in categorias.items():
+            categoria_id = conn.execute(
+                f'INSERT INTO categoria_{tipo} (nome, usuario_id) VALUES (?, ?)', (categoria_nome, usuario_id)
+            ).lastrowid
+            for subcategoria_nome in subcategorias:
+                conn.execute(
+                    f'INSERT INTO subcategoria_{tipo} (nome, categoria_id, usuario_id) VALUES (?, ?, ?)',
+                    (subcategoria_nome, categoria_id, usuario_id)
+                )
+    conn.commit()
+    conn.close()
+
+    conn = contador.conectar()
+    primeiras = {}
+    for tipo in ('receita', 'despesa'):
+        categoria = conn.execute(
+            f'SELECT id FROM categoria_{tipo} WHERE usuario_id = ? ORDER BY id LIMIT 1', (usuario_id,)
+        ).fetchone()
+        subcategoria = conn.execute(
+            f'SELECT id FROM subcategoria_{tipo} WHERE usuario_id = ? ORDER BY id LIMIT 1', (usuario_id,)
+        ).fetchone()
+        primeiras[tipo] = (categoria['id'], subcategoria['id'])
+    for tipo, valor in (('receita', 5000.00), ('despesa', 1200.00)):
+        # Cada gerar_parcelas_* abria a própria conexão e fazia o próprio commit
+        parcelas = contador.conectar()
+        parcelas.execute(
+            f'''INSERT INTO {tipo} (categoria_id, subcategoria_id, valor, usuario_id, fixo, data_inicio,
+                                    tipo_recorrencia, numero_parcelas, parcela_atual)
+                VALUES (?, ?, ?, ?, 0, ?, 'unica', '1', 1)''',
+            (*primeiras[tipo], valor, usuario_id, date.today().isoformat())
+        )
+        parcelas.commit()
+        parcelas.close()
+    conn.close()
+
+
+def cadastro_novo(contador, username):
+    """Caminho atual de auth.register, sem o hash da senha"""
+    from app.routes.auth import criar_categorias_padrao, criar_lancamentos_exemplo
+
+    conn = contador.conectar()
+    usuario_id = conn.execute(
+        "INSERT INTO usuario (username, password_hash, nome_completo, email) VALUES (?, 'x', '', '')", (username,)
+    ).lastrowid
+    criar_lancamentos_exemplo(conn, usuario_id, criar_categorias_padrao(conn, usuario_id))
+    conn.commit()
+    conn.close()
+
+
+def main():
+    cadastros = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    nomes = (f'novo{i}' for i in itertools.count())
+
+    print(f"{'caminho':<10}{'p50/p95 (ms)':>20}{'conexões':>10}{'commits':>9}")
+    with banco_temporario(linhas=10_000, usuarios=10) as caminho:
+        for rotulo, cadastrar in (('antigo', cadastro_antigo), ('novo', cadastro_novo)):
+            contador = Contador(caminho)
+            p50, p95 = medir(lambda: cadastrar(contador, next(nomes)), repeticoes=cadastros)
+            print(f'{rotulo:<10}{p50:>9.2f} / {p95:<8.2f}{contador.conexoes / cadastros:>10.0f}'
+                  f'{contador.commits / cadastros:>9.0f}')
+
+
+if __name__ == '__main__':
+    main()
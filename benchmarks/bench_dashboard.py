@@ -0,0 +1,87 @@
+"""Compara a montagem do dashboard antiga (seis consultas + laços em Python)
+com montar_dashboard (saldo_mensal + consulta agrupada única).
+
+    python -m benchmarks.bench_dashboard [linhas_por_usuario]
+"""
+import calendar
+import os
+import sys
+from datetime import date
+
+from benchmarks.dados_sinteticos import banco_temporario, medir
+
+
+def dashboard_antigo(conn, user_id, ano, mes):
+    """Réplica do caminho antigo de dashboard.index (sem o render)"""
+    mes_anterior = mes - 1 if mes > 1 else 12
+    ano_anterior = ano if mes > 1 else ano - 1
+    ultimo_anterior = date(ano_anterior, mes_anterior, calendar.monthrange(ano_anterior, mes_anterior)[1])
+    rec = conn.execute('SELECT COALESCE(SUM(valor), 0) as total FROM receita WHERE data_inicio <= ? AND usuario_id = ? AND pago = 1',
+                       (ultimo_anterior.isoformat(), user_id)).fetchone()
+    desp = conn.execute('SELECT COALESCE(SUM(valor), 0) as total FROM despesa WHERE data_inicio <= ? AND usuario_id = ? AND pago = 1',
+                        (ultimo_anterior.isoformat(), user_id)).fetchone()
+    saldo_anterior = rec['total'] - desp['total']
+
+    primeiro_dia = date(ano, mes, 1).isoformat()
+    ultimo_dia = date(ano, mes, calendar.monthrange(ano, mes)[1]).isoformat()
+    receitas = list(conn.execute('''
+        SELECT r.*, cr.nome as categoria_nome FROM receita r
+        JOIN categoria_receita cr ON r.categoria_id = cr.id
+        LEFT JOIN subcategoria_receita sr ON r.subcategoria_id = sr.id
+        WHERE r.data_inicio BETWEEN ? AND ? AND r.usuario_id = ? ORDER BY r.data_inicio DESC
+    ''', (primeiro_dia, ultimo_dia, user_id)).fetchall())
+    if saldo_anterior > 0:
+        receitas.insert(0, type('obj', (object,), {'valor': saldo_anterior, 'pago': True, 'virtual': True})())
+    despesas = list(conn.execute('''
+        SELECT d.*, cd.nome as categoria_nome FROM despesa d
+        JOIN categoria_despesa cd ON d.categoria_id = cd.id
+        LEFT JOIN subcategoria_despesa sd ON d.subcategoria_id = sd.id
+        WHERE d.data_inicio BETWEEN ? AND ? AND d.usuario_id = ? ORDER BY d.data_inicio DESC
+    ''', (primeiro_dia, ultimo_dia, user_id)).fetchall())
+    if saldo_anterior < 0:
+        despesas.insert(0, type('obj', (object,), {'valor': abs(saldo_anterior), 'pago': True, 'virtual': True})())
+    total_receitas = sum(float(r.valor if hasattr(r, 'valor') else r['valor']) for r in receitas)
+    total_despesas = sum(float(d.valor if hasattr(d, 'valor') else d['valor']) for d in despesas)
+    pagas = 0
+    for r in receitas:
+        valor = float(r.valor if hasattr(r, 'valor') else r['valor'])
+        if (hasattr(r, 'virtual') and r.virtual) or (hasattr(r, 'pago') and r.pago) or (not hasattr(r, 'virtual') and r['pago']):
+            pagas += valor
+    for d in despesas:
+        valor = float(d.valor if hasattr(d, 'valor') else d['valor'])
+        if (hasattr(d, 'virtual') and d.virtual) or (hasattr(d, 'pago') and d.pago) or (not hasattr(d, 'virtual') and d['pago']):
+            pagas -= valor
+    conn.execute('''
+        SELECT cr.nome, SUM(r.valor) as total FROM receita r JOIN categoria_receita cr ON r.categoria_id = cr.id
+        WHERE r.data_inicio BETWEEN ? AND ? AND r.usuario_id = ? GROUP BY cr.nome ORDER BY total DESC
+    ''', (primeiro_dia, ultimo_dia, user_id)).fetchall()
+    conn.execute('''
+        SELECT cd.nome, SUM(d.valor) as total FROM despesa d JOIN categoria_despesa cd ON d.categoria_id = cd.id
+        WHERE d.data_inicio BETWEEN ? AND ? AND d.usuario_id = ? GROUP BY cd.nome ORDER BY total DESC
+    ''', (primeiro_dia, ultimo_dia, user_id)).fetchall()
+    return total_receitas, total_despesas, pagas
+
+
+def main():
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    print(f'Gerando {linhas} linhas para 1 usuário...')
+    with banco_temporario(linhas=linhas, usuarios=1) as caminho:
+        # app.database lê DB_PATH na importação
+        os.environ['DB_PATH'] = caminho
+        from app import create_app
+        from app.database import get_db_connection
+        from app.routes.dashboard import montar_dashboard
+
+        app = create_app()
+        with app.app_context():
+            conn = get_db_connection()
+            cenarios = [(2016, 2), (2020, 6), (2024, 12)]
+            print(f"{'mês':<10}{'antigo p50/p95 (ms)':>24}{'novo p50/p95 (ms)':>24}")
+            for ano, mes in cenarios:
+                antigo = medir(lambda: dashboard_antigo(conn, 1, ano, mes))
+                novo = medir(lambda: montar_dashboard(1, ano, mes))
+                print(f'{mes:02d}/{ano:<7}{antigo[0]:>11.2f} / {antigo[1]:<10.2f}{novo[0]:>11.2f} / {novo[1]:<10.2f}')
+
+
+if __name__ == '__main__':
+    main()
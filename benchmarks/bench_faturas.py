@@ -0,0 +1,78 @@
+"""Compara a montagem antiga das faturas de cartoes.index (todo o histórico de
+cartão + filtro do mês em Python) com montar_faturas (consulta limitada ao mês
+e agrupada no SQL). O volume por mês é fixo e o histórico cresce em anos: o
+caminho novo deve ficar estável enquanto o antigo cresce com o histórico.
+
+    python -m benchmarks.bench_faturas
+"""
+import sqlite3
+
+from benchmarks.dados_sinteticos import banco_temporario, medir
+
+LINHAS_POR_ANO = 10_000
+ANOS = (1, 5, 20)
+
+
+def faturas_antigas(conn, user_id, ano, mes):
+    """Réplica do caminho antigo de cartoes.index (só a parte das faturas)"""
+    filtro_vencimento = f'{ano}-{int(mes):02d}'
+    despesas_raw = conn.execute('''
+        SELECT d.*, c.nome_cartao, c.dia_vencimento, i.nome as nome_banco, i.id as instituicao_id,
+               cat.nome as categoria_nome, sub.nome as subcategoria_nome,
+               strftime('%Y-%m', d.data_inicio) as mes_compra,
+               strftime('%Y-%m', d.data_inicio) as mes_vencimento
+        FROM despesa d
+        JOIN cartao_credito c ON d.cartao_id = c.id
+        JOIN instituicao_financeira i ON c.instituicao_id = i.id
+        JOIN categoria_despesa cat ON d.categoria_id = cat.id
+        LEFT JOIN subcategoria_despesa sub ON d.subcategoria_id = sub.id
+        WHERE d.usuario_id = ?
+        ORDER BY mes_vencimento DESC, d.data_inicio DESC
+    ''', (user_id,)).fetchall()
+    faturas_view = {}
+    gastos_por_cartao_id = {}
+    for row in despesas_raw:
+        if row['mes_vencimento'] != filtro_vencimento:
+            continue
+        banco, cartao, valor = row['nome_banco'], row['nome_cartao'], row['valor']
+        gastos_por_cartao_id[row['cartao_id']] = gastos_por_cartao_id.get(row['cartao_id'], 0.0) + valor
+        dados_banco = faturas_view.setdefault(banco, {'valor_total': 0.0, 'dia_vencimento': row['dia_vencimento'], 'cartoes': {}})
+        dados_banco['valor_total'] += valor
+        dados_cartao = dados_banco['cartoes'].setdefault(cartao, {'valor_total': 0.0, 'itens': []})
+        dados_cartao['valor_total'] += valor
+        dados_cartao['itens'].append({'valor': valor, 'id': row['id'], 'pago': bool(row['pago'])})
+    for dados_banco in faturas_view.values():
+        for dados_cartao in dados_banco['cartoes'].values():
+            dados_cartao['todos_pagos'] = all(item['pago'] for item in dados_cartao['itens'])
+        dados_banco['todos_pagos'] = all(c['todos_pagos'] for c in dados_banco['cartoes'].values())
+    return faturas_view, gastos_por_cartao_id
+
+
+def resumo(faturas_view):
+    """Totais e ids de cada cartão, para conferir que os dois caminhos batem"""
+    return {
+        (banco, cartao): (round(dados_cartao['valor_total'], 6), dados_cartao['todos_pagos'],
+                          sorted(item['id'] for item in dados_cartao['itens']))
+        for banco, dados_banco in faturas_view.items()
+        for cartao, dados_cartao in dados_banco['cartoes'].items()
+    }
+
+
+def main():
+    from app.routes.cartoes import montar_faturas
+
+    print(f"{'histórico':<12}{'antigo p50/p95 (ms)':>24}{'novo p50/p95 (ms)':>24}")
+    for anos in ANOS:
+        linhas = LINHAS_POR_ANO * anos
+        with banco_temporario(linhas=linhas, usuarios=1, anos=anos) as caminho:
+            conn = sqlite3.connect(caminho)
+            conn.row_factory = sqlite3.Row
+            assert resumo(faturas_antigas(conn, 1, 2015, 6)[0]) == resumo(montar_faturas(conn, 1, 2015, 6)[0])
+            antigo = medir(lambda: faturas_antigas(conn, 1, 2015, 6), repeticoes=10)
+            novo = medir(lambda: montar_faturas(conn, 1, 2015, 6))
+            conn.close()
+        print(f'{linhas:<12}{antigo[0]:>11.2f} / {antigo[1]:<10.2f}{novo[0]:>11.2f} / {novo[1]:<10.2f}')
+
+
+if __name__ == '__main__':
+    main()
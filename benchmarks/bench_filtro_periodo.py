@@ -0,0 +1,58 @@
+"""Compara filtros de mês/ano com strftime() contra intervalos sargáveis.
+
+    python -m benchmarks.bench_filtro_periodo [linhas] [usuarios]
+"""
+import sqlite3
+import sys
+
+from benchmarks.dados_sinteticos import banco_temporario, medir
+from app.database import filtro_periodo
+
+CONSULTA = '''
+    SELECT d.*, cd.nome as categoria_nome
+    FROM despesa d
+    JOIN categoria_despesa cd ON d.categoria_id = cd.id
+    WHERE d.usuario_id = ?
+'''
+
+
+def filtro_strftime(mes, ano):
+    """Filtro antigo, como era montado em despesas.index"""
+    sql, params = '', []
+    if mes:
+        sql += " AND strftime('%m', d.data_inicio) = ?"
+        params.append(f'{int(mes):02d}')
+    if ano:
+        sql += " AND strftime('%Y', d.data_inicio) = ?"
+        params.append(str(ano))
+    return sql, params
+
+
+def main():
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    usuarios = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    print(f'Gerando {linhas} linhas para {usuarios} usuário(s)...')
+    with banco_temporario(linhas=linhas, usuarios=usuarios) as caminho:
+        conn = sqlite3.connect(caminho)
+        conn.row_factory = sqlite3.Row
+        user_id = 1
+        cenarios = [('mês + ano', 6, 2020), ('só ano', None, 2020), ('só mês (todos os anos)', 6, None)]
+        print(f"{'cenário':<26}{'linhas':>8}{'strftime p50/p95 (ms)':>26}{'intervalo p50/p95 (ms)':>26}")
+        for nome, mes, ano in cenarios:
+            sql_antigo, params_antigos = filtro_strftime(mes, ano)
+            sql_novo, params_novos = filtro_periodo(conn, 'despesa', 'd', user_id, mes, ano)
+
+            antigo = CONSULTA + sql_antigo + ' ORDER BY d.data_inicio DESC'
+            novo = CONSULTA + ' AND ' + sql_novo + ' ORDER BY d.data_inicio DESC'
+            qtd_antigo = len(conn.execute(antigo, [user_id] + params_antigos).fetchall())
+            qtd_novo = len(conn.execute(novo, [user_id] + params_novos).fetchall())
+            assert qtd_antigo == qtd_novo, (nome, qtd_antigo, qtd_novo)
+
+            t_antigo = medir(lambda: conn.execute(antigo, [user_id] + params_antigos).fetchall(), 10)
+            t_novo = medir(lambda: conn.execute(novo, [user_id] + params_novos).fetchall(), 10)
+            print(f'{nome:<26}{qtd_novo:>8}{t_antigo[0]:>13.2f} / {t_antigo[1]:<10.2f}{t_novo[0]:>13.2f} / {t_novo[1]:<10.2f}')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Compara o processamento antigo da foto de perfil (decodificação completa,
+thumbnail LANCZOS e JPEG otimizado, dentro da requisição) com
+fotos.processar_foto (Image.draft reduzindo já na decodificação, todos os
+tamanhos em JPEG e WebP) para fotos de câmera de celular de vários tamanhos.
+No caminho novo esse tempo sai da requisição e vai para o pool de fotos; a
+requisição só grava o arquivo no spool.
+
+    python -m benchmarks.bench_fotos
+"""
+import io
+import os
+import tempfile
+
+from PIL import Image
+
+from app.fotos import processar_foto
+from benchmarks.dados_sinteticos import medir
+
+RESOLUCOES = ((1600, 1200), (4032, 3024), (8000, 6000))
+
+
+def foto_antiga(origem, destino):
+    """Réplica do caminho antigo de auth.upload_photo"""
+    img = Image.open(origem)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGB')
+    img.thumbnail((200, 200), Image.Resampling.LANCZOS)
+    new_img = Image.new('RGB', (200, 200), (255, 255, 255))
+    new_img.paste(img, ((200 - img.width) // 2, (200 - img.height) // 2))
+    new_img.save(destino, 'JPEG', quality=85, optimize=True)
+
+
+def main():
+    print(f"{'foto':<12}{'antigo p50/p95 (ms)':>24}{'novo p50/p95 (ms)':>24}")
+    with tempfile.TemporaryDirectory() as pasta:
+        for largura, altura in RESOLUCOES:
+            # Gradiente com ruído, para o JPEG não ficar trivial de decodificar
+            img = Image.linear_gradient('L').resize((largura, altura)).convert('RGB')
+            img = Image.blend(img, Image.effect_noise((largura, altura), 40).convert('RGB'), 0.3)
+            origem = os.path.join(pasta, 'origem.jpg')
+            img.save(origem, 'JPEG', quality=90)
+
+            antigo = medir(lambda: foto_antiga(origem, os.path.join(pasta, 'antiga.jpg')), repeticoes=5)
+            novo = medir(lambda: processar_foto(origem, pasta, 'bench'), repeticoes=5)
+            print(f'{f"{largura}x{altura}":<12}{antigo[0]:>11.1f} / {antigo[1]:<10.1f}{novo[0]:>11.1f} / {novo[1]:<10.1f}')
+
+
+if __name__ == '__main__':
+    main()
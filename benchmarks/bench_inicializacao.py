@@ -0,0 +1,74 @@
+"""Inicialização dos workers: create_app antigo (init_db com as migrações e
+os dados iniciais, mais um SELECT 1, em todo processo) vs. o atual (nenhum
+acesso ao banco em create_app; cada worker só lê a versão do esquema na
+primeira requisição). Sobe N processos ao mesmo tempo contra o mesmo arquivo,
+como os workers do gunicorn, e mede o tempo de cada um depois dos imports.
+
+    python -m benchmarks.bench_inicializacao [workers] [rodadas]
+"""
+import os
+import subprocess
+import sys
+
+from benchmarks.dados_sinteticos import banco_temporario
+
+WORKER = '''
+import sys, time
+from app import create_app
+from app.database import conferir_esquema, get_db_connection
+from init_db import init_db
+print('pronto', flush=True)
+sys.stdin.readline()
+def banco():
+    if sys.argv[1] == 'antigo':
+        init_db()
+        with app.app_context():
+            get_db_connection().execute('SELECT 1')
+    else:
+        with app.app_context():
+            conferir_esquema()
+t0 = time.perf_counter()
+app = create_app()
+t1 = time.perf_counter()
+banco()
+t2 = time.perf_counter()
+print((t2 - t0) * 1000, (t2 - t1) * 1000)
+'''
+
+
+def subir_workers(modo, workers, caminho):
+    """Sobe `workers` processos, libera todos juntos e retorna (total, banco) de cada um, em ms"""
+    ambiente = dict(os.environ, DB_PATH=caminho, SESSION_TYPE='filesystem')
+    processos = [
+        subprocess.Popen(
+            [sys.executable, '-c', WORKER, modo], env=ambiente,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+        )
+        for _ in range(workers)
+    ]
+    # Espera os imports de todos terminarem para medir só a inicialização
+    for processo in processos:
+        processo.stdout.readline()
+    for processo in processos:
+        processo.stdin.write('\n')
+        processo.stdin.flush()
+    return [tuple(map(float, processo.communicate()[0].split())) for processo in processos]
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    rodadas = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    with banco_temporario(linhas=20_000, usuarios=10) as caminho:
+        print(f'{workers} workers simultâneos, {rodadas} rodadas (ms por worker, após os imports)')
+        print(f"{'':<8}{'total p50':>12}{'total max':>12}{'banco p50':>12}{'banco max':>12}")
+        for modo in ('antigo', 'novo'):
+            medidas = [m for _ in range(rodadas) for m in subir_workers(modo, workers, caminho)]
+            total = sorted(m[0] for m in medidas)
+            banco = sorted(m[1] for m in medidas)
+            print(f'{modo:<8}{total[len(total) // 2]:>12.2f}{total[-1]:>12.2f}'
+                  f'{banco[len(banco) // 2]:>12.2f}{banco[-1]:>12.2f}')
+        print('Com gunicorn --preload, create_app roda uma vez no master e os workers herdam a aplicação pronta.')
+
+
+if __name__ == '__main__':
+    main()
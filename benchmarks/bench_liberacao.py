@@ -0,0 +1,73 @@
+"""Linha do tempo da liberação do limite de um cartão: uma consulta por mês
+até a última parcela vs. liberacao_limite (uma consulta agrupada por cartão e
+mês da fatura), para um cartão e para todos os cartões do usuário, e a
+mesma linha do tempo lida do cache (como em cartoes.liberacao).
+
+    python -m benchmarks.bench_liberacao [linhas_por_usuario]
+"""
+import sqlite3
+import sys
+from datetime import date
+
+from benchmarks.dados_sinteticos import banco_temporario, medir
+
+
+def liberacao_mes_a_mes(conn, user_id, cartao_id, inicio):
+    """A mesma linha do tempo somando as parcelas pendentes de cada fatura, um mês por vez"""
+    ultimo = conn.execute('''
+        SELECT MAX(data_inicio) FROM despesa
+        WHERE usuario_id = ? AND cartao_id = ? AND pago = 0 AND numero_parcelas NOT IN ('1', 'x') AND fixo = 0
+    ''', (user_id, cartao_id)).fetchone()[0]
+    if ultimo is None:
+        return []
+    ano, mes = inicio.year, inicio.month
+    meses = []
+    while f'{ano:04d}-{mes:02d}' <= ultimo[:7]:
+        fim = f'{ano + 1:04d}-01-01' if mes == 12 else f'{ano:04d}-{mes + 1:02d}-01'
+        total = conn.execute('''
+            SELECT SUM(valor) FROM despesa
+            WHERE usuario_id = ? AND cartao_id = ? AND pago = 0 AND numero_parcelas NOT IN ('1', 'x') AND fixo = 0
+              AND data_inicio >= ? AND data_inicio < ?
+        ''', (user_id, cartao_id, f'{ano:04d}-{mes:02d}-01', fim)).fetchone()[0]
+        if total:
+            meses.append((f'{ano:04d}-{mes:02d}', round(total, 2)))
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+    return meses
+
+
+def main():
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    hoje = date.today()
+    print(f'Gerando {linhas} linhas para 1 usuário...')
+    # Dois anos para trás e seis para frente: parcelas pendentes em todo o horizonte
+    with banco_temporario(linhas=linhas, usuarios=1, ano_inicial=hoje.year - 2, anos=8) as caminho:
+        from app.database import cache_dashboard
+        from app.routes.cartoes import liberacao_limite
+
+        conn = sqlite3.connect(caminho)
+        conn.row_factory = sqlite3.Row
+        cartoes = [row[0] for row in conn.execute('SELECT id FROM cartao_credito WHERE usuario_id = 1')]
+        agrupada = liberacao_limite(conn, 1, hoje.year, hoje.month)
+        for cartao_id in cartoes:
+            esperado = liberacao_mes_a_mes(conn, 1, cartao_id, hoje)
+            assert esperado == [(m['ano_mes'], m['liberado']) for m in agrupada[cartao_id]['meses']]
+        print(f"{len(agrupada[cartoes[0]]['meses'])} meses com parcelas no cartão {cartoes[0]}")
+
+        print(f"{'linha do tempo':<22}{'mês a mês p50/p95 (ms)':>26}{'agrupada p50/p95 (ms)':>26}{'cache p50/p95 (ms)':>24}")
+        cenarios = [
+            ('1 cartão', lambda: liberacao_mes_a_mes(conn, 1, cartoes[0], hoje),
+             lambda: liberacao_limite(conn, 1, hoje.year, hoje.month, cartoes[0])),
+            (f'{len(cartoes)} cartões', lambda: [liberacao_mes_a_mes(conn, 1, c, hoje) for c in cartoes],
+             lambda: liberacao_limite(conn, 1, hoje.year, hoje.month)),
+        ]
+        for i, (nome, antigo, novo) in enumerate(cenarios):
+            chave = f'bench:{i}'
+            cache_dashboard.gravar(chave, novo())
+            a, n = medir(antigo, repeticoes=20), medir(novo, repeticoes=20)
+            em_cache = medir(lambda: cache_dashboard.obter(chave))
+            print(f'{nome:<22}{a[0]:>13.2f} / {a[1]:<11.2f}{n[0]:>13.2f} / {n[1]:<11.2f}{em_cache[0]:>11.3f} / {em_cache[1]:<10.3f}')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
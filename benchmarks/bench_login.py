@@ -0,0 +1,62 @@
+"""Latência da verificação de senha (check_password) por KDF e custo, com um
+login por vez e com logins simultâneos no número de threads da produção
+(gunicorn --workers 4 --threads 2). O KDF libera o GIL, então as threads
+disputam CPU como os workers: o p99 concorrente é o orçamento a configurar
+em PBKDF2_ITERACOES / SCRYPT_N.
+
+    python -m benchmarks.bench_login [simultaneos] [logins_por_thread]
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.routes import auth
+
+CUSTOS = (
+    ('pbkdf2', 100_000),
+    ('pbkdf2', 300_000),
+    ('pbkdf2', 600_000),
+    ('scrypt', 2 ** 14),
+    ('scrypt', 2 ** 15),
+)
+
+
+def configurar(kdf, custo):
+    auth.PASSWORD_KDF = kdf
+    if kdf == 'scrypt':
+        auth.SCRYPT_N = custo
+    else:
+        auth.PBKDF2_ITERACOES = custo
+
+
+def tempos_verificacao(hashed, simultaneos, logins_por_thread):
+    """Tempos (ms) de check_password com `simultaneos` threads verificando ao mesmo tempo"""
+    def rodar(_):
+        tempos = []
+        for _ in range(logins_por_thread):
+            t0 = time.perf_counter()
+            assert auth.check_password('senha-de-teste', hashed)
+            tempos.append((time.perf_counter() - t0) * 1000)
+        return tempos
+
+    with ThreadPoolExecutor(max_workers=simultaneos) as executor:
+        tempos = sorted(t for lista in executor.map(rodar, range(simultaneos)) for t in lista)
+    return tempos[len(tempos) // 2], tempos[min(len(tempos) - 1, int(len(tempos) * 0.99))]
+
+
+def main():
+    simultaneos = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    logins_por_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    print(f"{'kdf / custo':<22}{'1 login p50/p99 (ms)':>24}{f'{simultaneos} simultâneos p50/p99 (ms)':>32}")
+    for kdf, custo in CUSTOS:
+        configurar(kdf, custo)
+        hashed = auth.hash_password('senha-de-teste')
+        sozinho = tempos_verificacao(hashed, 1, logins_por_thread)
+        concorrente = tempos_verificacao(hashed, simultaneos, logins_por_thread)
+        print(f'{f"{kdf} {custo}":<22}{sozinho[0]:>11.1f} / {sozinho[1]:<10.1f}'
+              f'{concorrente[0]:>17.1f} / {concorrente[1]:<10.1f}')
+
+
+if __name__ == '__main__':
+    main()
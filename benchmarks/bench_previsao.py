@@ -0,0 +1,126 @@
+"""Previsão de saldo de 5 anos para um usuário pesado: laço em Python por
+lançamento e por dia vs. app.previsao.projetar_saldo (NumPy).
+
+    python -m benchmarks.bench_previsao [linhas_por_usuario] [series_abertas]
+"""
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+from benchmarks.dados_sinteticos import banco_temporario, medir
+
+MESES = 60
+
+
+def projetar_com_laco(conn, user_id, saldo_inicial, meses, hoje):
+    """A mesma projeção calculada dia a dia, sem NumPy"""
+    from app.database import PASSOS_RECORRENCIA, _data_no_mes
+    from app.previsao import _LANCAMENTOS, _SERIES_ABERTAS
+
+    mes_atual = hoje.year * 12 + hoje.month - 1
+    inicio_mes = _data_no_mes(mes_atual, 1)
+    proximo_mes = _data_no_mes(mes_atual + 1, 1)
+    fim = _data_no_mes(mes_atual + meses + 1, 1)
+
+    def no_vencimento(data, dia_vencimento):
+        if dia_vencimento is None:
+            return data
+        return _data_no_mes(data.year * 12 + data.month - 1, dia_vencimento)
+
+    eventos = []
+    for sinal, data, valor, dia_vencimento in conn.execute(
+        _LANCAMENTOS, (user_id, inicio_mes.isoformat(), fim.isoformat(), proximo_mes.isoformat()) * 2
+    ):
+        eventos.append((no_vencimento(date.fromisoformat(data), dia_vencimento), sinal * valor))
+    for sinal, tipo, ultima, ancora, valor, dia_vencimento in conn.execute(
+        _SERIES_ABERTAS, (user_id, fim.isoformat())
+    ):
+        passo = PASSOS_RECORRENCIA.get(tipo)
+        if not passo:
+            continue
+        meses_passo, dias_passo = passo
+        ultima = date.fromisoformat(ultima)
+        k = 1
+        while True:
+            if dias_passo:
+                data = ultima + timedelta(days=dias_passo * k)
+            else:
+                data = _data_no_mes(ultima.year * 12 + ultima.month - 1 + meses_passo * k, ancora)
+            if data >= fim:
+                break
+            eventos.append((no_vencimento(data, dia_vencimento), sinal * (valor or 0)))
+            k += 1
+
+    por_dia = {}
+    for data, valor in eventos:
+        if inicio_mes <= data < fim:
+            dia = max(data, hoje)
+            por_dia[dia] = por_dia.get(dia, 0) + valor
+    saldo, atual, dia = [], saldo_inicial, hoje
+    while dia < fim:
+        atual += por_dia.get(dia, 0)
+        saldo.append(atual)
+        dia += timedelta(days=1)
+    return saldo
+
+
+def criar_series_abertas(caminho, user_id, quantidade, hoje, semente=7):
+    """Séries sem data_fim já materializadas até perto de hoje"""
+    import sqlite3
+    rnd = random.Random(semente)
+    conn = sqlite3.connect(caminho)
+    categorias = [r[0] for r in conn.execute('SELECT id FROM categoria_despesa WHERE usuario_id = ?', (user_id,))]
+    receitas = [r[0] for r in conn.execute('SELECT id FROM categoria_receita WHERE usuario_id = ?', (user_id,))]
+    cartoes = [r[0] for r in conn.execute('SELECT id FROM cartao_credito WHERE usuario_id = ?', (user_id,))]
+    tipos = ['mensal', 'mensal', 'mensal', 'semanal', 'quinzenal', 'trimestral', 'anual']
+    for _ in range(quantidade):
+        receita = rnd.random() < 0.2
+        ultima = hoje - timedelta(days=rnd.randrange(1, 40))
+        conn.execute('''
+            INSERT INTO serie_recorrencia (usuario_id, tabela, tipo_recorrencia, dia_comum, data_inicio,
+                                           categoria_id, valor, cartao_id, ultima_data)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            user_id, 'receita' if receita else 'despesa', rnd.choice(tipos), rnd.randint(1, 31),
+            (ultima - timedelta(days=365)).isoformat(),
+            rnd.choice(receitas if receita else categorias), round(rnd.uniform(10, 3000), 2),
+            None if receita or rnd.random() < 0.5 else rnd.choice(cartoes), ultima.isoformat()
+        ))
+    conn.commit()
+    conn.close()
+
+
+def main():
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    series = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    hoje = date.today()
+    print(f'Gerando {linhas} linhas e {series} séries abertas para 1 usuário...')
+    # Dois anos para trás e seis para frente: há pendências em todo o horizonte
+    with banco_temporario(linhas=linhas, usuarios=1, ano_inicial=hoje.year - 2, anos=8) as caminho:
+        criar_series_abertas(caminho, 1, series, hoje)
+        # app.database lê DB_PATH na importação
+        os.environ['DB_PATH'] = caminho
+        from app.database import _abrir_conexao
+        from app.previsao import projetar_saldo
+
+        conn = _abrir_conexao()
+        saldo_inicial = 1000.0
+        numpy = projetar_saldo(conn, 1, saldo_inicial, MESES, hoje)['saldo']
+        laco = projetar_com_laco(conn, 1, saldo_inicial, MESES, hoje)
+        assert len(numpy) == len(laco)
+        assert all(abs(a - b) < 0.05 for a, b in zip(numpy, laco))
+        print(f'{len(numpy)} dias, saldo final {numpy[-1]:.2f}')
+
+        print(f"{'previsão':<22}{'p50 (ms)':>12}{'p95 (ms)':>12}")
+        for nome, func in [
+            ('laço em Python', lambda: projetar_com_laco(conn, 1, saldo_inicial, MESES, hoje)),
+            ('NumPy', lambda: projetar_saldo(conn, 1, saldo_inicial, MESES, hoje)),
+        ]:
+            p50, p95 = medir(func, repeticoes=20)
+            print(f'{nome:<22}{p50:>12.2f}{p95:>12.2f}')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Compara a conversão antiga das listagens (dict + strptime + type('obj', ...)
+por linha) com Registro (classe com __slots__ por formato de consulta e datas
+convertidas sob demanda): tempo de montagem, memória alocada e render dos
+itens da listagem de despesas.
+
+    python -m benchmarks.bench_registros [linhas]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.dados_sinteticos import banco_temporario, medir
+
+CONSULTA = '''
+    SELECT d.*, cd.nome as categoria_nome, sd.nome as subcategoria_nome,
+           cc.nome_cartao as cartao_nome, cc.ultimos_digitos as cartao_digitos
+    FROM despesa d
+    JOIN categoria_despesa cd ON d.categoria_id = cd.id
+    LEFT JOIN subcategoria_despesa sd ON d.subcategoria_id = sd.id
+    LEFT JOIN cartao_credito cc ON d.cartao_id = cc.id
+    WHERE d.usuario_id = ?
+    ORDER BY d.data_inicio DESC, d.id DESC LIMIT ?
+'''
+
+
+def objetos_antigos(conn, limite):
+    """Réplica da conversão antiga de despesas.index"""
+    despesas = []
+    for despesa in conn.execute(CONSULTA, (1, limite)).fetchall():
+        despesa_dict = dict(despesa)
+        if despesa_dict['data_inicio']:
+            try:
+                despesa_dict['data_inicio'] = datetime.strptime(despesa_dict['data_inicio'], '%Y-%m-%d')
+            except ValueError:
+                despesa_dict['data_inicio'] = None
+        if despesa_dict.get('data_fim'):
+            try:
+                despesa_dict['data_fim'] = datetime.strptime(despesa_dict['data_fim'], '%Y-%m-%d')
+            except ValueError:
+                despesa_dict['data_fim'] = None
+        despesas.append(type('obj', (object,), despesa_dict))
+    return despesas
+
+
+def memoria_alocada(func):
+    """Pico de memória (KiB) alocada por func(), medido com tracemalloc"""
+    gc.collect()
+    tracemalloc.start()
+    resultado = func()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del resultado
+    return pico / 1024
+
+
+def main():
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    print(f'Gerando {linhas} linhas para 1 usuário...')
+    with banco_temporario(linhas=linhas, usuarios=1) as caminho:
+        # app.database lê DB_PATH na importação
+        os.environ['DB_PATH'] = caminho
+        from flask import get_template_attribute
+        from app import create_app
+        from app.database import get_db_connection, consultar_registros
+
+        app = create_app()
+        with app.test_request_context():
+            conn = get_db_connection()
+            linha_tabela = get_template_attribute('despesas/_itens.html', 'linha_tabela')
+
+            def registros(limite):
+                return consultar_registros(conn, CONSULTA, (1, limite))
+
+            antigo = lambda limite: objetos_antigos(conn, limite)
+            print(f"{'linhas':<8}{'':<10}{'montagem p50 (ms)':>20}{'memória (KiB)':>16}{'render p50 (ms)':>18}")
+            for limite in (50, 500, 5000):
+                for nome, montar in (('antigo', antigo), ('Registro', registros)):
+                    montagem = medir(lambda: montar(limite), repeticoes=20)
+                    memoria = memoria_alocada(lambda: montar(limite))
+                    tempo_render = medir(lambda: ''.join(linha_tabela(d) for d in montar(limite)), repeticoes=5)
+                    print(f'{limite:<8}{nome:<10}{montagem[0]:>20.2f}{memoria:>16.0f}{tempo_render[0]:>18.2f}')
+
+
+if __name__ == '__main__':
+    main()
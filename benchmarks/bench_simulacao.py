@@ -0,0 +1,79 @@
+"""Simulação de compra parcelada: gravar as parcelas, recalcular limite e
+saldo mês a mês e desfazer (sem o motor de simulação) vs. simulacao com a base
+fria (lida do banco) e quente (do cache, só a sobreposição em memória).
+
+    python -m benchmarks.bench_simulacao [linhas_por_usuario]
+"""
+import os
+import sys
+from datetime import date
+
+from benchmarks.dados_sinteticos import banco_temporario, medir
+
+PARCELAS = 12
+VALOR_TOTAL = 6000.0
+
+
+def gravar_e_desfazer(conn, user_id, cartao_id, hoje, mes_primeira_fatura):
+    """A mesma resposta gravando as parcelas numa transação desfeita no fim"""
+    from app.database import gerar_parcelas_despesa, periodo_compra_parcelada
+    from app.routes.cartoes import bloqueado_por_cartao
+    from app.routes.dashboard import resumo_ano
+    from app.simulacao import SIMULACAO_MESES, ano_meses
+
+    dia_vencimento = conn.execute('SELECT dia_vencimento FROM cartao_credito WHERE id = ?', (cartao_id,)).fetchone()[0]
+    categoria = conn.execute('SELECT id FROM categoria_despesa WHERE usuario_id = ? LIMIT 1', (user_id,)).fetchone()[0]
+    data_inicio, data_fim = periodo_compra_parcelada(dia_vencimento, mes_primeira_fatura, PARCELAS)
+    gerar_parcelas_despesa(categoria, None, data_inicio, data_fim, 'mensal', VALOR_TOTAL / PARCELAS, None,
+                           user_id, cartao_id=cartao_id, conn=conn)
+    janela = ano_meses(hoje.year, hoje.month, SIMULACAO_MESES)
+    for ano_mes in janela:
+        ano, mes = map(int, ano_mes.split('-'))
+        bloqueado_por_cartao(conn, user_id, ano, mes, cartao_id)
+    for ano in range(hoje.year, int(janela[-1][:4]) + 1):
+        resumo_ano(conn, user_id, ano)
+    conn.rollback()
+
+
+def main():
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    hoje = date.today()
+    mes_primeira_fatura = f'{hoje.year + hoje.month // 12:04d}-{hoje.month % 12 + 1:02d}'
+    print(f'Gerando {linhas} linhas para 1 usuário...')
+    # Dois anos para trás e seis para frente: faturas e parcelas em toda a janela
+    with banco_temporario(linhas=linhas, usuarios=1, ano_inicial=hoje.year - 2, anos=8) as caminho:
+        # app.database lê DB_PATH na importação
+        os.environ['DB_PATH'] = caminho
+        from app import simulacao
+        from app.database import _abrir_conexao
+        from app.routes.dashboard import resumo_ano
+
+        conn = _abrir_conexao()
+        cartao_id = conn.execute('SELECT id FROM cartao_credito WHERE usuario_id = 1 LIMIT 1').fetchone()[0]
+        janela = simulacao.ano_meses(hoje.year, hoje.month, simulacao.SIMULACAO_MESES)
+
+        def base_fria():
+            base = simulacao.base_cartao(conn, 1, cartao_id, hoje.year, hoje.month)
+            resumos = [resumo_ano(conn, 1, ano) for ano in range(hoje.year, int(janela[-1][:4]) + 1)]
+            return simulacao.incluir_saldos(base, resumos)
+
+        def simular(base):
+            parcelas = simulacao.parcelas_compra(
+                base['cartao']['dia_vencimento'], VALOR_TOTAL, PARCELAS, mes_primeira_fatura
+            )
+            return simulacao.simular_compra(base, parcelas)
+
+        base = base_fria()
+        print(f"{'simulação':<28}{'p50 (ms)':>12}{'p95 (ms)':>12}")
+        for nome, func in [
+            ('gravar e desfazer', lambda: gravar_e_desfazer(conn, 1, cartao_id, hoje, mes_primeira_fatura)),
+            ('base fria + sobreposição', lambda: simular(base_fria())),
+            ('base em cache', lambda: simular(base)),
+        ]:
+            p50, p95 = medir(func)
+            print(f'{nome:<28}{p50:>12.3f}{p95:>12.3f}')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Geração de bancos SQLite sintéticos para os benchmarks"""
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+
+def criar_banco(linhas=500_000, usuarios=100, ano_inicial=2015, anos=10, semente=42, caminho=None):
+    """Cria um banco com o esquema atual e `linhas` despesas/receitas sintéticas.
+
+    As linhas são divididas entre despesa (70%) e receita (30%) e distribuídas
+    uniformemente entre `usuarios` e entre os `anos` a partir de `ano_inicial`.
+    Cerca de metade das despesas fica em cartão de crédito. Retorna o caminho
+    do arquivo criado.
+    """
+    if caminho is None:
+        fd, caminho = tempfile.mkstemp(suffix='.db', prefix='bench_')
+        os.close(fd)
+        os.remove(caminho)
+
+    anterior = os.environ.get('DB_PATH')
+    os.environ['DB_PATH'] = caminho
+    try:
+        from init_db import init_db
+        init_db()
+    finally:
+        if anterior is None:
+            os.environ.pop('DB_PATH', None)
+        else:
+            os.environ['DB_PATH'] = anterior
+
+    rnd = random.Random(semente)
+    conn = sqlite3.connect(caminho)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+
+    cat_despesa, cat_receita, cartoes = {}, {}, {}
+    for u in range(1, usuarios + 1):
+        conn.execute('INSERT INTO usuario (id, username, password_hash) VALUES (?, ?, ?)', (u, f'user{u}', 'x'))
+        cat_despesa[u] = [
+            conn.execute('INSERT INTO categoria_despesa (nome, usuario_id) VALUES (?, ?)', (f'Despesa {i}', u)).lastrowid
+            for i in range(8)
+        ]
+        cat_receita[u] = [
+            conn.execute('INSERT INTO categoria_receita (nome, usuario_id) VALUES (?, ?)', (f'Receita {i}', u)).lastrowid
+            for i in range(3)
+        ]
+        cartoes[u] = [
+            conn.execute('''
+                INSERT INTO cartao_credito (usuario_id, instituicao_id, nome_cartao, ultimos_digitos,
+                                            limite_total, dia_vencimento, dia_fechamento)
+                VALUES (?, ?, ?, '0000', 10000, 10, 3)
+            ''', (u, i + 1, f'Cartão {i}')).lastrowid
+            for i in range(2)
+        ]
+
+    inicio = date(ano_inicial, 1, 1)
+    dias = anos * 365
+    recorrencias = ['unica', 'mensal', 'mensal', 'semanal', 'anual']
+
+    def data_aleatoria():
+        return (inicio + timedelta(days=rnd.randrange(dias))).isoformat()
+
+    n_despesas = int(linhas * 0.7)
+    despesas = []
+    for _ in range(n_despesas):
+        u = rnd.randint(1, usuarios)
+        parcelas = rnd.choice(['1', '1', '1', '12', 'x'])
+        despesas.append((
+            rnd.choice(cat_despesa[u]), data_aleatoria(), rnd.choice(recorrencias), parcelas,
+            round(rnd.uniform(5, 900), 2), u, rnd.random() < 0.6,
+            rnd.choice(cartoes[u]) if rnd.random() < 0.5 else None
+        ))
+    conn.executemany('''
+        INSERT INTO despesa (categoria_id, data_inicio, tipo_recorrencia, numero_parcelas, valor, usuario_id, pago, cartao_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', despesas)
+
+    receitas = []
+    for _ in range(linhas - n_despesas):
+        u = rnd.randint(1, usuarios)
+        receitas.append((
+            rnd.choice(cat_receita[u]), data_aleatoria(), rnd.choice(recorrencias),
+            round(rnd.uniform(50, 5000), 2), u, rnd.random() < 0.7
+        ))
+    conn.executemany('''
+        INSERT INTO receita (categoria_id, data_inicio, tipo_recorrencia, valor, usuario_id, pago)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', receitas)
+
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    return caminho
+
+
+def medir(func, repeticoes=50):
+    """Executa `func` várias vezes e retorna (mediana, p95) em milissegundos"""
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        func()
+        tempos.append((time.perf_counter() - t0) * 1000)
+    tempos.sort()
+    return tempos[len(tempos) // 2], tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))]
+
+
+@contextmanager
+def banco_temporario(**kwargs):
+    """Context manager que cria um banco sintético e o remove ao final"""
+    caminho = criar_banco(**kwargs)
+    try:
+        yield caminho
+    finally:
+        for sufixo in ('', '-wal', '-shm'):
+            if os.path.exists(caminho + sufixo):
+                os.remove(caminho + sufixo)
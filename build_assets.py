@@ -0,0 +1,15 @@
+"""Gera app/static/dist (estáticos com hash no nome e versões .gz/.br).
+
+    python build_assets.py            # depois do `npm run build`
+    python build_assets.py --vendor   # baixa antes as bibliotecas de terceiros
+"""
+import sys
+
+from app.assets import PASTA_DIST, baixar_vendor, construir
+
+if __name__ == '__main__':
+    if '--vendor' in sys.argv:
+        baixar_vendor()
+    manifest = construir()
+    print(f"✅ {len(manifest['arquivos'])} arquivos em app/static/{PASTA_DIST}, "
+          f"{len(manifest['comprimidos'])} com versões comprimidas")
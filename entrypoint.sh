@@ -3,11 +3,15 @@
 # Espera o banco de dados estar disponível (se aplicável, para garantir que o volume esteja montado)
 # sleep 5
 
+# Aplica as migrações pendentes uma única vez, antes de subir os workers
+# (eles só conferem a versão do esquema na primeira requisição)
+FLASK_APP=wsgi flask db upgrade || exit 1
+
 # Define o proprietário e as permissões corretas para o arquivo do banco de dados
 chown app:app /data/financas.db
 chmod 666 /data/financas.db
 
 # Executa o comando original da aplicação (Gunicorn)
-exec gunicorn --bind 0.0.0.0:8000 --workers 4 --threads 2 wsgi:app
-
-
+# --preload: a aplicação é carregada uma vez no master e compartilhada pelos workers
+# (create_app não abre conexões, e o pool de cada worker começa vazio após o fork)
+exec gunicorn --bind 0.0.0.0:8000 --workers 4 --threads 2 --preload wsgi:app
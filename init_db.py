@@ -1,158 +1,1330 @@
 import sqlite3
 import os
+import sys
 from datetime import datetime
 
-def init_db():
-    """Inicializa o banco de dados com as tabelas necessárias"""
-    # Define o caminho do banco de dados
-    DATABASE = os.environ.get('DB_PATH', 'financas.db')
-    
-    # Garante que o diretório do banco de dados existe
-    db_dir = os.path.dirname(os.path.abspath(DATABASE))
-    if db_dir and not os.path.exists(db_dir):
-        os.makedirs(db_dir, exist_ok=True)
-    
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    
-    # Tabela de usuários
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS usuario (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL UNIQUE,
-            password_hash TEXT NOT NULL,
-            nome_completo TEXT,
-            email TEXT,
-            ativo BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+# ---------------------------------------------------------------------------
+# Saldo mensal materializado
+# ---------------------------------------------------------------------------
+# saldo_mensal guarda, por usuário e mês (YYYY-MM), o total de receitas e
+# despesas PAGAS no mês e o saldo acumulado até o fim dele. Triggers em
+# receita/despesa ajustam só o mês afetado e os posteriores, então qualquer
+# caminho de escrita (rotas, lote de fatura, scripts) mantém o saldo em dia.
+
+
+def _triggers_saldo_mensal(tabela, coluna, sinal):
+    """Gera as triggers que mantêm saldo_mensal a partir de `tabela`.
+
+    `coluna` é receitas_pagas ou despesas_pagas; `sinal` é +1 para receita e
+    -1 para despesa (efeito no saldo acumulado).
+    """
+    def adicionar(ref, fator):
+        mes = f'substr({ref}.data_inicio, 1, 7)'
+        return f'''
+            INSERT OR IGNORE INTO saldo_mensal (usuario_id, ano_mes, saldo_acumulado)
+            VALUES ({ref}.usuario_id, {mes}, COALESCE((
+                SELECT saldo_acumulado FROM saldo_mensal
+                WHERE usuario_id = {ref}.usuario_id AND ano_mes < {mes}
+                ORDER BY ano_mes DESC LIMIT 1
+            ), 0));
+            UPDATE saldo_mensal SET {coluna} = {coluna} + ({fator}) * {ref}.valor
+            WHERE usuario_id = {ref}.usuario_id AND ano_mes = {mes};
+            UPDATE saldo_mensal SET saldo_acumulado = saldo_acumulado + ({fator * sinal}) * {ref}.valor
+            WHERE usuario_id = {ref}.usuario_id AND ano_mes >= {mes};
+        '''
+
+    mudou = (
+        'NEW.pago IS NOT OLD.pago OR NEW.valor IS NOT OLD.valor '
+        'OR NEW.data_inicio IS NOT OLD.data_inicio OR NEW.usuario_id IS NOT OLD.usuario_id'
+    )
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tabela}_saldo_insert AFTER INSERT ON {tabela}
+        WHEN NEW.pago = 1 AND NEW.usuario_id IS NOT NULL
+        BEGIN {adicionar('NEW', 1)} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tabela}_saldo_delete AFTER DELETE ON {tabela}
+        WHEN OLD.pago = 1 AND OLD.usuario_id IS NOT NULL
+        BEGIN {adicionar('OLD', -1)} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tabela}_saldo_update_old
+        AFTER UPDATE OF pago, valor, data_inicio, usuario_id ON {tabela}
+        WHEN OLD.pago = 1 AND OLD.usuario_id IS NOT NULL AND ({mudou})
+        BEGIN {adicionar('OLD', -1)} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tabela}_saldo_update_new
+        AFTER UPDATE OF pago, valor, data_inicio, usuario_id ON {tabela}
+        WHEN NEW.pago = 1 AND NEW.usuario_id IS NOT NULL AND ({mudou})
+        BEGIN {adicionar('NEW', 1)} END
+        ''',
+    ]
+
+
+# Saldo mensal recalculado do zero a partir dos lançamentos pagos
+_SALDO_MENSAL_CALCULADO = '''
+    SELECT usuario_id, ano_mes, receitas_pagas, despesas_pagas,
+           SUM(receitas_pagas - despesas_pagas) OVER (
+               PARTITION BY usuario_id ORDER BY ano_mes
+           ) AS saldo_acumulado
+    FROM (
+        SELECT usuario_id, ano_mes, SUM(receita) AS receitas_pagas, SUM(despesa) AS despesas_pagas
+        FROM (
+            SELECT usuario_id, substr(data_inicio, 1, 7) AS ano_mes, valor AS receita, 0 AS despesa
+            FROM receita WHERE pago = 1 AND usuario_id IS NOT NULL {filtro}
+            UNION ALL
+            SELECT usuario_id, substr(data_inicio, 1, 7), 0, valor
+            FROM despesa WHERE pago = 1 AND usuario_id IS NOT NULL {filtro}
         )
-    ''')
-    
-    # Tabela de categorias de receitas
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS categoria_receita (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT NOT NULL,
-            descricao TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            usuario_id INTEGER
+        GROUP BY usuario_id, ano_mes
+    )
+'''
+
+
+def reconstruir_saldo_mensal(conn, usuario_id=None):
+    """Recalcula saldo_mensal do zero (de um usuário ou de todos).
+
+    Não faz commit: quem chama controla a transação.
+    """
+    if usuario_id is None:
+        conn.execute('DELETE FROM saldo_mensal')
+        conn.execute(
+            'INSERT INTO saldo_mensal (usuario_id, ano_mes, receitas_pagas, despesas_pagas, saldo_acumulado) '
+            + _SALDO_MENSAL_CALCULADO.format(filtro='')
         )
-    ''')
-    
-    # Tabela de subcategorias de receitas
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS subcategoria_receita (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT NOT NULL,
-            categoria_id INTEGER NOT NULL,
-            descricao TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            usuario_id INTEGER,
-            FOREIGN KEY (categoria_id) REFERENCES categoria_receita (id)
+    else:
+        conn.execute('DELETE FROM saldo_mensal WHERE usuario_id = ?', (usuario_id,))
+        conn.execute(
+            'INSERT INTO saldo_mensal (usuario_id, ano_mes, receitas_pagas, despesas_pagas, saldo_acumulado) '
+            + _SALDO_MENSAL_CALCULADO.format(filtro='AND usuario_id = ?'),
+            (usuario_id, usuario_id)
         )
-    ''')
-    
-    # Tabela de categorias de despesas
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS categoria_despesa (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT NOT NULL,
-            descricao TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            usuario_id INTEGER
+
+
+def verificar_saldo_mensal(conn, usuario_id=None, tolerancia=0.01):
+    """Compara saldo_mensal com o recálculo a partir dos lançamentos.
+
+    Retorna uma lista de dicts (usuario_id, ano_mes, campo, gravado, esperado)
+    para cada divergência acima da tolerância. Meses sem lançamento pago que
+    existem só no livro (ex: após exclusões) são aceitos se zerados e com o
+    saldo acumulado correto.
+    """
+    filtro = 'AND usuario_id = ?' if usuario_id is not None else ''
+    params = (usuario_id, usuario_id) if usuario_id is not None else ()
+    esperado = {
+        (r[0], r[1]): r
+        for r in conn.execute(_SALDO_MENSAL_CALCULADO.format(filtro=filtro), params)
+    }
+    if usuario_id is None:
+        gravado = conn.execute(
+            'SELECT usuario_id, ano_mes, receitas_pagas, despesas_pagas, saldo_acumulado FROM saldo_mensal ORDER BY usuario_id, ano_mes'
+        ).fetchall()
+    else:
+        gravado = conn.execute(
+            'SELECT usuario_id, ano_mes, receitas_pagas, despesas_pagas, saldo_acumulado FROM saldo_mensal WHERE usuario_id = ? ORDER BY ano_mes',
+            (usuario_id,)
+        ).fetchall()
+
+    divergencias = []
+    campos = ('receitas_pagas', 'despesas_pagas', 'saldo_acumulado')
+    vistos = set()
+    saldo_por_usuario = {}
+    for row in gravado:
+        chave = (row[0], row[1])
+        vistos.add(chave)
+        if chave in esperado:
+            ref = esperado[chave]
+            saldo_por_usuario[row[0]] = ref[4]
+            valores_esperados = (ref[2], ref[3], ref[4])
+        else:
+            # Mês só no livro: deve estar zerado e carregar o saldo anterior
+            valores_esperados = (0, 0, saldo_por_usuario.get(row[0], 0))
+        for campo, atual, certo in zip(campos, row[2:], valores_esperados):
+            if abs((atual or 0) - (certo or 0)) > tolerancia:
+                divergencias.append({
+                    'usuario_id': row[0], 'ano_mes': row[1], 'campo': campo,
+                    'gravado': atual, 'esperado': certo
+                })
+    for chave, ref in esperado.items():
+        if chave not in vistos:
+            divergencias.append({
+                'usuario_id': chave[0], 'ano_mes': chave[1], 'campo': 'ausente',
+                'gravado': None, 'esperado': ref[4]
+            })
+    return divergencias
+
+
+# ---------------------------------------------------------------------------
+# Limite comprometido por cartão
+# ---------------------------------------------------------------------------
+# cartao_uso guarda, por usuário e cartão, a soma e a quantidade das parcelas
+# de compras parceladas ainda não pagas (numero_parcelas diferente de '1'/'x'
+# e não fixas): a parte do valor_bloqueado que não depende do mês. Triggers em
+# despesa ajustam o cartão afetado na mesma transação da escrita.
+
+# Condição de uma despesa contar no parcelado pendente do cartão
+_PARCELADO_PENDENTE = (
+    "{ref}.pago = 0 AND {ref}.cartao_id IS NOT NULL AND {ref}.usuario_id IS NOT NULL "
+    "AND {ref}.numero_parcelas != '1' AND {ref}.numero_parcelas != 'x' AND {ref}.fixo = 0"
+)
+
+
+def _triggers_cartao_uso():
+    """Gera as triggers que mantêm cartao_uso a partir de despesa"""
+    def ajustar(ref, fator):
+        # Ao zerar a quantidade, zera também o total (sem resíduo de ponto flutuante)
+        return f'''
+            INSERT OR IGNORE INTO cartao_uso (usuario_id, cartao_id)
+            VALUES ({ref}.usuario_id, {ref}.cartao_id);
+            UPDATE cartao_uso
+            SET parcelas_pendentes = parcelas_pendentes + ({fator}),
+                parcelado_pendente = CASE WHEN parcelas_pendentes + ({fator}) = 0 THEN 0
+                                          ELSE parcelado_pendente + ({fator}) * {ref}.valor END
+            WHERE usuario_id = {ref}.usuario_id AND cartao_id = {ref}.cartao_id;
+        '''
+
+    colunas = 'pago, valor, cartao_id, numero_parcelas, fixo, usuario_id'
+    mudou = ' OR '.join(f'NEW.{c} IS NOT OLD.{c}' for c in colunas.split(', '))
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_despesa_cartao_uso_insert AFTER INSERT ON despesa
+        WHEN {_PARCELADO_PENDENTE.format(ref='NEW')}
+        BEGIN {ajustar('NEW', 1)} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_despesa_cartao_uso_delete AFTER DELETE ON despesa
+        WHEN {_PARCELADO_PENDENTE.format(ref='OLD')}
+        BEGIN {ajustar('OLD', -1)} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_despesa_cartao_uso_update_old
+        AFTER UPDATE OF {colunas} ON despesa
+        WHEN {_PARCELADO_PENDENTE.format(ref='OLD')} AND ({mudou})
+        BEGIN {ajustar('OLD', -1)} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_despesa_cartao_uso_update_new
+        AFTER UPDATE OF {colunas} ON despesa
+        WHEN {_PARCELADO_PENDENTE.format(ref='NEW')} AND ({mudou})
+        BEGIN {ajustar('NEW', 1)} END
+        ''',
+    ]
+
+
+# cartao_uso recalculado do zero a partir das despesas
+_CARTAO_USO_CALCULADO = f'''
+    SELECT usuario_id, cartao_id, SUM(valor) AS parcelado_pendente, COUNT(*) AS parcelas_pendentes
+    FROM despesa d
+    WHERE {_PARCELADO_PENDENTE.format(ref='d')} {{filtro}}
+    GROUP BY usuario_id, cartao_id
+'''
+
+
+def reconstruir_cartao_uso(conn, usuario_id=None):
+    """Recalcula cartao_uso do zero (de um usuário ou de todos).
+
+    Não faz commit: quem chama controla a transação.
+    """
+    if usuario_id is None:
+        conn.execute('DELETE FROM cartao_uso')
+        conn.execute(
+            'INSERT INTO cartao_uso (usuario_id, cartao_id, parcelado_pendente, parcelas_pendentes) '
+            + _CARTAO_USO_CALCULADO.format(filtro='')
         )
-    ''')
-    
-    # Tabela de subcategorias de despesas
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS subcategoria_despesa (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT NOT NULL,
-            categoria_id INTEGER NOT NULL,
-            descricao TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            usuario_id INTEGER,
-            FOREIGN KEY (categoria_id) REFERENCES categoria_despesa (id)
+    else:
+        conn.execute('DELETE FROM cartao_uso WHERE usuario_id = ?', (usuario_id,))
+        conn.execute(
+            'INSERT INTO cartao_uso (usuario_id, cartao_id, parcelado_pendente, parcelas_pendentes) '
+            + _CARTAO_USO_CALCULADO.format(filtro='AND d.usuario_id = ?'),
+            (usuario_id,)
         )
-    ''')
-    
-    # Tabela de receitas
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS receita (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            categoria_id INTEGER NOT NULL,
-            subcategoria_id INTEGER,
-            data_inicio DATE NOT NULL,
-            data_fim DATE,
-            tipo_recorrencia TEXT NOT NULL DEFAULT 'mensal',
-            dia_comum_recebimento INTEGER,
-            valor REAL NOT NULL,
-            numero_parcelas TEXT NOT NULL DEFAULT '1',
-            parcela_atual INTEGER DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            usuario_id INTEGER,
-            fixo BOOLEAN DEFAULT 0,
-            pago BOOLEAN DEFAULT 0,
-            FOREIGN KEY (categoria_id) REFERENCES categoria_receita (id),
-            FOREIGN KEY (subcategoria_id) REFERENCES subcategoria_receita (id)
+
+
+def verificar_cartao_uso(conn, usuario_id=None, tolerancia=0.01):
+    """Compara cartao_uso com o recálculo a partir das despesas.
+
+    Retorna uma lista de dicts (usuario_id, cartao_id, gravado, esperado) para
+    cada cartão cujo total diverge acima da tolerância ou cuja quantidade de
+    parcelas difere. Cartões zerados que só existem em cartao_uso são aceitos.
+    """
+    filtro = 'AND d.usuario_id = ?' if usuario_id is not None else ''
+    params = (usuario_id,) if usuario_id is not None else ()
+    esperado = {
+        (r[0], r[1]): (r[2], r[3])
+        for r in conn.execute(_CARTAO_USO_CALCULADO.format(filtro=filtro), params)
+    }
+    gravado = conn.execute(
+        'SELECT usuario_id, cartao_id, parcelado_pendente, parcelas_pendentes FROM cartao_uso '
+        + ('WHERE usuario_id = ?' if usuario_id is not None else ''),
+        params
+    ).fetchall()
+
+    divergencias = []
+    for row in gravado:
+        total, quantidade = esperado.pop((row[0], row[1]), (0, 0))
+        if abs((row[2] or 0) - total) > tolerancia or (row[3] or 0) != quantidade:
+            divergencias.append({
+                'usuario_id': row[0], 'cartao_id': row[1],
+                'gravado': row[2], 'esperado': total
+            })
+    for (usuario, cartao), (total, _) in esperado.items():
+        divergencias.append({
+            'usuario_id': usuario, 'cartao_id': cartao, 'gravado': None, 'esperado': total
+        })
+    return divergencias
+
+
+def reconciliar_cartao_uso(conn, usuario_id=None):
+    """Detecta divergências em cartao_uso e reconstrói só os usuários afetados.
+
+    Retorna a lista de divergências encontradas (vazia = nada a reparar).
+    Não faz commit: quem chama controla a transação.
+    """
+    divergencias = verificar_cartao_uso(conn, usuario_id)
+    for usuario in sorted({d['usuario_id'] for d in divergencias}):
+        reconstruir_cartao_uso(conn, usuario)
+    return divergencias
+
+
+# ---------------------------------------------------------------------------
+# Faturas de cartão
+# ---------------------------------------------------------------------------
+# Uma fatura agrupa as despesas de cartão de um usuário na mesma instituição e
+# no mesmo mês de vencimento (referencia = YYYY-MM de data_inicio), como na
+# tela de faturas. Triggers ligam cada despesa de cartão à sua fatura ao ser
+# criada (ou ao mudar de cartão/mês) e mantêm itens, total, pagos e status, de
+# modo que quitar/reabrir é um UPDATE por fatura_id e check_fatura só lê a linha.
+
+
+def _vincular_fatura(ref):
+    """SQL que cria (se preciso) a fatura da despesa `ref` e grava seu fatura_id"""
+    return f'''
+        INSERT OR IGNORE INTO fatura (usuario_id, instituicao_id, referencia, vencimento)
+        SELECT {ref}.usuario_id, c.instituicao_id, substr({ref}.data_inicio, 1, 7), {ref}.data_inicio
+        FROM cartao_credito c
+        WHERE c.id = {ref}.cartao_id AND {ref}.usuario_id IS NOT NULL;
+        UPDATE despesa SET fatura_id = (
+            SELECT f.id FROM fatura f
+            JOIN cartao_credito c ON c.instituicao_id = f.instituicao_id
+            WHERE c.id = {ref}.cartao_id AND f.usuario_id = {ref}.usuario_id
+              AND f.referencia = substr({ref}.data_inicio, 1, 7)
         )
-    ''')
-    
-    # Tabela de despesas
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS despesa (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            categoria_id INTEGER NOT NULL,
-            subcategoria_id INTEGER,
-            data_inicio DATE NOT NULL,
-            data_fim DATE,
-            tipo_recorrencia TEXT NOT NULL DEFAULT 'mensal',
-            numero_parcelas TEXT NOT NULL DEFAULT '1',
-            parcela_atual INTEGER DEFAULT 1,
-            dia_comum_pagamento INTEGER,
-            valor REAL NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            usuario_id INTEGER,
-            fixo BOOLEAN DEFAULT 0,
-            pago BOOLEAN DEFAULT 0,
-            cartao_id INTEGER,
-            FOREIGN KEY (categoria_id) REFERENCES categoria_despesa (id),
-            FOREIGN KEY (subcategoria_id) REFERENCES subcategoria_despesa (id),
-            FOREIGN KEY (cartao_id) REFERENCES cartao_credito (id)
+        WHERE id = {ref}.id;
+    '''
+
+
+def _triggers_fatura():
+    """Gera as triggers que ligam despesas às faturas e mantêm os totais"""
+    def ajustar(ref, fator):
+        pago = f'(CASE WHEN {ref}.pago = 1 THEN {fator} ELSE 0 END)'
+        # Contagem zerada zera também o valor (sem resíduo de ponto flutuante)
+        return f'''
+            UPDATE fatura
+            SET itens = itens + ({fator}),
+                total = CASE WHEN itens + ({fator}) = 0 THEN 0 ELSE total + ({fator}) * {ref}.valor END,
+                itens_pagos = itens_pagos + {pago},
+                total_pago = CASE WHEN itens_pagos + {pago} = 0 THEN 0 ELSE total_pago + {pago} * {ref}.valor END
+            WHERE id = {ref}.fatura_id;
+            UPDATE fatura SET status = CASE WHEN itens > 0 AND itens_pagos = itens THEN 'paga' ELSE 'aberta' END
+            WHERE id = {ref}.fatura_id;
+        '''
+
+    mudou_totais = 'NEW.fatura_id IS NOT OLD.fatura_id OR NEW.valor IS NOT OLD.valor OR NEW.pago IS NOT OLD.pago'
+    mudou_fatura = (
+        'NEW.cartao_id IS NOT OLD.cartao_id OR NEW.usuario_id IS NOT OLD.usuario_id '
+        'OR substr(NEW.data_inicio, 1, 7) IS NOT substr(OLD.data_inicio, 1, 7)'
+    )
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_despesa_fatura_vincular_insert AFTER INSERT ON despesa
+        WHEN NEW.cartao_id IS NOT NULL
+        BEGIN {_vincular_fatura('NEW')} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_despesa_fatura_vincular_update
+        AFTER UPDATE OF cartao_id, usuario_id, data_inicio ON despesa
+        WHEN {mudou_fatura}
+        BEGIN {_vincular_fatura('NEW')} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_despesa_fatura_insert AFTER INSERT ON despesa
+        WHEN NEW.fatura_id IS NOT NULL
+        BEGIN {ajustar('NEW', 1)} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_despesa_fatura_delete AFTER DELETE ON despesa
+        WHEN OLD.fatura_id IS NOT NULL
+        BEGIN {ajustar('OLD', -1)} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_despesa_fatura_update_old
+        AFTER UPDATE OF fatura_id, valor, pago ON despesa
+        WHEN OLD.fatura_id IS NOT NULL AND ({mudou_totais})
+        BEGIN {ajustar('OLD', -1)} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_despesa_fatura_update_new
+        AFTER UPDATE OF fatura_id, valor, pago ON despesa
+        WHEN NEW.fatura_id IS NOT NULL AND ({mudou_totais})
+        BEGIN {ajustar('NEW', 1)} END
+        ''',
+        # Cartão trocado de instituição: as despesas dele mudam de fatura
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_cartao_credito_fatura_instituicao
+        AFTER UPDATE OF instituicao_id ON cartao_credito
+        WHEN NEW.instituicao_id IS NOT OLD.instituicao_id
+        BEGIN
+            INSERT OR IGNORE INTO fatura (usuario_id, instituicao_id, referencia, vencimento)
+            SELECT d.usuario_id, NEW.instituicao_id, substr(d.data_inicio, 1, 7), MIN(d.data_inicio)
+            FROM despesa d
+            WHERE d.cartao_id = NEW.id AND d.usuario_id IS NOT NULL
+            GROUP BY d.usuario_id, substr(d.data_inicio, 1, 7);
+            UPDATE despesa SET fatura_id = (
+                SELECT f.id FROM fatura f
+                WHERE f.usuario_id = despesa.usuario_id AND f.instituicao_id = NEW.instituicao_id
+                  AND f.referencia = substr(despesa.data_inicio, 1, 7)
+            )
+            WHERE cartao_id = NEW.id;
+        END
+        ''',
+    ]
+
+
+# Faturas recalculadas do zero a partir das despesas de cartão
+_FATURA_CALCULADA = '''
+    SELECT d.usuario_id, c.instituicao_id, substr(d.data_inicio, 1, 7) AS referencia,
+           COUNT(*) AS itens, SUM(d.valor) AS total,
+           SUM(CASE WHEN d.pago = 1 THEN 1 ELSE 0 END) AS itens_pagos,
+           SUM(CASE WHEN d.pago = 1 THEN d.valor ELSE 0 END) AS total_pago
+    FROM despesa d
+    JOIN cartao_credito c ON d.cartao_id = c.id
+    WHERE d.usuario_id IS NOT NULL {filtro}
+    GROUP BY d.usuario_id, c.instituicao_id, substr(d.data_inicio, 1, 7)
+'''
+
+
+def reconstruir_faturas(conn, usuario_id=None):
+    """Refaz o vínculo despesa -> fatura e os totais das faturas (de um usuário ou de todos).
+
+    Faturas que ficarem sem itens são mantidas, zeradas. Não faz commit: quem
+    chama controla a transação.
+    """
+    filtro = 'AND d.usuario_id = ?' if usuario_id is not None else ''
+    params = (usuario_id,) if usuario_id is not None else ()
+    conn.execute(f'''
+        INSERT OR IGNORE INTO fatura (usuario_id, instituicao_id, referencia, vencimento)
+        SELECT d.usuario_id, c.instituicao_id, substr(d.data_inicio, 1, 7), MIN(d.data_inicio)
+        FROM despesa d
+        JOIN cartao_credito c ON d.cartao_id = c.id
+        WHERE d.usuario_id IS NOT NULL {filtro}
+        GROUP BY d.usuario_id, c.instituicao_id, substr(d.data_inicio, 1, 7)
+    ''', params)
+    conn.execute(f'''
+        UPDATE despesa AS d SET fatura_id = (
+            SELECT f.id FROM fatura f
+            JOIN cartao_credito c ON c.instituicao_id = f.instituicao_id
+            WHERE c.id = d.cartao_id AND f.usuario_id = d.usuario_id
+              AND f.referencia = substr(d.data_inicio, 1, 7)
         )
-    ''')
-    
-    # Tabela de instituições financeiras
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS instituicao_financeira (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT NOT NULL UNIQUE,
-            codigo TEXT,
-            logo_url TEXT,
-            ativo BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        WHERE (d.fatura_id IS NOT NULL OR d.cartao_id IS NOT NULL) {filtro}
+    ''', params)
+    conn.execute(f'''
+        UPDATE fatura SET (itens, total, itens_pagos, total_pago) = (
+            SELECT COUNT(*), COALESCE(SUM(valor), 0),
+                   COALESCE(SUM(CASE WHEN pago = 1 THEN 1 ELSE 0 END), 0),
+                   COALESCE(SUM(CASE WHEN pago = 1 THEN valor ELSE 0 END), 0)
+            FROM despesa WHERE fatura_id = fatura.id
+        )
+        {'WHERE usuario_id = ?' if usuario_id is not None else ''}
+    ''', params)
+    conn.execute(f'''
+        UPDATE fatura SET status = CASE WHEN itens > 0 AND itens_pagos = itens THEN 'paga' ELSE 'aberta' END
+        {'WHERE usuario_id = ?' if usuario_id is not None else ''}
+    ''', params)
+
+
+def verificar_faturas(conn, usuario_id=None, tolerancia=0.01):
+    """Compara as faturas gravadas com o recálculo a partir das despesas.
+
+    Retorna uma lista de dicts (usuario_id, instituicao_id, referencia, campo,
+    gravado, esperado) para cada divergência; faturas zeradas sem despesas são
+    aceitas. Também acusa despesas ligadas à fatura errada (campo 'vinculo').
+    """
+    filtro = 'AND d.usuario_id = ?' if usuario_id is not None else ''
+    params = (usuario_id,) if usuario_id is not None else ()
+    esperado = {
+        (r[0], r[1], r[2]): r[3:]
+        for r in conn.execute(_FATURA_CALCULADA.format(filtro=filtro), params)
+    }
+    gravado = conn.execute(
+        'SELECT usuario_id, instituicao_id, referencia, itens, total, itens_pagos, total_pago FROM fatura '
+        + ('WHERE usuario_id = ?' if usuario_id is not None else ''),
+        params
+    ).fetchall()
+
+    divergencias = []
+    campos = ('itens', 'total', 'itens_pagos', 'total_pago')
+    for row in gravado:
+        chave = (row[0], row[1], row[2])
+        certos = esperado.pop(chave, (0, 0, 0, 0))
+        for campo, atual, certo in zip(campos, row[3:], certos):
+            if abs((atual or 0) - (certo or 0)) > tolerancia:
+                divergencias.append({
+                    'usuario_id': chave[0], 'instituicao_id': chave[1], 'referencia': chave[2],
+                    'campo': campo, 'gravado': atual, 'esperado': certo
+                })
+    for chave, certos in esperado.items():
+        divergencias.append({
+            'usuario_id': chave[0], 'instituicao_id': chave[1], 'referencia': chave[2],
+            'campo': 'ausente', 'gravado': None, 'esperado': certos[1]
+        })
+
+    for d in conn.execute(f'''
+        SELECT d.usuario_id, c.instituicao_id, substr(d.data_inicio, 1, 7), d.id
+        FROM despesa d
+        LEFT JOIN cartao_credito c ON d.cartao_id = c.id
+        LEFT JOIN fatura f ON d.fatura_id = f.id
+        WHERE (d.cartao_id IS NOT NULL OR d.fatura_id IS NOT NULL) {filtro}
+          AND (f.id IS NULL OR f.usuario_id IS NOT d.usuario_id OR f.instituicao_id IS NOT c.instituicao_id
+               OR f.referencia IS NOT substr(d.data_inicio, 1, 7))
+    ''', params):
+        divergencias.append({
+            'usuario_id': d[0], 'instituicao_id': d[1], 'referencia': d[2],
+            'campo': 'vinculo', 'gravado': None, 'esperado': d[3]
+        })
+    return divergencias
+
+
+# ---------------------------------------------------------------------------
+# Gerações por usuário (invalidação de cache)
+# ---------------------------------------------------------------------------
+# geracao_usuario guarda, por usuário, contadores que sobem a cada escrita nos
+# dados que alimentam um cache. As chaves do cache incluem a geração atual, então
+# invalidar é só incrementar o contador — vale para todos os workers e para
+# qualquer caminho de escrita, pois quem incrementa são triggers.
+
+
+def _triggers_geracao(tabela, coluna):
+    """Gera as triggers que incrementam geracao_usuario.`coluna` a cada escrita em `tabela`"""
+    def incrementar(ref):
+        return f'''
+            INSERT INTO geracao_usuario (usuario_id, {coluna}) VALUES ({ref}.usuario_id, 1)
+            ON CONFLICT (usuario_id) DO UPDATE SET {coluna} = {coluna} + 1;
+        '''
+
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tabela}_geracao_insert AFTER INSERT ON {tabela}
+        WHEN NEW.usuario_id IS NOT NULL
+        BEGIN {incrementar('NEW')} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tabela}_geracao_delete AFTER DELETE ON {tabela}
+        WHEN OLD.usuario_id IS NOT NULL
+        BEGIN {incrementar('OLD')} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tabela}_geracao_update_old AFTER UPDATE ON {tabela}
+        WHEN OLD.usuario_id IS NOT NULL
+        BEGIN {incrementar('OLD')} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tabela}_geracao_update_new AFTER UPDATE ON {tabela}
+        WHEN NEW.usuario_id IS NOT NULL AND NEW.usuario_id IS NOT OLD.usuario_id
+        BEGIN {incrementar('NEW')} END
+        ''',
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Agregado por categoria e mês
+# ---------------------------------------------------------------------------
+# agregado_categoria_mes guarda, por usuário, tipo (receita ou despesa), mês
+# (YYYY-MM), categoria, subcategoria (0 = sem subcategoria) e situação (pago),
+# a soma e a quantidade dos lançamentos. As quebras por categoria do dashboard
+# e a tendência de vários meses leem algumas dezenas de linhas daqui em vez de
+# agrupar receita/despesa. Triggers mantêm a tabela em qualquer caminho de
+# escrita; uma combinação que fica sem lançamentos é apagada.
+
+def _triggers_agregado_categoria(tabela):
+    """Gera as triggers que mantêm agregado_categoria_mes a partir de `tabela`"""
+    def ajustar(ref, fator):
+        valores = (
+            f"{ref}.usuario_id, '{tabela}', substr({ref}.data_inicio, 1, 7), {ref}.categoria_id, "
+            f"COALESCE({ref}.subcategoria_id, 0), CASE WHEN {ref}.pago = 1 THEN 1 ELSE 0 END"
         )
+        chave = f'(usuario_id, tipo, ano_mes, categoria_id, subcategoria_id, pago) = ({valores})'
+        # Ao zerar a quantidade a linha sai (sem resíduo de ponto flutuante no total)
+        return f'''
+            INSERT OR IGNORE INTO agregado_categoria_mes
+                (usuario_id, tipo, ano_mes, categoria_id, subcategoria_id, pago)
+            VALUES ({valores});
+            UPDATE agregado_categoria_mes
+            SET total = total + ({fator}) * {ref}.valor, quantidade = quantidade + ({fator})
+            WHERE {chave};
+            DELETE FROM agregado_categoria_mes WHERE {chave} AND quantidade = 0;
+        '''
+
+    colunas = 'pago, valor, data_inicio, categoria_id, subcategoria_id, usuario_id'
+    mudou = ' OR '.join(f'NEW.{c} IS NOT OLD.{c}' for c in colunas.split(', '))
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tabela}_agregado_insert AFTER INSERT ON {tabela}
+        WHEN NEW.usuario_id IS NOT NULL
+        BEGIN {ajustar('NEW', 1)} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tabela}_agregado_delete AFTER DELETE ON {tabela}
+        WHEN OLD.usuario_id IS NOT NULL
+        BEGIN {ajustar('OLD', -1)} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tabela}_agregado_update_old
+        AFTER UPDATE OF {colunas} ON {tabela}
+        WHEN OLD.usuario_id IS NOT NULL AND ({mudou})
+        BEGIN {ajustar('OLD', -1)} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tabela}_agregado_update_new
+        AFTER UPDATE OF {colunas} ON {tabela}
+        WHEN NEW.usuario_id IS NOT NULL AND ({mudou})
+        BEGIN {ajustar('NEW', 1)} END
+        ''',
+    ]
+
+
+# agregado_categoria_mes recalculado do zero a partir dos lançamentos
+_AGREGADO_CATEGORIA_CALCULADO = ' UNION ALL '.join(
+    f'''
+    SELECT usuario_id, '{tabela}', substr(data_inicio, 1, 7), categoria_id, COALESCE(subcategoria_id, 0),
+           CASE WHEN pago = 1 THEN 1 ELSE 0 END, SUM(valor), COUNT(*)
+    FROM {tabela}
+    WHERE usuario_id IS NOT NULL {{filtro}}
+    GROUP BY 1, 2, 3, 4, 5, 6
+    '''
+    for tabela in ('receita', 'despesa')
+)
+
+
+def reconstruir_agregado_categoria(conn, usuario_id=None):
+    """Recalcula agregado_categoria_mes do zero (de um usuário ou de todos).
+
+    Não faz commit: quem chama controla a transação.
+    """
+    if usuario_id is None:
+        conn.execute('DELETE FROM agregado_categoria_mes')
+        conn.execute(
+            'INSERT INTO agregado_categoria_mes '
+            '(usuario_id, tipo, ano_mes, categoria_id, subcategoria_id, pago, total, quantidade) '
+            + _AGREGADO_CATEGORIA_CALCULADO.format(filtro='')
+        )
+    else:
+        conn.execute('DELETE FROM agregado_categoria_mes WHERE usuario_id = ?', (usuario_id,))
+        conn.execute(
+            'INSERT INTO agregado_categoria_mes '
+            '(usuario_id, tipo, ano_mes, categoria_id, subcategoria_id, pago, total, quantidade) '
+            + _AGREGADO_CATEGORIA_CALCULADO.format(filtro='AND usuario_id = ?'),
+            (usuario_id, usuario_id)
+        )
+
+
+def verificar_agregado_categoria(conn, usuario_id=None, tolerancia=0.01):
+    """Compara agregado_categoria_mes com o recálculo a partir dos lançamentos.
+
+    Retorna uma lista de dicts (usuario_id, chave, gravado, esperado) para cada
+    combinação cujo total diverge acima da tolerância, cuja quantidade difere
+    ou que só existe de um dos lados.
+    """
+    filtro = 'AND usuario_id = ?' if usuario_id is not None else ''
+    params = (usuario_id, usuario_id) if usuario_id is not None else ()
+    esperado = {
+        tuple(r[:6]): (r[6], r[7])
+        for r in conn.execute(_AGREGADO_CATEGORIA_CALCULADO.format(filtro=filtro), params)
+    }
+    gravado = conn.execute(
+        'SELECT usuario_id, tipo, ano_mes, categoria_id, subcategoria_id, pago, total, quantidade '
+        'FROM agregado_categoria_mes ' + ('WHERE usuario_id = ?' if usuario_id is not None else ''),
+        params[:1]
+    ).fetchall()
+
+    divergencias = []
+    for row in gravado:
+        chave = tuple(row[:6])
+        total, quantidade = esperado.pop(chave, (0, 0))
+        if abs((row[6] or 0) - total) > tolerancia or row[7] != quantidade:
+            divergencias.append({
+                'usuario_id': row[0], 'chave': chave[1:], 'gravado': row[6], 'esperado': total
+            })
+    for chave, (total, _) in esperado.items():
+        divergencias.append({
+            'usuario_id': chave[0], 'chave': chave[1:], 'gravado': None, 'esperado': total
+        })
+    return divergencias
+
+
+# ---------------------------------------------------------------------------
+# Séries de recorrência
+# ---------------------------------------------------------------------------
+# Cada lançamento recorrente gerado de uma vez (gerar_parcelas_*) pertence a
+# uma serie_recorrencia; despesa/receita apontam para ela em serie_id. Editar
+# ou excluir "esta e as próximas" vira um filtro (serie_id, data_inicio) em
+# vez de comparar categoria/valor/created_at.
+
+def preencher_series_recorrencia(conn):
+    """Agrupa os lançamentos recorrentes existentes em séries (backfill).
+
+    As parcelas de uma série foram inseridas juntas, com ids consecutivos e
+    parcela_atual crescente. Percorrendo em ordem de id, uma série nova começa
+    quando muda o usuário, o tipo de recorrência ou o número de parcelas, quando
+    parcela_atual não cresce ou quando created_at se afasta mais de 120s do
+    início do lote. Não faz commit: quem chama controla a transação.
+    """
+    for tabela, coluna_dia in (('despesa', 'dia_comum_pagamento'), ('receita', 'dia_comum_recebimento')):
+        linhas = conn.execute(f'''
+            SELECT id, usuario_id, tipo_recorrencia, numero_parcelas, parcela_atual,
+                   {coluna_dia} AS dia_comum, data_inicio, created_at,
+                   CAST(strftime('%s', created_at) AS INTEGER) AS criado
+            FROM {tabela}
+            WHERE tipo_recorrencia != 'unica' AND serie_id IS NULL
+            ORDER BY id
+        ''').fetchall()
+
+        series = []
+        for linha in linhas:
+            atual = series[-1] if series else None
+            if (atual is None
+                    or linha['usuario_id'] != atual['usuario_id']
+                    or linha['tipo_recorrencia'] != atual['tipo_recorrencia']
+                    or linha['numero_parcelas'] != atual['numero_parcelas']
+                    or (linha['parcela_atual'] or 0) <= atual['ultima_parcela']
+                    or abs((linha['criado'] or 0) - (atual['criado'] or 0)) > 120):
+                atual = {
+                    'usuario_id': linha['usuario_id'],
+                    'tipo_recorrencia': linha['tipo_recorrencia'],
+                    'numero_parcelas': linha['numero_parcelas'],
+                    'dia_comum': linha['dia_comum'],
+                    'data_inicio': linha['data_inicio'],
+                    'created_at': linha['created_at'],
+                    'criado': linha['criado'],
+                    'ids': [],
+                }
+                series.append(atual)
+            atual['ultima_parcela'] = linha['parcela_atual'] or 0
+            atual['data_fim'] = linha['data_inicio']
+            atual['ids'].append(linha['id'])
+
+        for serie in series:
+            serie_id = conn.execute('''
+                INSERT INTO serie_recorrencia (usuario_id, tabela, tipo_recorrencia, dia_comum, data_inicio, data_fim, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                serie['usuario_id'], tabela, serie['tipo_recorrencia'], serie['dia_comum'],
+                serie['data_inicio'], None if serie['numero_parcelas'] == 'x' else serie['data_fim'],
+                serie['created_at']
+            )).lastrowid
+            conn.executemany(
+                f'UPDATE {tabela} SET serie_id = ? WHERE id = ?',
+                [(serie_id, id_) for id_ in serie['ids']]
+            )
+
+
+def preencher_regras_series(conn):
+    """Copia para cada série a regra da sua ocorrência mais recente (backfill).
+
+    Categoria, valor etc. vêm da última parcela (que já reflete edições "desta
+    em diante"). Séries sem data_fim contam como materializadas até o dia
+    seguinte à última ocorrência existente. Não faz commit.
+    """
+    for tabela, cartao in (('despesa', 'cartao_id'), ('receita', 'NULL')):
+        conn.execute(f'''
+            UPDATE serie_recorrencia
+            SET (categoria_id, subcategoria_id, valor, fixo, cartao_id, ultima_data) = (
+                    SELECT categoria_id, subcategoria_id, valor, fixo, {cartao}, data_inicio
+                    FROM {tabela} WHERE serie_id = serie_recorrencia.id
+                    ORDER BY data_inicio DESC, id DESC LIMIT 1
+                ),
+                ultima_parcela = (SELECT MAX(parcela_atual) FROM {tabela} WHERE serie_id = serie_recorrencia.id)
+            WHERE tabela = ?
+        ''', (tabela,))
+    conn.execute('''
+        UPDATE serie_recorrencia SET materializada_ate = date(ultima_data, '+1 day')
+        WHERE data_fim IS NULL AND ultima_data IS NOT NULL
     ''')
-    
-    # Tabela de cartões de crédito
+
+
+# ---------------------------------------------------------------------------
+# Migrações de esquema
+# ---------------------------------------------------------------------------
+# Cada migração é (versão, descrição, passos). Um passo é um comando SQL ou uma
+# função que recebe a conexão. As migrações são aplicadas em ordem, uma única
+# vez, e a versão aplicada fica registrada na tabela schema_version.
+# Nunca altere uma migração já publicada: crie uma nova versão.
+
+MIGRATIONS = [
+    (1, 'Esquema inicial', [
+        # Tabela de usuários
+        '''
+            CREATE TABLE IF NOT EXISTS usuario (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL UNIQUE,
+                password_hash TEXT NOT NULL,
+                nome_completo TEXT,
+                email TEXT,
+                ativo BOOLEAN DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+        # Tabela de categorias de receitas
+        '''
+            CREATE TABLE IF NOT EXISTS categoria_receita (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nome TEXT NOT NULL,
+                descricao TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                usuario_id INTEGER
+            )
+        ''',
+        # Tabela de subcategorias de receitas
+        '''
+            CREATE TABLE IF NOT EXISTS subcategoria_receita (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nome TEXT NOT NULL,
+                categoria_id INTEGER NOT NULL,
+                descricao TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                usuario_id INTEGER,
+                FOREIGN KEY (categoria_id) REFERENCES categoria_receita (id)
+            )
+        ''',
+        # Tabela de categorias de despesas
+        '''
+            CREATE TABLE IF NOT EXISTS categoria_despesa (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nome TEXT NOT NULL,
+                descricao TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                usuario_id INTEGER
+            )
+        ''',
+        # Tabela de subcategorias de despesas
+        '''
+            CREATE TABLE IF NOT EXISTS subcategoria_despesa (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nome TEXT NOT NULL,
+                categoria_id INTEGER NOT NULL,
+                descricao TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                usuario_id INTEGER,
+                FOREIGN KEY (categoria_id) REFERENCES categoria_despesa (id)
+            )
+        ''',
+        # Tabela de receitas
+        '''
+            CREATE TABLE IF NOT EXISTS receita (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                categoria_id INTEGER NOT NULL,
+                subcategoria_id INTEGER,
+                data_inicio DATE NOT NULL,
+                data_fim DATE,
+                tipo_recorrencia TEXT NOT NULL DEFAULT 'mensal',
+                dia_comum_recebimento INTEGER,
+                valor REAL NOT NULL,
+                numero_parcelas TEXT NOT NULL DEFAULT '1',
+                parcela_atual INTEGER DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                usuario_id INTEGER,
+                fixo BOOLEAN DEFAULT 0,
+                pago BOOLEAN DEFAULT 0,
+                FOREIGN KEY (categoria_id) REFERENCES categoria_receita (id),
+                FOREIGN KEY (subcategoria_id) REFERENCES subcategoria_receita (id)
+            )
+        ''',
+        # Tabela de despesas
+        '''
+            CREATE TABLE IF NOT EXISTS despesa (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                categoria_id INTEGER NOT NULL,
+                subcategoria_id INTEGER,
+                data_inicio DATE NOT NULL,
+                data_fim DATE,
+                tipo_recorrencia TEXT NOT NULL DEFAULT 'mensal',
+                numero_parcelas TEXT NOT NULL DEFAULT '1',
+                parcela_atual INTEGER DEFAULT 1,
+                dia_comum_pagamento INTEGER,
+                valor REAL NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                usuario_id INTEGER,
+                fixo BOOLEAN DEFAULT 0,
+                pago BOOLEAN DEFAULT 0,
+                cartao_id INTEGER,
+                FOREIGN KEY (categoria_id) REFERENCES categoria_despesa (id),
+                FOREIGN KEY (subcategoria_id) REFERENCES subcategoria_despesa (id),
+                FOREIGN KEY (cartao_id) REFERENCES cartao_credito (id)
+            )
+        ''',
+        # Tabela de instituições financeiras
+        '''
+            CREATE TABLE IF NOT EXISTS instituicao_financeira (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nome TEXT NOT NULL UNIQUE,
+                codigo TEXT,
+                logo_url TEXT,
+                ativo BOOLEAN DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+        # Tabela de cartões de crédito
+        '''
+            CREATE TABLE IF NOT EXISTS cartao_credito (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                usuario_id INTEGER NOT NULL,
+                instituicao_id INTEGER NOT NULL,
+                nome_cartao TEXT NOT NULL,
+                ultimos_digitos TEXT NOT NULL,
+                limite_total REAL NOT NULL DEFAULT 0,
+                dia_vencimento INTEGER NOT NULL,
+                dia_fechamento INTEGER NOT NULL,
+                ativo BOOLEAN DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (usuario_id) REFERENCES usuario (id),
+                FOREIGN KEY (instituicao_id) REFERENCES instituicao_financeira (id)
+            )
+        ''',
+    ]),
+    (2, 'Índices compostos para as consultas de despesa/receita', [
+        # Listagens, dashboard e saldo: usuário + intervalo de datas
+        'CREATE INDEX IF NOT EXISTS idx_despesa_usuario_data ON despesa (usuario_id, data_inicio)',
+        'CREATE INDEX IF NOT EXISTS idx_receita_usuario_data ON receita (usuario_id, data_inicio)',
+        # Faturas e limite de cartão: usuário + cartão + vencimento + status
+        'CREATE INDEX IF NOT EXISTS idx_despesa_usuario_cartao ON despesa (usuario_id, cartao_id, data_inicio, pago)',
+        # Filtros e verificações por categoria/subcategoria
+        'CREATE INDEX IF NOT EXISTS idx_despesa_usuario_categoria ON despesa (usuario_id, categoria_id)',
+        'CREATE INDEX IF NOT EXISTS idx_despesa_usuario_subcategoria ON despesa (usuario_id, subcategoria_id)',
+        'CREATE INDEX IF NOT EXISTS idx_receita_usuario_categoria ON receita (usuario_id, categoria_id)',
+        'CREATE INDEX IF NOT EXISTS idx_receita_usuario_subcategoria ON receita (usuario_id, subcategoria_id)',
+        # Lookups de formulários
+        'CREATE INDEX IF NOT EXISTS idx_categoria_receita_usuario_nome ON categoria_receita (usuario_id, nome)',
+        'CREATE INDEX IF NOT EXISTS idx_categoria_despesa_usuario_nome ON categoria_despesa (usuario_id, nome)',
+        'CREATE INDEX IF NOT EXISTS idx_subcategoria_receita_usuario_categoria ON subcategoria_receita (usuario_id, categoria_id, nome)',
+        'CREATE INDEX IF NOT EXISTS idx_subcategoria_despesa_usuario_categoria ON subcategoria_despesa (usuario_id, categoria_id, nome)',
+        'CREATE INDEX IF NOT EXISTS idx_cartao_credito_usuario ON cartao_credito (usuario_id, ativo)',
+        # Índices antigos de coluna única (criados manualmente em produção)
+        # ficam redundantes com os compostos acima
+        'DROP INDEX IF EXISTS idx_despesa_usuario',
+        'DROP INDEX IF EXISTS idx_receita_usuario',
+        'DROP INDEX IF EXISTS idx_subcategoria_receita_usuario',
+        'DROP INDEX IF EXISTS idx_subcategoria_despesa_usuario',
+        'DROP INDEX IF EXISTS idx_categoria_receita_usuario',
+        'DROP INDEX IF EXISTS idx_categoria_despesa_usuario',
+    ]),
+    (3, 'Saldo mensal materializado (saldo_mensal)', [
+        '''
+            CREATE TABLE IF NOT EXISTS saldo_mensal (
+                usuario_id INTEGER NOT NULL,
+                ano_mes TEXT NOT NULL,
+                receitas_pagas REAL NOT NULL DEFAULT 0,
+                despesas_pagas REAL NOT NULL DEFAULT 0,
+                saldo_acumulado REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (usuario_id, ano_mes)
+            ) WITHOUT ROWID
+        ''',
+        *_triggers_saldo_mensal('receita', 'receitas_pagas', 1),
+        *_triggers_saldo_mensal('despesa', 'despesas_pagas', -1),
+        reconstruir_saldo_mensal,
+    ]),
+    (4, 'Séries de recorrência (serie_recorrencia e serie_id)', [
+        '''
+            CREATE TABLE IF NOT EXISTS serie_recorrencia (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                usuario_id INTEGER NOT NULL,
+                tabela TEXT NOT NULL CHECK (tabela IN ('despesa', 'receita')),
+                tipo_recorrencia TEXT NOT NULL,
+                dia_comum INTEGER,
+                data_inicio DATE NOT NULL,
+                data_fim DATE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (usuario_id) REFERENCES usuario (id)
+            )
+        ''',
+        'ALTER TABLE despesa ADD COLUMN serie_id INTEGER REFERENCES serie_recorrencia (id)',
+        'ALTER TABLE receita ADD COLUMN serie_id INTEGER REFERENCES serie_recorrencia (id)',
+        'CREATE INDEX IF NOT EXISTS idx_despesa_serie_data ON despesa (serie_id, data_inicio)',
+        'CREATE INDEX IF NOT EXISTS idx_receita_serie_data ON receita (serie_id, data_inicio)',
+        'CREATE INDEX IF NOT EXISTS idx_serie_recorrencia_usuario ON serie_recorrencia (usuario_id)',
+        preencher_series_recorrencia,
+    ]),
+    (5, 'Regra das séries para materializar recorrências sem data_fim sob demanda', [
+        'ALTER TABLE serie_recorrencia ADD COLUMN categoria_id INTEGER',
+        'ALTER TABLE serie_recorrencia ADD COLUMN subcategoria_id INTEGER',
+        'ALTER TABLE serie_recorrencia ADD COLUMN valor REAL',
+        'ALTER TABLE serie_recorrencia ADD COLUMN fixo BOOLEAN DEFAULT 0',
+        'ALTER TABLE serie_recorrencia ADD COLUMN cartao_id INTEGER',
+        'ALTER TABLE serie_recorrencia ADD COLUMN ultima_data DATE',
+        'ALTER TABLE serie_recorrencia ADD COLUMN ultima_parcela INTEGER',
+        'ALTER TABLE serie_recorrencia ADD COLUMN materializada_ate DATE',
+        preencher_regras_series,
+        '''
+            CREATE INDEX IF NOT EXISTS idx_serie_recorrencia_aberta
+            ON serie_recorrencia (usuario_id, materializada_ate) WHERE data_fim IS NULL
+        ''',
+    ]),
+    (6, 'Limite comprometido por cartão materializado (cartao_uso)', [
+        '''
+            CREATE TABLE IF NOT EXISTS cartao_uso (
+                usuario_id INTEGER NOT NULL,
+                cartao_id INTEGER NOT NULL,
+                parcelado_pendente REAL NOT NULL DEFAULT 0,
+                parcelas_pendentes INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (usuario_id, cartao_id)
+            ) WITHOUT ROWID
+        ''',
+        *_triggers_cartao_uso(),
+        reconstruir_cartao_uso,
+    ]),
+    (7, 'Faturas de cartão (fatura e despesa.fatura_id)', [
+        '''
+            CREATE TABLE IF NOT EXISTS fatura (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                usuario_id INTEGER NOT NULL,
+                instituicao_id INTEGER NOT NULL,
+                referencia TEXT NOT NULL,
+                vencimento DATE NOT NULL,
+                status TEXT NOT NULL DEFAULT 'aberta' CHECK (status IN ('aberta', 'paga')),
+                itens INTEGER NOT NULL DEFAULT 0,
+                total REAL NOT NULL DEFAULT 0,
+                itens_pagos INTEGER NOT NULL DEFAULT 0,
+                total_pago REAL NOT NULL DEFAULT 0,
+                FOREIGN KEY (usuario_id) REFERENCES usuario (id),
+                FOREIGN KEY (instituicao_id) REFERENCES instituicao_financeira (id),
+                UNIQUE (usuario_id, instituicao_id, referencia)
+            )
+        ''',
+        'ALTER TABLE despesa ADD COLUMN fatura_id INTEGER REFERENCES fatura (id)',
+        'CREATE INDEX IF NOT EXISTS idx_despesa_fatura_pago ON despesa (fatura_id, pago)',
+        reconstruir_faturas,
+        *_triggers_fatura(),
+    ]),
+    (8, 'Gerações por usuário para o cache de cadastros (geracao_usuario)', [
+        '''
+            CREATE TABLE IF NOT EXISTS geracao_usuario (
+                usuario_id INTEGER PRIMARY KEY,
+                cadastros INTEGER NOT NULL DEFAULT 0
+            )
+        ''',
+        *_triggers_geracao('categoria_receita', 'cadastros'),
+        *_triggers_geracao('subcategoria_receita', 'cadastros'),
+        *_triggers_geracao('categoria_despesa', 'cadastros'),
+        *_triggers_geracao('subcategoria_despesa', 'cadastros'),
+        *_triggers_geracao('cartao_credito', 'cadastros'),
+    ]),
+    (9, 'Geração de lançamentos por usuário para o cache do dashboard', [
+        'ALTER TABLE geracao_usuario ADD COLUMN lancamentos INTEGER NOT NULL DEFAULT 0',
+        *_triggers_geracao('receita', 'lancamentos'),
+        *_triggers_geracao('despesa', 'lancamentos'),
+    ]),
+    (10, 'Agregado por categoria e mês (agregado_categoria_mes)', [
+        '''
+            CREATE TABLE IF NOT EXISTS agregado_categoria_mes (
+                usuario_id INTEGER NOT NULL,
+                tipo TEXT NOT NULL CHECK (tipo IN ('receita', 'despesa')),
+                ano_mes TEXT NOT NULL,
+                categoria_id INTEGER NOT NULL,
+                subcategoria_id INTEGER NOT NULL DEFAULT 0,
+                pago INTEGER NOT NULL,
+                total REAL NOT NULL DEFAULT 0,
+                quantidade INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (usuario_id, tipo, ano_mes, categoria_id, subcategoria_id, pago)
+            ) WITHOUT ROWID
+        ''',
+        reconstruir_agregado_categoria,
+        *_triggers_agregado_categoria('receita'),
+        *_triggers_agregado_categoria('despesa'),
+    ]),
+    (11, 'Índices de usuário + data cobrindo valor e status (previsão de saldo)', [
+        # Mesmo prefixo dos índices da versão 2, que deixam de ser necessários;
+        # cartao_id logo após a data deixa a soma por dia e cartão sem ordenação
+        'CREATE INDEX IF NOT EXISTS idx_despesa_usuario_data_valor ON despesa (usuario_id, data_inicio, cartao_id, pago, valor)',
+        'CREATE INDEX IF NOT EXISTS idx_receita_usuario_data_valor ON receita (usuario_id, data_inicio, pago, valor)',
+        'DROP INDEX IF EXISTS idx_despesa_usuario_data',
+        'DROP INDEX IF EXISTS idx_receita_usuario_data',
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    """Retorna a versão de esquema aplicada (0 se nunca migrado)"""
+    tabela = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    ).fetchone()
+    if not tabela:
+        return 0
+    return conn.execute('SELECT COALESCE(MAX(versao), 0) FROM schema_version').fetchone()[0]
+
+
+def aplicar_migracoes(conn):
+    """Aplica as migrações pendentes, cada uma em sua própria transação.
+
+    Usa BEGIN IMMEDIATE para que vários workers iniciando juntos não apliquem a
+    mesma migração duas vezes: quem pega o lock aplica, os demais esperam e
+    encontram a versão já registrada. Retorna a lista de versões aplicadas.
+    """
     conn.execute('''
-        CREATE TABLE IF NOT EXISTS cartao_credito (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            usuario_id INTEGER NOT NULL,
-            instituicao_id INTEGER NOT NULL,
-            nome_cartao TEXT NOT NULL,
-            ultimos_digitos TEXT NOT NULL,
-            limite_total REAL NOT NULL DEFAULT 0,
-            dia_vencimento INTEGER NOT NULL,
-            dia_fechamento INTEGER NOT NULL,
-            ativo BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (usuario_id) REFERENCES usuario (id),
-            FOREIGN KEY (instituicao_id) REFERENCES instituicao_financeira (id)
+        CREATE TABLE IF NOT EXISTS schema_version (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT NOT NULL,
+            aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    aplicadas = []
+    for versao, descricao, passos in MIGRATIONS:
+        if versao <= get_schema_version(conn):
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Outro processo pode ter aplicado enquanto esperávamos o lock
+            if versao <= get_schema_version(conn):
+                conn.rollback()
+                continue
+            for passo in passos:
+                if callable(passo):
+                    passo(conn)
+                else:
+                    conn.execute(passo)
+            conn.execute(
+                'INSERT INTO schema_version (versao, descricao) VALUES (?, ?)',
+                (versao, descricao)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        aplicadas.append(versao)
+    if aplicadas:
+        # Atualiza as estatísticas do planejador para os índices novos
+        conn.execute('PRAGMA optimize')
+    return aplicadas
+
+
+# ---------------------------------------------------------------------------
+# Verificação de planos de consulta
+# ---------------------------------------------------------------------------
+# Consultas quentes das rotas. Se alguma delas passar a varrer despesa/receita
+# inteiras (SCAN), a verificação falha: rode após mudar consultas ou índices.
+
+CONSULTAS_CRITICAS = {
+    'despesas.index': '''
+        SELECT d.*, cd.nome as categoria_nome, sd.nome as subcategoria_nome,
+               cc.nome_cartao as cartao_nome, cc.ultimos_digitos as cartao_digitos
+        FROM despesa d
+        JOIN categoria_despesa cd ON d.categoria_id = cd.id
+        LEFT JOIN subcategoria_despesa sd ON d.subcategoria_id = sd.id
+        LEFT JOIN cartao_credito cc ON d.cartao_id = cc.id
+        WHERE d.usuario_id = ? AND d.data_inicio >= ? AND d.data_inicio < ?
+          AND (d.data_inicio, d.id) < (?, ?)
+        ORDER BY d.data_inicio DESC, d.id DESC LIMIT ?
+    ''',
+    'despesas.index_estatisticas': '''
+        SELECT COUNT(*), SUM(d.valor), AVG(d.valor), MAX(d.valor)
+        FROM despesa d
+        JOIN categoria_despesa cd ON d.categoria_id = cd.id
+        WHERE d.usuario_id = ? AND d.data_inicio >= ? AND d.data_inicio < ?
+    ''',
+    'receitas.index': '''
+        SELECT r.*, cr.nome as categoria_nome, sr.nome as subcategoria_nome
+        FROM receita r
+        JOIN categoria_receita cr ON r.categoria_id = cr.id
+        LEFT JOIN subcategoria_receita sr ON r.subcategoria_id = sr.id
+        WHERE r.usuario_id = ? AND r.data_inicio >= ? AND r.data_inicio < ?
+          AND (r.data_inicio, r.id) < (?, ?)
+        ORDER BY r.data_inicio DESC, r.id DESC LIMIT ?
+    ''',
+    'receitas.index_estatisticas': '''
+        SELECT COUNT(*), SUM(r.valor), AVG(r.valor), MAX(r.valor)
+        FROM receita r
+        JOIN categoria_receita cr ON r.categoria_id = cr.id
+        WHERE r.usuario_id = ? AND r.data_inicio >= ? AND r.data_inicio < ?
+    ''',
+    'despesas.atualizar_serie': '''
+        UPDATE despesa SET valor = ?
+        WHERE serie_id = ? AND data_inicio > ? AND usuario_id = ?
+    ''',
+    'despesas.excluir_serie': '''
+        DELETE FROM despesa WHERE serie_id = ? AND data_inicio >= ? AND usuario_id = ?
+    ''',
+    'recorrencias.horizonte': '''
+        SELECT * FROM serie_recorrencia
+        WHERE usuario_id = ? AND data_fim IS NULL AND materializada_ate < ?
+    ''',
+    'dashboard.saldo_anterior': '''
+        SELECT saldo_acumulado FROM saldo_mensal
+        WHERE usuario_id = ? AND ano_mes <= ?
+        ORDER BY ano_mes DESC LIMIT 1
+    ''',
+    'dashboard.receitas_mes': '''
+        SELECT r.*, cr.nome as categoria_nome
+        FROM receita r
+        JOIN categoria_receita cr ON r.categoria_id = cr.id
+        LEFT JOIN subcategoria_receita sr ON r.subcategoria_id = sr.id
+        WHERE r.usuario_id = ? AND r.data_inicio >= ? AND r.data_inicio < ?
+        ORDER BY r.data_inicio DESC
+    ''',
+    'dashboard.totais_por_categoria': '''
+        SELECT 'receita' AS tipo, cr.nome AS nome, SUM(r.valor) AS total
+        FROM receita r
+        JOIN categoria_receita cr ON r.categoria_id = cr.id
+        WHERE r.usuario_id = ? AND r.data_inicio >= ? AND r.data_inicio < ?
+        GROUP BY cr.nome
+        UNION ALL
+        SELECT 'despesa', cd.nome, SUM(d.valor)
+        FROM despesa d
+        JOIN categoria_despesa cd ON d.categoria_id = cd.id
+        WHERE d.usuario_id = ? AND d.data_inicio >= ? AND d.data_inicio < ?
+        GROUP BY cd.nome
+        ORDER BY tipo, total DESC
+    ''',
+    'cartoes.faturas': '''
+        SELECT d.id, d.valor, c.nome_cartao, i.nome as nome_banco, cat.nome as categoria_nome,
+               SUM(d.valor) OVER (PARTITION BY i.nome, c.nome_cartao) as total_cartao
+        FROM despesa d
+        JOIN cartao_credito c ON d.cartao_id = c.id
+        JOIN instituicao_financeira i ON c.instituicao_id = i.id
+        JOIN categoria_despesa cat ON d.categoria_id = cat.id
+        LEFT JOIN subcategoria_despesa sub ON d.subcategoria_id = sub.id
+        WHERE d.usuario_id = ? AND d.data_inicio >= ? AND d.data_inicio < ?
+        ORDER BY d.data_inicio DESC, d.id
+    ''',
+    'cartoes.bloqueado_recorrente': '''
+        SELECT d.cartao_id, SUM(d.valor) as total
+        FROM despesa d
+        JOIN cartao_credito c ON d.cartao_id = c.id
+        WHERE d.usuario_id = ? AND d.pago = 0 AND d.cartao_id IS NOT NULL
+        AND (d.numero_parcelas = '1' OR d.numero_parcelas = 'x' OR d.fixo = 1)
+        AND d.data_inicio >= ? AND d.data_inicio < ?
+        GROUP BY d.cartao_id
+    ''',
+    'cartoes.liberacao': '''
+        SELECT d.cartao_id, substr(d.data_inicio, 1, 7) AS ano_mes, SUM(d.valor) AS liberado, COUNT(*) AS parcelas
+        FROM despesa d
+        WHERE d.usuario_id = ? AND d.data_inicio >= ? AND d.pago = 0 AND d.cartao_id IS NOT NULL
+          AND d.numero_parcelas != '1' AND d.numero_parcelas != 'x' AND d.fixo = 0
+        GROUP BY d.cartao_id, ano_mes
+        ORDER BY d.cartao_id, ano_mes
+    ''',
+    'despesas.pagar_fatura': '''
+        UPDATE despesa SET pago = ? WHERE fatura_id = ? AND pago = ?
+    ''',
+    'despesas.check_fatura': '''
+        SELECT d.valor, d.pago, f.id AS fatura_id, f.referencia, f.itens, f.total, f.itens_pagos, f.total_pago,
+               i.nome as instituicao_nome
+        FROM despesa d
+        JOIN fatura f ON d.fatura_id = f.id
+        JOIN instituicao_financeira i ON f.instituicao_id = i.id
+        WHERE d.id = ? AND d.usuario_id = ?
+    ''',
+    'cartoes.detalhes': '''
+        SELECT d.*, cat.nome as categoria_nome, sub.nome as subcategoria_nome
+        FROM despesa d
+        JOIN categoria_despesa cat ON d.categoria_id = cat.id
+        LEFT JOIN subcategoria_despesa sub ON d.subcategoria_id = sub.id
+        WHERE d.cartao_id = ? AND d.usuario_id = ?
+        ORDER BY d.data_inicio DESC
+    ''',
+    'categorias.uso_categoria': '''
+        SELECT COUNT(*) FROM despesa WHERE categoria_id = ? AND usuario_id = ?
+    ''',
+    'categorias.uso_subcategoria': '''
+        SELECT COUNT(*) FROM receita WHERE subcategoria_id = ? AND usuario_id = ?
+    ''',
+    'previsao.lancamentos': '''
+        SELECT 1 AS sinal, r.data_inicio, SUM(r.valor) AS valor, NULL AS dia_vencimento
+        FROM receita r
+        WHERE r.usuario_id = ? AND r.data_inicio >= ? AND r.data_inicio < ?
+          AND (r.pago = 0 OR r.data_inicio >= ?)
+        GROUP BY r.data_inicio
+        UNION ALL
+        SELECT -1, g.data_inicio, g.valor, c.dia_vencimento
+        FROM (
+            SELECT d.data_inicio, d.cartao_id, SUM(d.valor) AS valor
+            FROM despesa d
+            WHERE d.usuario_id = ? AND d.data_inicio >= ? AND d.data_inicio < ?
+              AND (d.pago = 0 OR d.data_inicio >= ?)
+            GROUP BY d.data_inicio, d.cartao_id
+        ) g
+        LEFT JOIN cartao_credito c ON c.id = g.cartao_id
+    ''',
+    'simulacao.totais_cartao': '''
+        SELECT substr(d.data_inicio, 1, 7) AS ano_mes,
+               SUM(CASE WHEN d.numero_parcelas != '1' AND d.numero_parcelas != 'x' AND d.fixo = 0
+                        THEN d.valor ELSE 0 END) AS parcelado_pendente,
+               SUM(CASE WHEN d.numero_parcelas = '1' OR d.numero_parcelas = 'x' OR d.fixo = 1
+                        THEN d.valor ELSE 0 END) AS recorrente_pendente
+        FROM despesa d
+        WHERE d.usuario_id = ? AND d.cartao_id = ? AND d.pago = 0
+          AND d.data_inicio >= ? AND d.data_inicio < ?
+        GROUP BY 1
+    ''',
+}
+
+TABELAS_VIGIADAS = ('despesa', 'receita')
+
+
+def verificar_planos_consulta(conn, consultas=None):
+    """Roda EXPLAIN QUERY PLAN nas consultas críticas.
+
+    Retorna uma lista de (nome, detalhe) para cada passo que varre uma das
+    TABELAS_VIGIADAS em vez de buscá-la por índice. Lista vazia = tudo certo.
+    """
+    consultas = consultas or CONSULTAS_CRITICAS
+    aliases = {}
+    for nome, sql in consultas.items():
+        # Mapeia alias -> tabela (ex: "despesa d") para interpretar o plano
+        tokens = sql.replace(',', ' ').split()
+        for i, token in enumerate(tokens[:-1]):
+            if token in TABELAS_VIGIADAS:
+                aliases[tokens[i + 1]] = token
+    problemas = []
+    for nome, sql in consultas.items():
+        params = [1] * sql.count('?')
+        for linha in conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall():
+            detalhe = linha[3]
+            if not detalhe.startswith('SCAN '):
+                continue
+            alvo = detalhe.split()[1]
+            if alvo in TABELAS_VIGIADAS or aliases.get(alvo) in TABELAS_VIGIADAS:
+                problemas.append((nome, detalhe))
+    return problemas
+
+
+def init_db():
+    """Inicializa o banco de dados aplicando as migrações pendentes.
+
+    É o `flask db upgrade`: roda uma vez por deploy (entrypoint.sh), antes de
+    subir os workers, que só conferem a versão (app.database.conferir_esquema).
+    Retorna a lista de versões aplicadas.
+    """
+    # Define o caminho do banco de dados
+    DATABASE = os.environ.get('DB_PATH', 'financas.db')
+    
+    # Garante que o diretório do banco de dados existe
+    db_dir = os.path.dirname(os.path.abspath(DATABASE))
+    if db_dir and not os.path.exists(db_dir):
+        os.makedirs(db_dir, exist_ok=True)
+    
+    conn = sqlite3.connect(DATABASE)
+    conn.row_factory = sqlite3.Row
     
-    # Inserir dados iniciais se não existirem
+    aplicadas = aplicar_migracoes(conn)
+    inserir_dados_iniciais(conn)
+    conn.close()
+    return aplicadas
+
+
+def inserir_dados_iniciais(conn):
+    """Insere categorias e instituições padrão nas tabelas ainda vazias"""
     cursor = conn.cursor()
     
     # Verificar se já existem categorias de receita
@@ -217,8 +1389,97 @@ def init_db():
             )
     
     conn.commit()
-    conn.close()
 
 if __name__ == '__main__':
-    init_db()
-    print("Banco de dados inicializado com sucesso!")
\ No newline at end of file
+    if '--reconstruir-saldos' in sys.argv:
+        init_db()
+        conn = sqlite3.connect(os.environ.get('DB_PATH', 'financas.db'))
+        reconstruir_saldo_mensal(conn)
+        conn.commit()
+        conn.close()
+        print("✅ Saldo mensal reconstruído")
+    elif '--verificar-saldos' in sys.argv:
+        # Falha (exit 1) se saldo_mensal divergir dos lançamentos pagos
+        init_db()
+        conn = sqlite3.connect(os.environ.get('DB_PATH', 'financas.db'))
+        divergencias = verificar_saldo_mensal(conn)
+        conn.close()
+        for d in divergencias[:50]:
+            print(f"❌ usuário {d['usuario_id']} {d['ano_mes']} {d['campo']}: gravado={d['gravado']} esperado={d['esperado']}")
+        if divergencias:
+            print(f"{len(divergencias)} divergência(s). Rode: python init_db.py --reconstruir-saldos")
+            sys.exit(1)
+        print("✅ Saldo mensal consistente")
+    elif '--reconciliar-limites' in sys.argv:
+        # Corrige cartao_uso dos usuários cujo limite comprometido divergiu das despesas
+        init_db()
+        conn = sqlite3.connect(os.environ.get('DB_PATH', 'financas.db'))
+        divergencias = reconciliar_cartao_uso(conn)
+        conn.commit()
+        conn.close()
+        for d in divergencias[:50]:
+            print(f"⚠️ usuário {d['usuario_id']} cartão {d['cartao_id']}: gravado={d['gravado']} esperado={d['esperado']}")
+        if divergencias:
+            print(f"{len(divergencias)} divergência(s) corrigida(s) em cartao_uso")
+        else:
+            print("✅ Limite comprometido dos cartões consistente")
+    elif '--reconstruir-faturas' in sys.argv:
+        init_db()
+        conn = sqlite3.connect(os.environ.get('DB_PATH', 'financas.db'))
+        reconstruir_faturas(conn)
+        conn.commit()
+        conn.close()
+        print("✅ Faturas reconstruídas")
+    elif '--verificar-faturas' in sys.argv:
+        # Falha (exit 1) se os totais/vínculos das faturas divergirem das despesas
+        init_db()
+        conn = sqlite3.connect(os.environ.get('DB_PATH', 'financas.db'))
+        divergencias = verificar_faturas(conn)
+        conn.close()
+        for d in divergencias[:50]:
+            print(f"❌ usuário {d['usuario_id']} instituição {d['instituicao_id']} {d['referencia']} {d['campo']}: gravado={d['gravado']} esperado={d['esperado']}")
+        if divergencias:
+            print(f"{len(divergencias)} divergência(s). Rode: python init_db.py --reconstruir-faturas")
+            sys.exit(1)
+        print("✅ Faturas consistentes")
+    elif '--reconstruir-agregados' in sys.argv:
+        init_db()
+        conn = sqlite3.connect(os.environ.get('DB_PATH', 'financas.db'))
+        reconstruir_agregado_categoria(conn)
+        conn.commit()
+        conn.close()
+        print("✅ Agregado por categoria e mês reconstruído")
+    elif '--verificar-agregados' in sys.argv:
+        # Falha (exit 1) se agregado_categoria_mes divergir dos lançamentos
+        init_db()
+        conn = sqlite3.connect(os.environ.get('DB_PATH', 'financas.db'))
+        divergencias = verificar_agregado_categoria(conn)
+        conn.close()
+        for d in divergencias[:50]:
+            print(f"❌ usuário {d['usuario_id']} {d['chave']}: gravado={d['gravado']} esperado={d['esperado']}")
+        if divergencias:
+            print(f"{len(divergencias)} divergência(s). Rode: python init_db.py --reconstruir-agregados")
+            sys.exit(1)
+        print("✅ Agregado por categoria e mês consistente")
+    elif '--verificar-planos' in sys.argv:
+        # Falha (exit 1) se alguma consulta crítica varrer despesa/receita
+        init_db()
+        conn = sqlite3.connect(os.environ.get('DB_PATH', 'financas.db'))
+        problemas = verificar_planos_consulta(conn)
+        conn.close()
+        for nome, detalhe in problemas:
+            print(f"❌ {nome}: {detalhe}")
+        if problemas:
+            sys.exit(1)
+        print("✅ Todas as consultas críticas usam índices")
+    elif '--estender-recorrencias' in sys.argv:
+        # Materializa as recorrências sem data_fim até o horizonte padrão (para agendar no cron)
+        init_db()
+        from app.database import estender_recorrencias
+        criadas = estender_recorrencias()
+        print(f"✅ {criadas} ocorrência(s) de recorrências materializadas")
+    else:
+        aplicadas = init_db()
+        if aplicadas:
+            print(f"Migrações aplicadas: {', '.join(map(str, aplicadas))}")
+        print(f"Banco de dados inicializado com sucesso! (esquema v{SCHEMA_VERSION})")
\ No newline at end of file